@@ -0,0 +1,380 @@
+"""
+Autocomplete index.
+
+Type-ahead lookups are answered from an in-memory index of term labels,
+synonyms and codes rather than a full-text search per keystroke. Every query
+word is matched as a prefix of a word of the term ("abn nerv" matches
+"Abnormality of the nervous system"). A word with no match, of at least
+MIN_TYPO_LENGTH characters, is matched within one edit (a typo: a letter
+missing, extra, wrong or two letters swapped) instead. Results are ranked by
+the order of the ontology_list, then by how well they match.
+
+The index is filled from the local ontology store (see `dragon_search index`
+and `dragon_search mirror`) as each ontology is first asked for, and learns
+the terms returned by searches run in the same process. autocomplete only
+calls the apis when the index has nothing for the query.
+
+    dragon_search autocomplete "seizur" -o HP,MONDO
+
+or POST /autocomplete on the search server.
+"""
+
+import argparse
+import bisect
+import heapq
+import re
+import threading
+from operator import itemgetter
+
+from rich.console import Console
+from rich.table import Table
+
+from search_dragon import logger as getlogger
+from search_dragon import search as dragon_search
+from search_dragon.local_store import get_local_store
+from search_dragon.support import ftd_ontology_lookup
+
+DEFAULT_LIMIT = 10
+MIN_TYPO_LENGTH = 4  # shorter words are too ambiguous to correct
+WORD_LIMIT = 5000  # indexed words a query word expands to
+MAX_LEARNED = 100000  # terms learned from search results
+INSORT_LIMIT = 64  # new words inserted one by one, beyond it they are sorted in
+
+TYPO_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+_word = re.compile(r"[a-z0-9]+")
+
+
+def words(text):
+    return _word.findall((text or "").lower())
+
+
+def edits(word):
+    """
+    The strings one edit away from word that keep its first letter. Typos in
+    the first letter are rare, and inserting at the end only narrows a
+    prefix that already matched nothing.
+    """
+    variants = set()
+    for i in range(1, len(word)):
+        left, right = word[:i], word[i:]
+        variants.add(left + right[1:])
+        if len(right) > 1:
+            variants.add(left + right[1] + right[0] + right[2:])
+        for letter in TYPO_ALPHABET:
+            variants.add(left + letter + right[1:])
+            variants.add(left + letter + right)
+    variants.discard(word)
+    return variants
+
+
+def _union(postings, matched_words):
+    numbers = set()
+    for word in matched_words:
+        numbers.update(postings.get(word, ()))
+    return numbers
+
+
+class AutocompleteIndex:
+    """
+    Terms are found through postings (word => term numbers) of every word
+    and of label words only, and ranked over every match: by the order of
+    the ontology_list, then labels starting with the query, then labels with
+    every query word, then the rest, then by label length.
+    """
+
+    def __init__(self):
+        self.terms = []  # term number => record
+        self.keys = {}  # code_iri (or code) => term number
+        self.postings = {}  # word => term numbers
+        self.label_postings = {}  # label word => term numbers
+        self.prefix_terms = {}  # ontology prefix => term numbers
+        self.rank_keys = []  # term number => (len(label), label, number)
+        self.sorted_words = []
+        self.sorted_labels = []  # (label words joined by " ", term number)
+        self.new_words = []
+        self.new_labels = []
+        self.learned = 0
+        self.loaded_prefixes = set()
+        self.store_prefixes = (None, [])  # (store file stat, prefixes)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add(self, record, synonyms=()):
+        """
+        Add a harmonized record, with its synonyms. Returns False if the term
+        is already in the index.
+        """
+        key = record.get("code_iri") or record.get("code")
+        display = record.get("display")
+        if not key or not display:
+            return False
+        label = display.lower()
+        label_words = tuple(words(label))
+        all_words = frozenset(
+            label_words
+            + tuple(w for synonym in synonyms for w in words(synonym))
+            + tuple(words(record.get("code")))
+        )
+        prefix = (record.get("ontology_prefix") or "").upper()
+        with self.lock:
+            if key in self.keys:
+                return False
+            number = self.keys[key] = len(self.terms)
+            self.terms.append(record)
+            self.rank_keys.append((len(label), label, number))
+            self.prefix_terms.setdefault(prefix, set()).add(number)
+            self.new_labels.append((" ".join(label_words), number))
+            for word in all_words:
+                postings = self.postings.get(word)
+                if postings is None:
+                    postings = self.postings[word] = []
+                    self.new_words.append(word)
+                postings.append(number)
+            for word in set(label_words):
+                self.label_postings.setdefault(word, []).append(number)
+        return True
+
+    def learn(self, records):
+        """Add the records returned by a search, up to MAX_LEARNED in all."""
+        with self.lock:
+            for record in records:
+                if self.learned >= MAX_LEARNED:
+                    return
+                self.learned += self.add(record)
+
+    def load_store(self, ontology_data, prefixes=None, store=None):
+        """
+        Add the terms of the local ontology store, for the prefixes (default
+        all) that haven't been loaded yet.
+        """
+        store = store or get_local_store()
+        if not store.db_path.exists():
+            return 0
+        with self.lock:
+            if prefixes is None:
+                prefixes = self._store_prefixes(store)
+            wanted = [p for p in prefixes if p.upper() not in self.loaded_prefixes]
+            if not wanted:
+                return 0
+            added = 0
+            for term in store.terms(wanted):
+                record = {
+                    "code": term["curie"],
+                    "system": ontology_data.get(term["ontology_prefix"], ""),
+                    "code_iri": term["iri"],
+                    "display": term["label"],
+                    "description": term["description"],
+                    "ontology_prefix": term["ontology_prefix"],
+                }
+                added += self.add(record, term["synonyms"])
+            self.loaded_prefixes.update(p.upper() for p in wanted)
+        getlogger().debug(f"Added {added} terms of {wanted} to the autocomplete index")
+        return added
+
+    def _store_prefixes(self, store):
+        """The prefixes in the store, looked up again only when its file changes."""
+        stat = store.db_path.stat()
+        version = (str(store.db_path), stat.st_mtime_ns, stat.st_size)
+        if self.store_prefixes[0] != version:
+            self.store_prefixes = (version, store.prefixes())
+        return self.store_prefixes[1]
+
+    def _sort_new(self):
+        """Add the words and labels added since the last query to the sorted lists."""
+        for new, ordered in (
+            (self.new_words, self.sorted_words),
+            (self.new_labels, self.sorted_labels),
+        ):
+            if len(new) <= INSORT_LIMIT:
+                for item in new:
+                    bisect.insort(ordered, item)
+            else:
+                # Sorting a sorted list with a sorted run appended is a merge
+                ordered.extend(sorted(new))
+                ordered.sort()
+            new.clear()
+
+    def _words_from(self, prefix, limit=None):
+        """The indexed words starting with prefix, in order."""
+        start = bisect.bisect_left(self.sorted_words, prefix)
+        end = bisect.bisect_left(self.sorted_words, prefix + "\uffff", start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.sorted_words[start:end]
+
+    def _typo_words(self, word):
+        sorted_words = self.sorted_words
+        count = len(sorted_words)
+        matched = set()
+        for variant in edits(word):
+            start = bisect.bisect_left(sorted_words, variant)
+            # Most variants aren't the start of any word
+            if start < count and sorted_words[start].startswith(variant):
+                matched.update(self._words_from(variant, WORD_LIMIT))
+        return matched
+
+    def _label_prefixed(self, text):
+        """The terms whose label words, joined by spaces, start with text."""
+        start = bisect.bisect_left(self.sorted_labels, (text,))
+        end = bisect.bisect_left(self.sorted_labels, (text + "\uffff",), start)
+        return set(map(itemgetter(1), self.sorted_labels[start:end]))
+
+    def complete(self, query, ontology_list=None, limit=DEFAULT_LIMIT):
+        """
+        Returns:
+            list: Up to limit records matching query, best first.
+        """
+        query_words = words(query)
+        if not query_words or limit <= 0:
+            return []
+
+        with self.lock:
+            self._sort_new()
+
+            # Each query word is matched by the indexed words it starts, or
+            # failing those, by those within an edit of it
+            matched_words = []
+            for word in query_words:
+                matched = self._words_from(word, WORD_LIMIT)
+                if not matched and len(word) >= MIN_TYPO_LENGTH:
+                    matched = self._typo_words(word)
+                if not matched:
+                    return []
+                matched_words.append(matched)
+
+            matches = sorted(
+                (_union(self.postings, matched) for matched in matched_words), key=len
+            )
+            candidates = matches[0].intersection(*matches[1:])
+            if not candidates:
+                return []
+            label_matches = [
+                _union(self.label_postings, matched) for matched in matched_words
+            ]
+            in_label = candidates.intersection(*label_matches)
+            label_prefixed = in_label & self._label_prefixed(" ".join(query_words))
+
+            if ontology_list:
+                preferred = dict.fromkeys(o.upper() for o in ontology_list)
+                buckets = [candidates & self.prefix_terms.get(o, set()) for o in preferred]
+            else:
+                buckets = [candidates]
+
+            # Buckets in rank order, each ranked by label length
+            found = []
+            for bucket in buckets:
+                if len(found) == limit:
+                    break
+                for numbers in (
+                    bucket & label_prefixed,
+                    (bucket & in_label) - label_prefixed,
+                    bucket - in_label,
+                ):
+                    wanted = limit - len(found)
+                    if not wanted:
+                        break
+                    found.extend(
+                        heapq.nsmallest(
+                            wanted, numbers, key=self.rank_keys.__getitem__
+                        )
+                    )
+            return [self.terms[number] for number in found]
+
+
+def autocomplete(
+    ontology_data,
+    query,
+    ontology_list=None,
+    search_api_list=None,
+    limit=DEFAULT_LIMIT,
+):
+    """
+    Complete query from the autocomplete index, searching the apis only when
+    the index has no match.
+
+    Returns:
+        dict: results, results_count, and source ("index" or "search").
+    """
+    index = get_autocomplete_index()
+    index.load_store(ontology_data, ontology_list or None)
+    results = index.complete(query, ontology_list, limit)
+    if results:
+        return {"results": results, "results_count": len(results), "source": "index"}
+
+    response = dragon_search.run_search(
+        ontology_data,
+        query,
+        ontology_list or [],
+        search_api_list or ["ols"],
+        limit,
+        0,
+    )
+    return {
+        "results": response["results"],
+        "results_count": response["results_count"],
+        "source": "search",
+    }
+
+
+_autocomplete_index = None
+_index_lock = threading.Lock()
+
+
+def get_autocomplete_index():
+    """Establish a singleton autocomplete index that can be reused by multiple components."""
+    global _autocomplete_index
+    with _index_lock:
+        if _autocomplete_index is None:
+            _autocomplete_index = AutocompleteIndex()
+    return _autocomplete_index
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search autocomplete",
+        description="Complete a partly typed term from the local index, or the apis.",
+    )
+    parser.add_argument("query", help="The text typed so far")
+    parser.add_argument(
+        "-o",
+        "--ontologies",
+        required=False,
+        default=None,
+        help="The ontology prefixes to complete from, most preferred first. Delimeter ,",
+    )
+    parser.add_argument(
+        "--search_api",
+        required=False,
+        default="ols",
+        help="The api searched when the index has no match. Delimeter ,",
+    )
+    parser.add_argument(
+        "-l",
+        "--limit",
+        required=False,
+        type=int,
+        default=DEFAULT_LIMIT,
+        help="How many completions to return",
+    )
+    args = parser.parse_args(args)
+
+    ontology_list = (
+        [o.strip() for o in args.ontologies.split(",")] if args.ontologies else None
+    )
+    response = autocomplete(
+        ftd_ontology_lookup(),
+        args.query,
+        ontology_list,
+        args.search_api.split(","),
+        args.limit,
+    )
+
+    table = Table(title=f"Completions ({response['source']})", expand=True)
+    table.add_column("Code", style="magenta")
+    table.add_column("Display", justify="left")
+    table.add_column("system", justify="left")
+    for record in response["results"]:
+        table.add_row(record.get("code"), record.get("display"), record.get("system"))
+    Console().print(table)
@@ -0,0 +1,364 @@
+"""
+Micro-benchmarks.
+
+Times the pure Python stages of a search (harmonize_data of each api,
+remove_duplicates, merge_results, validate_data, get_code_counts,
+generate_response and clean_url, and columnar harmonization when pyarrow is
+installed) on synthetic payloads shaped like the OLS
+search (v1), OLS v2, OLS descendants and UMLS responses, without any
+requests. Each stage reports calls and records per second (best of
+--repeat runs) and the peak memory allocated while it runs.
+
+    dragon_search benchmark --sizes 1000,100000 --save baseline.json
+    dragon_search benchmark --sizes 1000,100000 --baseline baseline.json
+
+With --baseline, a stage whose throughput fell, or whose peak memory grew, by
+more than --threshold (default 0.2, i.e. 20%) is reported as a regression and
+the command exits with status 1. Baselines are only comparable on the same
+machine, so save one per machine (or CI runner).
+"""
+
+import argparse
+import gc
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+from search_dragon import columnar
+from search_dragon import logger as getlogger
+from search_dragon.external_apis.ols_api import OLSSearchAPI
+from search_dragon.external_apis.ols_code_api import OLSSearchAPICode
+from search_dragon.external_apis.ols_descendants_api import OLSDescendantsAPI
+from search_dragon.external_apis.umls_api import UMLSSearchAPI
+from search_dragon.result_structure import (
+    clean_url,
+    generate_response,
+    get_code_counts,
+    merge_results,
+    validate_data,
+)
+from search_dragon.support import ftd_ontology_lookup
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.2
+
+OLS_PREFIXES = ("HP", "MONDO", "MAXO", "NCIT", "EFO")
+UMLS_SOURCES = ("MSH", "SNOMEDCT_US", "OMIM", "MDR", "MTH")  # MTH has no system
+DUPLICATE_RATE = 0.05  # share of records repeating an earlier IRI
+
+
+def _code(prefix, i):
+    return f"{prefix}:{i:07d}"
+
+
+def _iri(prefix, i):
+    return f"http://purl.obolibrary.org/obo/{prefix}_{i:07d}"
+
+
+def _numbers(size, rng):
+    """Record numbers with DUPLICATE_RATE repeats of earlier ones."""
+    numbers = list(range(size))
+    if size > 1:
+        for position in rng.sample(range(1, size), int(size * DUPLICATE_RATE)):
+            numbers[position] = rng.randrange(position)
+    return numbers
+
+
+def ols_docs(size, seed=0):
+    """Docs of an OLS search (v1) response."""
+    rng = random.Random(seed)
+    docs = []
+    for i in _numbers(size, rng):
+        prefix = OLS_PREFIXES[i % len(OLS_PREFIXES)]
+        docs.append(
+            {
+                "id": f"{prefix.lower()}:class:{i}",
+                "iri": _iri(prefix, i),
+                "short_form": f"{prefix}_{i:07d}",
+                "obo_id": _code(prefix, i),
+                "label": f"Abnormality of structure {i}",
+                "description": [f"A structural anomaly of type {i} in the body."],
+                "ontology_name": prefix.lower(),
+                "ontology_prefix": prefix,
+                "type": "class",
+            }
+        )
+    return docs
+
+
+def ols2_elements(size, seed=0):
+    """Elements of an OLS v2 entity search response."""
+    rng = random.Random(seed)
+    elements = []
+    for i in _numbers(size, rng):
+        prefix = OLS_PREFIXES[i % len(OLS_PREFIXES)]
+        elements.append(
+            {
+                "iri": _iri(prefix, i),
+                "curie": _code(prefix, i),
+                "label": [f"Abnormality of structure {i}"],
+                "definedBy": [prefix.lower()],
+                "ontologyId": prefix.lower(),
+                "description": [f"A structural anomaly of type {i} in the body."],
+                "type": ["class", "entity"],
+            }
+        )
+    return elements
+
+
+def ols_terms(size, seed=0):
+    """Terms of an OLS descendants response, with some EDAM style sub-ontology codes."""
+    rng = random.Random(seed)
+    terms = []
+    for i in _numbers(size, rng):
+        if i % 50 == 0:
+            terms.append(
+                {
+                    "iri": f"http://edamontology.org/data_{i}",
+                    "obo_id": f"EDAM_data:{i}",
+                    "label": f"Data type {i}",
+                    "description": [f"Data of type {i}."],
+                    "ontology_prefix": "EDAM",
+                    "has_children": False,
+                }
+            )
+            continue
+        terms.append(
+            {
+                "iri": _iri("HP", i),
+                "obo_id": _code("HP", i),
+                "label": f"Abnormality of structure {i}",
+                "description": [f"A structural anomaly of type {i} in the body."],
+                "ontology_prefix": "HP",
+                "has_children": i % 4 == 0,
+            }
+        )
+    return terms
+
+
+def umls_results(size, seed=0):
+    """Results of a UMLS search response."""
+    rng = random.Random(seed)
+    return [
+        {
+            "ui": f"C{i:07d}",
+            "rootSource": UMLS_SOURCES[i % len(UMLS_SOURCES)],
+            "uri": f"https://uts-ws.nlm.nih.gov/rest/content/2024AB/CUI/C{i:07d}",
+            "name": f"Abnormality of structure {i}",
+        }
+        for i in _numbers(size, rng)
+    ]
+
+
+def search_urls(size):
+    return [
+        f"https://uts-ws.nlm.nih.gov/rest/search/current?string=term{i}"
+        f"&apiKey=0123456789abcdef{i}&pageNumber=1&pageSize=25"
+        for i in range(size)
+    ]
+
+
+def stages(size, ontology_data):
+    """
+    The benchmarked stages for payloads of size records.
+
+    Returns:
+        dict: name => callable running the stage once.
+    """
+    ols = OLSSearchAPI()
+    ols2 = OLSSearchAPICode()
+    olsd = OLSDescendantsAPI()
+    umls = UMLSSearchAPI()
+    docs = ols_docs(size)
+    elements = ols2_elements(size, seed=1)
+    terms = ols_terms(size, seed=2)
+    results = umls_results(size, seed=3)
+    urls = search_urls(size)
+
+    harmonized = ols.harmonize_data(docs, ontology_data)
+    deduplicated = ols.remove_duplicates(harmonized)
+    harmonized2 = ols2.remove_duplicates(ols2.harmonize_data(elements, ontology_data))
+    url = urls[0]
+
+    benchmarks = {
+        "harmonize_ols": lambda: ols.harmonize_data(docs, ontology_data),
+        "harmonize_ols2": lambda: ols2.harmonize_data(elements, ontology_data),
+        "harmonize_olsd": lambda: olsd.harmonize_data(terms, ontology_data),
+        "harmonize_umls": lambda: umls.harmonize_data(results, ontology_data),
+        "remove_duplicates": lambda: ols.remove_duplicates(harmonized),
+        "merge_results": lambda: merge_results([deduplicated, harmonized2]),
+        "validate_data": lambda: validate_data(deduplicated),
+        "get_code_counts": lambda: get_code_counts(deduplicated),
+        "generate_response": lambda: generate_response(
+            [deduplicated, harmonized2], url, False, [ols, ols2]
+        ),
+        "clean_url": lambda: [clean_url(u) for u in urls],
+    }
+    if columnar.available():
+        # The same records as harmonize_olsd, deduplicated and validated
+        benchmarks["harmonize_olsd_columnar"] = lambda: columnar.harmonize_terms(
+            terms, ontology_data
+        )
+    return benchmarks
+
+
+def measure(run, size, repeat=DEFAULT_REPEAT):
+    """
+    Time run, best of repeat, then measure the peak memory of one more run.
+
+    Returns:
+        dict: seconds, ops_per_second, records_per_second and peak_bytes.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    seconds = min(timings)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "ops_per_second": 1 / seconds if seconds else float("inf"),
+        "records_per_second": size / seconds if seconds else float("inf"),
+        "peak_bytes": peak_bytes,
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=DEFAULT_REPEAT, only=None):
+    """
+    Returns:
+        dict: "stage/size" => the measurements of measure.
+    """
+    ontology_data = ftd_ontology_lookup()
+    results = {}
+    for size in sizes:
+        for name, run in stages(size, ontology_data).items():
+            if only and name not in only:
+                continue
+            results[f"{name}/{size}"] = measure(run, size, repeat)
+    return results
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results with a baseline from an earlier run.
+
+    Returns:
+        list: (key, message) for each stage that slowed down, or used more
+        memory, by more than threshold.
+    """
+    found = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        speed = result["records_per_second"] / before["records_per_second"]
+        if speed < 1 - threshold:
+            found.append((key, f"{(1 - speed):.0%} slower"))
+        memory = before["peak_bytes"] and result["peak_bytes"] / before["peak_bytes"]
+        if memory and memory > 1 + threshold:
+            found.append((key, f"{(memory - 1):.0%} more peak memory"))
+    return found
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search benchmark",
+        description="Benchmark harmonization and curation on synthetic payloads.",
+    )
+    parser.add_argument(
+        "--sizes",
+        required=False,
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="Payload sizes in records, e.g. 1000,100000,1000000. Delimeter ,",
+    )
+    parser.add_argument(
+        "--repeat",
+        required=False,
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="Runs of each stage, the fastest is reported",
+    )
+    parser.add_argument(
+        "--stages",
+        required=False,
+        default=None,
+        help="Only run these stages. Delimeter ,",
+    )
+    parser.add_argument(
+        "--save",
+        required=False,
+        default=None,
+        help="Write the results to this file, to use as a baseline",
+    )
+    parser.add_argument(
+        "--baseline",
+        required=False,
+        default=None,
+        help="Compare with the results saved in this file",
+    )
+    parser.add_argument(
+        "--threshold",
+        required=False,
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Slowdown (or memory growth) beyond which a stage has regressed, e.g. 0.2 for 20%%",
+    )
+    args = parser.parse_args(args)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    only = [s.strip() for s in args.stages.split(",")] if args.stages else None
+    # Harmonizing and merging log per call, which would be timed too
+    getlogger().setLevel(logging.WARNING)
+
+    results = run_benchmarks(sizes, args.repeat, only)
+
+    table = Table(title="search-dragon benchmarks", expand=True)
+    table.add_column("Stage", style="magenta")
+    table.add_column("Records", justify="right")
+    table.add_column("ms", justify="right")
+    table.add_column("ops/s", justify="right")
+    table.add_column("records/s", justify="right")
+    table.add_column("peak KiB", justify="right")
+    for key, result in results.items():
+        name, size = key.rsplit("/", 1)
+        table.add_row(
+            name,
+            size,
+            f"{result['seconds'] * 1000:.2f}",
+            f"{result['ops_per_second']:,.1f}",
+            f"{result['records_per_second']:,.0f}",
+            f"{result['peak_bytes'] / 1024:,.0f}",
+        )
+    console = Console()
+    console.print(table)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        console.print(f"Saved the results to {args.save}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        found = regressions(results, baseline, args.threshold)
+        for key, message in found:
+            console.print(f"[red]Regression[/red] {key}: {message}")
+        if found:
+            sys.exit(1)
+        console.print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
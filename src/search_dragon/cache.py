@@ -0,0 +1,219 @@
+"""
+Result cache.
+
+Holds the upstream results of each API request, keyed by the normalized query
+(see search_dragon.normalize.query_key). Entries expire after a TTL and the
+least recently used entries are evicted beyond a maximum size. Concurrent
+requests for the same key are coalesced so only one of them goes upstream.
+
+Expired entries are kept for a further staleness window. Within it,
+get_or_revalidate returns the stale value at once and refreshes it in the
+background (stale-while-revalidate), so a slow upstream doesn't hold up
+callers that have a recent answer. A stale entry whose refresh fails keeps
+being served until the window ends.
+
+The defaults can be changed with the `SEARCH_DRAGON_CACHE_TTL` (seconds),
+`SEARCH_DRAGON_CACHE_STALE_TTL` (seconds after expiry) and
+`SEARCH_DRAGON_CACHE_SIZE` (entries) environment variables. A TTL of 0
+disables caching, a stale TTL of 0 disables serving stale entries.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from search_dragon import logger as getlogger
+
+CACHE_TTL_ENV = "SEARCH_DRAGON_CACHE_TTL"
+CACHE_STALE_TTL_ENV = "SEARCH_DRAGON_CACHE_STALE_TTL"
+CACHE_SIZE_ENV = "SEARCH_DRAGON_CACHE_SIZE"
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_CACHE_STALE_TTL = 600
+DEFAULT_CACHE_SIZE = 4096
+REFRESH_WORKERS = 4  # background refreshes running at once
+
+MISSING = object()
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    def __init__(self, ttl=None, max_entries=None, stale_ttl=None):
+        if ttl is None:
+            ttl = float(os.getenv(CACHE_TTL_ENV) or DEFAULT_CACHE_TTL)
+        if max_entries is None:
+            max_entries = int(os.getenv(CACHE_SIZE_ENV) or DEFAULT_CACHE_SIZE)
+        if stale_ttl is None:
+            stale_ttl = float(os.getenv(CACHE_STALE_TTL_ENV) or DEFAULT_CACHE_STALE_TTL)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key => (expires_at, value)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self._refresh_executor = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """
+        Returns:
+            Tuple:
+                - value: The cached value, or MISSING if absent or expired
+                  beyond the staleness window.
+                - stale (bool): Whether the value has expired.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING, False
+            expires_at, value = entry
+            if expires_at + self.stale_ttl < now:
+                del self.entries[key]
+                return MISSING, False
+            self.entries.move_to_end(key)
+            return value, expires_at < now
+
+    def get(self, key):
+        """Return the cached value, or MISSING if absent or expired."""
+        value, stale = self.lookup(key)
+        return MISSING if stale else value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute, cache_if=None):
+        """
+        Return the cached value for key, or compute and cache it. If another
+        thread is already computing the same key, wait for its result.
+
+        Args:
+            key: The normalized query key.
+            compute (callable): Produces the value on a miss.
+            cache_if (callable): Given the value, whether it should be stored.
+                Defaults to storing everything.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            with self.lock:
+                self.hits += 1
+            return value
+
+        with self.lock:
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        return self._lead(key, flight, compute, cache_if)
+
+    def _lead(self, key, flight, compute, cache_if):
+        """Compute the value of the flight for key, and share it with its waiters."""
+        try:
+            flight.value = compute()
+            if cache_if is None or cache_if(flight.value):
+                self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+    def get_or_revalidate(self, key, compute, cache_if=None, refresh=None):
+        """
+        As get_or_compute, except that a value within the staleness window
+        is returned at once and refreshed in the background.
+
+        Args:
+            refresh (callable, optional): Produces the value in the
+                background. Defaults to compute.
+
+        Returns:
+            Tuple:
+                - value: The cached or computed value.
+                - stale (bool): Whether the value has expired.
+        """
+        value, stale = self.lookup(key)
+        if value is MISSING:
+            return self.get_or_compute(key, compute, cache_if), False
+        with self.lock:
+            self.hits += 1
+            self.stale_hits += stale
+        if stale:
+            self.revalidate(key, refresh or compute, cache_if)
+        return value, stale
+
+    def revalidate(self, key, compute, cache_if=None):
+        """
+        Recompute the value of key in the background, unless it is already
+        being computed. Callers that miss meanwhile wait for the refresh.
+
+        Returns:
+            bool: Whether a refresh was started.
+        """
+        with self.lock:
+            if key in self.in_flight:
+                return False
+            flight = self.in_flight[key] = _InFlight()
+            self.refreshes += 1
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    max_workers=REFRESH_WORKERS, thread_name_prefix="dragon-revalidate"
+                )
+
+        def run():
+            try:
+                self._lead(key, flight, compute, cache_if)
+            except Exception as e:
+                getlogger().warning(f"Refreshing a stale result failed: {e}")
+
+        self._refresh_executor.submit(run)
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """Establish a singleton cache that can be reused by multiple components."""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
@@ -0,0 +1,277 @@
+"""
+Known code filters.
+
+Bulk annotation inputs contain many malformed or retired codes, and each costs
+a request per api. A Bloom filter of the codes of an ontology, built from its
+dump (or from the local ontology index), answers "definitely not a code" for
+most of them without a request. When a filter exists for a keyword's prefix,
+fetch_results returns no results for code-shaped keywords the filter rules
+out. Codes the filter may contain (all real codes, plus a small false positive
+rate) are searched as usual.
+
+Build filters from ontology files or the local index:
+
+    dragon_search code_filter hp.obo mondo.json --fp_rate 0.001
+    dragon_search code_filter --from_store --prefixes HP,MONDO
+
+Dumps contain terms imported from other ontologies, and a filter built from
+those would rule out the rest of that ontology. So a filter is only built for
+the main prefix of each file (the one with the most terms), for the
+ontologies mirrored in full into the local index, or for --prefixes.
+
+One file per prefix (HP.bloom) is written to the `SEARCH_DRAGON_CODE_FILTERS`
+directory, `~/.cache/search_dragon/code_filters` by default. A filter must be
+rebuilt when its ontology gains codes, or the new codes will not be found.
+
+File format, little endian: the header "SDBLOOM\\x01", bit count (uint64),
+hash count (uint32), code count (uint64), then the bits. Filters are memory
+mapped rather than read.
+"""
+
+import argparse
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from search_dragon import logger as getlogger
+from search_dragon.local_store import get_local_store, parse_terms
+
+CODE_FILTERS_ENV = "SEARCH_DRAGON_CODE_FILTERS"
+DEFAULT_CODE_FILTERS = Path.home() / ".cache" / "search_dragon" / "code_filters"
+DEFAULT_FP_RATE = 0.001
+
+MAGIC = b"SDBLOOM\x01"
+HEADER = struct.Struct("<8sQIQ")
+
+# A keyword that is a single CURIE, not text that happens to start with one
+_code = re.compile(r"^(?P<prefix>[A-Za-z][A-Za-z0-9_]*):(?P<local>[^\s/]+)$")
+
+
+def _positions(code, n_bits, n_hashes):
+    # Double hashing (Kirsch & Mitzenmacher); blake2b is stable between
+    # processes, unlike hash()
+    digest = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+    h1, h2 = struct.unpack("<QQ", digest)
+    h2 |= 1
+    return [(h1 + i * h2) % n_bits for i in range(n_hashes)]
+
+
+class BloomFilter:
+    def __init__(self, n_bits, n_hashes, bits=None, count=0):
+        self.n_bits = n_bits
+        self.n_hashes = n_hashes
+        self.bits = bits if bits is not None else bytearray((n_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate=DEFAULT_FP_RATE):
+        """A filter sized for capacity codes at the given false positive rate."""
+        capacity = max(capacity, 1)
+        n_bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        n_hashes = max(1, round(n_bits / capacity * math.log(2)))
+        return cls(n_bits, n_hashes)
+
+    def add(self, code):
+        for position in _positions(code, self.n_bits, self.n_hashes):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, code):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in _positions(code, self.n_bits, self.n_hashes)
+        )
+
+    def write(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as outfile:
+            outfile.write(HEADER.pack(MAGIC, self.n_bits, self.n_hashes, self.count))
+            outfile.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory map a filter written by write."""
+        with open(path, "rb") as infile:
+            mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < HEADER.size:
+            mapped.close()
+            raise ValueError(f"{path} is not a code filter")
+        magic, n_bits, n_hashes, count = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or len(mapped) < HEADER.size + (n_bits + 7) // 8:
+            mapped.close()
+            raise ValueError(f"{path} is not a code filter")
+        bits = memoryview(mapped)[HEADER.size :]
+        return cls(n_bits, n_hashes, bits, count)
+
+
+class CodeFilters:
+    """The filters in a directory, loaded on first use of each prefix."""
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.getenv(CODE_FILTERS_ENV) or DEFAULT_CODE_FILTERS
+        self.directory = Path(directory)
+        self.filters = {}  # prefix => BloomFilter, or None when there is none
+        self.lock = threading.Lock()
+
+    def get(self, prefix):
+        prefix = prefix.upper()
+        with self.lock:
+            if prefix not in self.filters:
+                path = self.directory / f"{prefix}.bloom"
+                try:
+                    self.filters[prefix] = BloomFilter.load(path) if path.exists() else None
+                except (OSError, ValueError) as e:
+                    getlogger().warning(f"Ignoring code filter {path}: {e}")
+                    self.filters[prefix] = None
+            return self.filters[prefix]
+
+    def excludes(self, keyword):
+        """
+        Whether keyword is a code that definitely doesn't exist. Keywords
+        that aren't a single CURIE, or whose prefix has no filter, are never
+        excluded.
+
+        Args:
+            keyword (str): A keyword normalized with the "ols" CURIE style.
+        """
+        match = _code.match(keyword or "")
+        if not match:
+            return False
+        code_filter = self.get(match.group("prefix"))
+        if code_filter is None:
+            return False
+        return keyword not in code_filter
+
+    def reload(self):
+        with self.lock:
+            self.filters.clear()
+
+
+def build_filters(codes_by_prefix, directory=None, fp_rate=DEFAULT_FP_RATE):
+    """
+    Write a filter for each prefix.
+
+    Args:
+        codes_by_prefix (dict): prefix => set of CURIEs.
+        directory (str, optional): Where to write the filters.
+        fp_rate (float): The false positive rate the filters are sized for.
+
+    Returns:
+        list: The paths written.
+    """
+    directory = Path(directory or os.getenv(CODE_FILTERS_ENV) or DEFAULT_CODE_FILTERS)
+    paths = []
+    for prefix, codes in sorted(codes_by_prefix.items()):
+        code_filter = BloomFilter.for_capacity(len(codes), fp_rate)
+        for code in codes:
+            code_filter.add(code)
+        path = directory / f"{prefix.upper()}.bloom"
+        code_filter.write(path)
+        getlogger().info(
+            f"Wrote {path}: {len(codes)} codes in {len(code_filter.bits)} bytes"
+        )
+        paths.append(path)
+    return paths
+
+
+def group_codes(curies):
+    """CURIEs grouped by upper cased prefix, with the prefix upper cased."""
+    codes_by_prefix = defaultdict(set)
+    for curie in curies:
+        match = _code.match(curie or "")
+        if match:
+            prefix = match.group("prefix").upper()
+            codes_by_prefix[prefix].add(f"{prefix}:{match.group('local')}")
+    return codes_by_prefix
+
+
+_code_filters = None
+
+
+def get_code_filters():
+    """Establish a singleton set of filters that can be reused by multiple components."""
+    global _code_filters
+    if _code_filters is None:
+        _code_filters = CodeFilters()
+    return _code_filters
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search code_filter",
+        description="Build filters of the codes that exist in ontologies.",
+    )
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="Ontology files (.obo or OBO Graphs .json)",
+    )
+    parser.add_argument(
+        "--from_store",
+        required=False,
+        action="store_true",
+        help="Build filters for every ontology in the local index",
+    )
+    parser.add_argument(
+        "--prefixes",
+        required=False,
+        default=None,
+        help="The prefixes to build filters for. Delimeter ,",
+    )
+    parser.add_argument(
+        "--fp_rate",
+        required=False,
+        type=float,
+        default=DEFAULT_FP_RATE,
+        help="The false positive rate of the filters",
+    )
+    parser.add_argument(
+        "--dir",
+        required=False,
+        default=None,
+        help=f"Where to write the filters. Defaults to ${CODE_FILTERS_ENV} or {DEFAULT_CODE_FILTERS}",
+    )
+    args = parser.parse_args(args)
+    if not args.files and not args.from_store:
+        parser.error("Provide ontology files or --from_store")
+    if not 0 < args.fp_rate < 1:
+        parser.error("--fp_rate must be between 0 and 1")
+
+    prefixes = (
+        [p.strip().upper() for p in args.prefixes.split(",")] if args.prefixes else None
+    )
+
+    codes_by_prefix = defaultdict(set)
+    for path in args.files:
+        file_codes = group_codes(term["curie"] for term in parse_terms(path))
+        if not file_codes:
+            continue
+        for prefix in prefixes or [max(file_codes, key=lambda p: len(file_codes[p]))]:
+            codes_by_prefix[prefix] |= file_codes.get(prefix, set())
+    if args.from_store:
+        store = get_local_store()
+        store_prefixes = prefixes or store.mirrored_prefixes()
+        if not store_prefixes:
+            parser.error(
+                "No ontologies have been mirrored in full into the local index, "
+                "name the prefixes to build with --prefixes"
+            )
+        for prefix, codes in group_codes(store.curies(store_prefixes)).items():
+            codes_by_prefix[prefix] |= codes
+
+    build_filters(
+        {prefix: codes for prefix, codes in codes_by_prefix.items() if codes},
+        args.dir,
+        args.fp_rate,
+    )
@@ -0,0 +1,250 @@
+"""
+Columnar harmonization.
+
+Descendant sets run to hundreds of thousands of terms, and building a dict
+per term to harmonize it, then another to validate it, is most of the CPU
+spent writing them out. When pyarrow is installed (`pip install
+search-dragon[columnar]`), expansions written to files are harmonized as
+columns instead: the terms are converted to arrays of codes, IRIs, labels,
+descriptions and prefixes, and the prefix => system lookup, sub-ontology code
+formatting, ERR filtering and IRI deduplication run as array operations. The
+resulting tables are merged across parents and handed to the CSV and value
+set writers without building records. Expansions smaller than the api's
+columnar_threshold are still harmonized as records, which is faster at that
+size.
+
+The records are the same as those of the dict path (harmonize_data,
+clean_harmonized_data and validate_data with descendants=True), which is
+still used when pyarrow isn't installed, or when `SEARCH_DRAGON_COLUMNAR` is
+set to 0.
+"""
+
+import csv
+import io
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+COLUMNAR_ENV = "SEARCH_DRAGON_COLUMNAR"
+
+# The fields of a harmonized record, in order
+COLUMNS = ("code", "system", "code_iri", "display", "description", "ontology_prefix")
+
+
+def available():
+    """Whether the columnar path can be used."""
+    return pa is not None and os.getenv(COLUMNAR_ENV, "1") != "0"
+
+
+def _schema():
+    return pa.schema([(column, pa.string()) for column in COLUMNS])
+
+
+def _term_columns(raw_terms):
+    """
+    The OLS term fields of raw_terms as arrays. Raises pyarrow.ArrowInvalid
+    (or ArrowTypeError) for terms that aren't shaped as expected.
+    """
+    term_type = pa.struct(
+        [
+            ("obo_id", pa.string()),
+            ("iri", pa.string()),
+            ("label", pa.string()),
+            ("ontology_prefix", pa.string()),
+        ]
+    )
+    # Descriptions are lists from OLS but strings from the local store, and
+    # Arrow would split a string given for a list into characters
+    descriptions = pa.array(
+        [
+            "\n".join(d) if isinstance(d, list) else d
+            for d in (t.get("description") for t in raw_terms)
+        ],
+        pa.string(),
+    )
+    # Converted in Arrow, without touching the dicts from Python
+    terms = pa.array(raw_terms, type=term_type)
+    fields = [terms.field(name) for name in ("obo_id", "iri", "label")]
+    return (*fields, descriptions, terms.field("ontology_prefix"))
+
+
+def _format_codes(codes, prefixes):
+    """
+    Sub-ontology codes in the CURIE convention, e.g. EDAM_data:1234 =>
+    EDAM:data_1234, for each prefix present.
+    """
+    for prefix in pc.unique(prefixes).drop_null().to_pylist():
+        if not prefix:
+            continue
+        parts = pc.extract_regex(codes, rf"{prefix}_(?P<sub_type>[a-z]+):(?P<code>\w+)")
+        matched = pc.and_kleene(pc.equal(prefixes, prefix), pc.is_valid(parts))
+        matched = matched.fill_null(False)
+        if not pc.any(matched).as_py():
+            continue
+        formatted = pc.binary_join_element_wise(
+            pa.scalar(f"{prefix}:"),
+            parts.field("sub_type"),
+            pa.scalar("_"),
+            parts.field("code"),
+            "",
+        )
+        codes = pc.if_else(matched, formatted, codes)
+    return codes
+
+
+def _first_rows(keys):
+    """
+    The positions of the first row of each key, in order. Rows without a key
+    are all kept.
+    """
+    positions = pa.array(range(len(keys)), pa.int64())
+    keyed = pc.and_(pc.is_valid(keys), pc.not_equal(keys, "")).fill_null(False)
+    first = (
+        pa.table({"key": keys.filter(keyed), "position": positions.filter(keyed)})
+        .group_by("key", use_threads=False)
+        .aggregate([("position", "min")])
+        .column("position_min")
+    )
+    kept = pa.concat_arrays([first.combine_chunks(), positions.filter(pc.invert(keyed))])
+    return pc.take(kept, pc.array_sort_indices(kept))
+
+
+def harmonize_terms(raw_terms, ontology_data):
+    """
+    Harmonize OLS terms to a table of records, the same records as
+    harmonize_terms in ols_descendants_api followed by remove_duplicates and
+    validate_data(descendants=True).
+
+    Args:
+        raw_terms (list): Terms from the OLS API, or the local store.
+        ontology_data (dict): The ontology data used to get ontology systems
+
+    Returns:
+        pyarrow.Table: One row per record, with the COLUMNS.
+    """
+    if not raw_terms:
+        return _schema().empty_table()
+    codes, iris, labels, descriptions, prefixes = _term_columns(raw_terms)
+
+    # Duplicates are dropped before invalid records, as by the dict path
+    keep = _first_rows(iris)
+    codes, iris, labels, descriptions, prefixes = (
+        column.take(keep) for column in (codes, iris, labels, descriptions, prefixes)
+    )
+
+    upper = pc.utf8_upper(prefixes)
+    systems = pa.array(list(ontology_data.values()), pa.string())
+    system = pc.take(
+        systems,
+        pc.index_in(upper, value_set=pa.array(list(ontology_data), pa.string())),
+    )
+
+    # Terms without a prefix are ERR:CURIE, and aren't returned
+    valid = pc.and_(
+        pc.is_valid(prefixes),
+        pc.not_equal(system, "ERR:SYSTEM").fill_null(True),
+    )
+    table = pa.table(
+        {
+            "code": _format_codes(codes, prefixes),
+            "system": system,
+            "code_iri": iris,
+            "display": labels,
+            "description": descriptions.fill_null(""),
+            "ontology_prefix": upper,
+        },
+        schema=_schema(),
+    )
+    return table.filter(valid)
+
+
+def records_table(records):
+    """A table of harmonized records from the dict path."""
+    return pa.Table.from_pylist(
+        [{column: record.get(column) for column in COLUMNS} for record in records],
+        schema=_schema(),
+    )
+
+
+def merge_expansions(expansions):
+    """
+    Merge the tables of several parents' expansions, keeping each term once
+    with every parent it was found under, as expand_parents does.
+
+    Args:
+        expansions (list): (parent code, pyarrow.Table) in parent order.
+
+    Returns:
+        pyarrow.Table: The terms in the order found, with a "parent_codes"
+        list column.
+    """
+    if not expansions:
+        parent_codes = pa.field("parent_codes", pa.list_(pa.string()))
+        return _schema().append(parent_codes).empty_table()
+    tables = [
+        table.append_column("parent", pa.array([code] * len(table), pa.string()))
+        for code, table in expansions
+    ]
+    terms = pa.concat_tables(tables).combine_chunks()
+    iris = terms.column("code_iri")
+    has_iri = pc.and_(pc.is_valid(iris), pc.not_equal(iris, "")).fill_null(False)
+    keys = pc.if_else(has_iri, iris, terms.column("code"))
+    grouped = (
+        pa.table(
+            {
+                "key": keys,
+                "position": pa.array(range(len(terms)), pa.int64()),
+                "parent": terms.column("parent"),
+            }
+        )
+        .group_by("key", use_threads=False)
+        .aggregate([("position", "min"), ("parent", "distinct")])
+        .sort_by("position_min")
+    )
+    merged = terms.select(list(COLUMNS)).take(grouped.column("position_min"))
+    return merged.append_column("parent_codes", grouped.column("parent_distinct"))
+
+
+def write_csv(fileobj, table, api, rows_before=(), rows_after=()):
+    """
+    Write the terms of a merged expansion in the descendants CSV layout,
+    with rows written by the csv module before and after them.
+
+    Args:
+        fileobj: A file opened for writing bytes.
+        table (pyarrow.Table): From merge_expansions.
+        api (str): The api column.
+        rows_before (list): Rows before the terms, e.g. the header.
+        rows_after (list): Rows after the terms.
+    """
+
+    def write_rows(rows):
+        text = io.StringIO()
+        csv.writer(text, lineterminator="\n").writerows(rows)
+        fileobj.write(text.getvalue().encode("utf-8"))
+
+    write_rows(rows_before)
+    terms = pa.table(
+        {
+            "api": pa.array([api] * len(table), pa.string()),
+            "parent_code": pc.binary_join(table.column("parent_codes"), "|"),
+            "descendant_code": table.column("code"),
+            "display": table.column("display"),
+            "description": table.column("description"),
+            "system": table.column("system"),
+            "code_iri": table.column("code_iri"),
+            "ontology_prefix": table.column("ontology_prefix"),
+        }
+    )
+    if len(terms):
+        pa_csv.write_csv(
+            terms,
+            fileobj,
+            pa_csv.WriteOptions(include_header=False, quoting_style="needed"),
+        )
+    write_rows(rows_after)
@@ -0,0 +1,276 @@
+"""
+Descendant expansion cache.
+
+The descendants (or children) of a term only change when its ontology is
+re-released, so OLSDescendantsAPI keeps the terms of every expansion it
+fetches here, keyed by (ontology, version, iri, children). Before an
+expansion it looks up the ontology's version (one small request to
+`ontologies/{id}`, remembered for `SEARCH_DRAGON_VERSION_CHECK_TTL` seconds,
+default 60) and reuses the stored terms while the version is unchanged. When
+an ontology's version changes, its expansions of the old version are dropped.
+
+Children are expanded by breadth-first traversal of /children (see
+search_dragon.traversal), and the children of every node traversed are kept
+here too, per ontology version, so those edges aren't fetched again.
+Descendants are fetched from the paged /descendants, which takes far fewer
+requests than fetching the children of every node. When the first page shows
+that part of the subtree is already here, as the children or descendants of
+its terms, the rest of it is traversed instead, reusing those, as long as
+that takes fewer requests than the remaining pages.
+`SEARCH_DRAGON_TRAVERSAL=1` traverses every expansion.
+
+The expansions are kept compressed in SQLite, so they are shared by the
+search server and separate dragon_search runs. The location defaults to the
+`SEARCH_DRAGON_EXPANSION_DB` environment variable, then to
+`~/.cache/search_dragon/expansions.db`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from search_dragon import logger as getlogger
+
+EXPANSION_DB_ENV = "SEARCH_DRAGON_EXPANSION_DB"
+DEFAULT_EXPANSION_DB = Path.home() / ".cache" / "search_dragon" / "expansions.db"
+VERSION_CHECK_TTL_ENV = "SEARCH_DRAGON_VERSION_CHECK_TTL"
+DEFAULT_VERSION_CHECK_TTL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expansions (
+    ontology TEXT NOT NULL,
+    version TEXT NOT NULL,
+    iri TEXT NOT NULL,
+    children INTEGER NOT NULL,
+    terms BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (ontology, iri, children)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    ontology TEXT NOT NULL,
+    version TEXT NOT NULL,
+    iri TEXT NOT NULL,
+    children BLOB NOT NULL,
+    PRIMARY KEY (ontology, iri)
+);
+"""
+
+
+class ExpansionCache:
+    """
+    SQLite backed store of descendant expansions, one per (ontology, iri,
+    children), for the latest version of the ontology seen.
+
+    A single connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path=None, version_ttl=None):
+        if db_path is None:
+            db_path = os.getenv(EXPANSION_DB_ENV) or DEFAULT_EXPANSION_DB
+        if version_ttl is None:
+            version_ttl = float(
+                os.getenv(VERSION_CHECK_TTL_ENV) or DEFAULT_VERSION_CHECK_TTL
+            )
+        self.db_path = Path(db_path)
+        self.version_ttl = version_ttl
+        self.lock = threading.RLock()
+        self._connection = None
+        self.versions = {}  # ontology => (checked_at, version)
+        self.hits = 0
+        self.stored = 0
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def version(self, ontology, lookup):
+        """
+        The current version of ontology, calling lookup(ontology) when it
+        hasn't been checked in the last version_ttl seconds. Expansions of
+        other versions are dropped when the version changes.
+
+        Returns:
+            str, or None when the version couldn't be looked up.
+        """
+        ontology = ontology.lower()
+        now = time.monotonic()
+        with self.lock:
+            checked = self.versions.get(ontology)
+            if checked is not None and now - checked[0] < self.version_ttl:
+                return checked[1]
+
+        version = lookup(ontology)
+        if version is None:
+            return None
+        with self.lock:
+            previous = self.versions.get(ontology)
+            self.versions[ontology] = (now, version)
+            if previous is None or previous[1] != version:
+                self.drop_stale(ontology, version)
+        return version
+
+    def drop_stale(self, ontology, version):
+        """Forget the expansions and edges of ontology from versions other than version."""
+        with self.lock, self.connection as conn:
+            removed = conn.execute(
+                "DELETE FROM expansions WHERE ontology = ? AND version != ?",
+                (ontology.lower(), version),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM edges WHERE ontology = ? AND version != ?",
+                (ontology.lower(), version),
+            )
+        if removed:
+            getlogger().info(
+                f"Dropped {removed} expansions of {ontology} older than version {version}"
+            )
+        return removed
+
+    def get(self, ontology, version, iri, children=False):
+        """
+        Returns:
+            list: The stored terms of the expansion, or None if it hasn't
+            been stored for this version.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT terms FROM expansions "
+                "WHERE ontology = ? AND iri = ? AND children = ? AND version = ?",
+                (ontology.lower(), iri, int(bool(children)), version),
+            ).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, ontology, version, iri, children, terms):
+        """Store the terms of an expansion, replacing any of an older version."""
+        blob = zlib.compress(json.dumps(terms, separators=(",", ":")).encode("utf-8"))
+        with self.lock, self.connection as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO expansions"
+                "(ontology, version, iri, children, terms, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    ontology.lower(),
+                    version,
+                    iri,
+                    int(bool(children)),
+                    blob,
+                    time.time(),
+                ),
+            )
+            self.stored += 1
+
+    def children(self, ontology, version, iris):
+        """
+        Returns:
+            dict: iri => the stored child terms, for those of iris whose
+            children have been stored for this version.
+        """
+        found = {}
+        iris = list(iris)
+        with self.lock:
+            # Stay below SQLite's limit on query parameters
+            for i in range(0, len(iris), 500):
+                batch = iris[i : i + 500]
+                rows = self.connection.execute(
+                    "SELECT iri, children FROM edges WHERE ontology = ? AND version = ? "
+                    f"AND iri IN ({','.join('?' * len(batch))})",
+                    [ontology.lower(), version, *batch],
+                ).fetchall()
+                for iri, blob in rows:
+                    found[iri] = json.loads(zlib.decompress(blob))
+        return found
+
+    def subtrees(self, ontology, version, iris):
+        """
+        Returns:
+            dict: iri => the stored descendants, for those of iris whose
+            descendants have been stored for this version.
+        """
+        found = {}
+        iris = list(iris)
+        with self.lock:
+            for i in range(0, len(iris), 500):
+                batch = iris[i : i + 500]
+                rows = self.connection.execute(
+                    "SELECT iri, terms FROM expansions WHERE ontology = ? AND version = ? "
+                    f"AND children = 0 AND iri IN ({','.join('?' * len(batch))})",
+                    [ontology.lower(), version, *batch],
+                ).fetchall()
+                for iri, blob in rows:
+                    found[iri] = json.loads(zlib.decompress(blob))
+        return found
+
+    def known(self, ontology, version, iris):
+        """
+        Returns:
+            set: Those of iris whose children or descendants have been stored
+            for this version.
+        """
+        found = set()
+        iris = list(iris)
+        with self.lock:
+            for i in range(0, len(iris), 500):
+                batch = iris[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    "SELECT iri FROM edges WHERE ontology = ? AND version = ? "
+                    f"AND iri IN ({placeholders}) "
+                    "UNION SELECT iri FROM expansions WHERE ontology = ? AND version = ? "
+                    f"AND children = 0 AND iri IN ({placeholders})",
+                    [ontology.lower(), version, *batch] * 2,
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def put_children(self, ontology, version, children):
+        """Store the child terms of nodes, children being iri => terms."""
+        rows = [
+            (
+                ontology.lower(),
+                version,
+                iri,
+                zlib.compress(json.dumps(terms, separators=(",", ":")).encode("utf-8")),
+            )
+            for iri, terms in children.items()
+        ]
+        if not rows:
+            return
+        with self.lock, self.connection as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO edges(ontology, version, iri, children) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def __len__(self):
+        if not self.db_path.exists():
+            return 0
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM expansions").fetchone()[0]
+
+
+_expansion_cache = None
+
+
+def get_expansion_cache():
+    """Establish a singleton expansion cache that can be reused by multiple components."""
+    global _expansion_cache
+    if _expansion_cache is None:
+        _expansion_cache = ExpansionCache()
+    return _expansion_cache
@@ -1,22 +1,198 @@
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from search_dragon import logger as getlogger
+from search_dragon.metrics import get_metrics
+from search_dragon.scheduler import current_scheduling, get_scheduler
+
+_sessions = threading.local()
+
+
+def get_session():
+    """
+    Return this thread's requests session. Sessions keep connections to the
+    apis open between requests, and aren't shared since they aren't thread
+    safe.
+    """
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+
+class IncompleteResults(list):
+    """
+    Raw results missing those of failed requests, as returned by collect_data
+    and collect_all when a request fails. Empty when the only request failed.
+    Unlike results that are merely empty, they aren't cached.
+    """
+
 
 class OntologyAPI:
     def __init__(self, base_url, api_id, api_name):
         self.base_url = base_url
         self.api_id = api_id
         self.api_name = api_name
+        # Which column of the prefix alias table this api's queries use
+        self.curie_style = "ols"
+        # Whether results may be kept in the result cache
+        self.cacheable = True
+        # Whether harmonize_columnar can harmonize results as columns
+        self.harmonizes_columnar = False
+        # Paging used by collect_all. collect_data records the total number
+        # of results reported by the api in last_total_results.
+        self.first_start_index = 0
+        self.max_page_size = 500
+        self.page_workers = 4
+        self.last_total_results = None
+        # Upstream requests made by this instance, for the scoreboard
+        self.requests_made = 0
+        self.failed_requests = 0
+        # Whether fetch_results served a stale cached result, see ResultCache
+        self.served_stale = False
+        # The request priority and job of the search this instance serves
+        self.priority, self.job = current_scheduling()
 
     def fetch_data(self, url):
         """ """
-        response = requests.get(url)
+        self.requests_made += 1
+        with get_scheduler().slot(url, self.priority, self.job):
+            started = time.perf_counter()
+            try:
+                response = get_session().get(url)
+            except Exception:
+                self.failed_requests += 1
+                get_metrics().record_request(
+                    self.api_id, "error", time.perf_counter() - started
+                )
+                raise
+        get_metrics().record_request(
+            self.api_id,
+            response.status_code,
+            time.perf_counter() - started,
+            len(response.content),
+        )
         if response.status_code == 200:
             return response.json()
         else:
+            self.failed_requests += 1
             print(f"Failed to fetch data: {response.status_code}")
             return None
 
+    def next_start_index(self, start_index, results_per_page):
+        """
+        The start_index of the page following this one. Paged by row offset
+        unless overridden.
+
+        Returns:
+            int, or None when the api doesn't page.
+        """
+        return int(start_index) + int(results_per_page)
+
+    def collect_all(
+        self,
+        keywords,
+        ontology_list,
+        max_results=None,
+        iri=None,
+        children=False,
+    ):
+        """
+        Fetch every result for a query, or the first max_results. The first
+        page tells us how many results there are; the remaining pages are
+        then fetched concurrently at the api's maximum page size.
+
+        Returns:
+            Tuple:
+                - raw_data (list): Results from all the pages, in order. An
+                  IncompleteResults when any page failed.
+                - more_results_available (bool): Whether results remain beyond max_results.
+        """
+        logger = getlogger()
+        page_size = self.max_page_size
+        if max_results:
+            page_size = min(page_size, int(max_results))
+
+        def collect_page(start_index):
+            url = self.build_url(
+                keywords, ontology_list, start_index, page_size, iri, children=children
+            )
+            return self.collect_data(url, page_size, start_index)
+
+        start_index = self.first_start_index
+        self.last_total_results = None
+        raw_data, _ = collect_page(start_index)
+        failed = isinstance(raw_data, IncompleteResults)
+        total_results = self.last_total_results or len(raw_data)
+        wanted = min(total_results, int(max_results)) if max_results else total_results
+
+        page_starts = []
+        n_pages = -(-wanted // page_size) if page_size else 1
+        for _ in range(n_pages - 1):
+            start_index = self.next_start_index(start_index, page_size)
+            if start_index is None:
+                break
+            page_starts.append(start_index)
+
+        if page_starts:
+            logger.debug(
+                f"Fetching {len(page_starts)} more pages of {page_size} from {self.api_id}"
+            )
+            with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+                for page_data, _ in executor.map(collect_page, page_starts):
+                    failed = failed or isinstance(page_data, IncompleteResults)
+                    raw_data.extend(page_data)
+
+        if max_results:
+            raw_data = raw_data[: int(max_results)]
+        if failed:
+            raw_data = IncompleteResults(raw_data)
+        return raw_data, len(raw_data) < total_results
+
+    def data_version(self, ontology_list):
+        """
+        The version of the data the api answers queries of ontology_list
+        from, when the api can tell. Cached results are keyed by it, so they
+        aren't reused once it changes.
+
+        Returns:
+            str, or None when unknown.
+        """
+        return None
+
+    def harmonize_columnar(self, raw_results, ontology_data):
+        """
+        Harmonize raw results as columns rather than records, for apis that
+        can (see search_dragon.columnar).
+
+        Returns:
+            pyarrow.Table: The harmonized, deduplicated and validated
+            records, or None when the api (or environment) can't. Apis that
+            can set harmonizes_columnar.
+        """
+        return None
+
+    def search_mirror(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
+        """
+        Answer a search from a local mirror rather than the remote api.
+
+        Returns:
+            None when the search has to go upstream, otherwise the same
+            (raw_data, more_results_available) tuple as collect_data.
+        """
+        return None
+
     def remove_duplicates(self, data):
         """
         Remove duplicate records where the 'uri' field is the same.
@@ -29,20 +205,17 @@ class OntologyAPI:
         """
         seen_uris = set()
         filtered_data = []
-        excluded_data = []
+        excluded = 0
 
         for item in data:
             uri = item.get("code_iri", "")
             if uri and uri in seen_uris:
-                excluded_data.append(item)
+                excluded += 1
             else:
                 seen_uris.add(uri)
                 filtered_data.append(item)
 
-        # Log the excluded records count
-        message = (
-            f"Records({len(excluded_data)}) were excluded as duplicates based on 'uri'.{excluded_data}"
-        )
-        getlogger().debug(message)
+        # Log the excluded records count, not the records themselves
+        getlogger().debug(f"Records({excluded}) were excluded as duplicates based on 'uri'.")
 
         return filtered_data
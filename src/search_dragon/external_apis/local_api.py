@@ -0,0 +1,154 @@
+"""
+Local Ontology Search API
+
+This script defines the `LocalSearchAPI` class that answers searches from the
+local ontology store (see search_dragon.local_store) rather than a remote
+service. It follows the same build_url/collect_data/harmonize_data contract as
+the remote APIs so it can be used anywhere they are. The url is never sent over
+the network, it only carries the query to collect_data.
+
+"""
+
+import urllib.parse
+
+from search_dragon import logger as getlogger
+from search_dragon.external_apis import IncompleteResults, OntologyAPI
+from search_dragon.local_store import get_local_store
+
+
+class LocalSearchAPI(OntologyAPI):
+    def __init__(self):
+        super().__init__(
+            base_url="local://search_dragon/",
+            api_id="local",
+            api_name="Local Ontology Index",
+        )
+        self.total_results_id = "total_results"
+        self.cacheable = False
+
+    def collect_data(self, search_url, results_per_page, start_index):
+        """
+        Fetch a single page of data from the local store.
+
+        Args:
+            search_url: The url produced by build_url.
+            results_per_page: Number of results to fetch in this request.
+            start_index: The starting row index for fetching data.
+
+        Returns:
+            Tuple:
+                - raw_data (list): Results from the requested page.
+                - more_results_available (bool): Whether more results are available.
+        """
+        logger = getlogger()
+        results_per_page = int(results_per_page)
+        start_index = int(start_index)
+
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(search_url).query)
+            keywords = query.get("q", [""])[0]
+            ontology_list = [o for o in query.get("ontology", [""])[0].split(",") if o]
+
+            raw_data, total_results = get_local_store().search(
+                keywords, ontology_list, start_index, results_per_page
+            )
+            logger.debug(f"Total results found: {total_results}")
+            self.last_total_results = total_results
+        except Exception as e:
+            logger.error(f"Error fetching data from {search_url}: {e}")
+            return IncompleteResults(), False
+
+        more_results_available = start_index + results_per_page < total_results
+        return raw_data, more_results_available
+
+    def format_keyword(self, keywords):
+        """
+        Formats the provided keywords for the search query.
+
+        Example return: "q=brain%20cancer"
+        """
+        return f"q={urllib.parse.quote(keywords, safe='')}"
+
+    def format_ontology(self, ontology_list):
+        """
+        Formats the included ontologies into a query parameter for the search URL.
+
+        Example return: "ontology=uberon,ma"
+        """
+        formatted_ontologies = ",".join(o for o in ontology_list or [] if o)
+
+        return f"ontology={formatted_ontologies}"
+
+    def format_results_per_page(self, results_per_page):
+        return f"rows={results_per_page}"
+
+    def format_start_index(self, start_index):
+        return f"start={start_index}"
+
+    def build_url(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
+        """
+        Constructs the search URL by combining the base URL, formatted keyword, and ontology parameters.
+
+        Args:
+            keywords (str): The search keyword(s).
+            ontology_list (list): The ontology prefixes to be included in the search.
+
+        Returns:
+            str: The complete search URL.
+        """
+        params = [
+            self.format_keyword(keywords),
+            self.format_ontology(ontology_list),
+            self.format_start_index(start_index),
+            self.format_results_per_page(results_per_page),
+        ]
+        return f"{self.base_url}search?" + "&".join(params)
+
+    def harmonize_data(self, raw_results, ontology_data):
+        """
+        Harmonizes the local store records into a standardized format for further processing.
+
+        Args:
+            raw_results (dict or list): Records returned from the local store.
+            ontology_data (dict): The ontology data used to get ontology systems
+
+        Returns:
+            dict: A dictionary containing the harmonized data.
+        """
+        if isinstance(raw_results, list):
+            return [self.harmonize_data(item, ontology_data) for item in raw_results]
+
+        ontology_prefix = (
+            raw_results.get("ontology_prefix") or "ERR:CURIE"
+        )  # ERRs are caught by validate_data and not returned
+
+        system = (
+            ontology_data.get(ontology_prefix) or "ERR:SYSTEM"
+        )  # ERRs are caught by validate_data and not returned
+
+        harmonized_data = {
+            "code": raw_results.get("curie"),
+            "system": system,
+            "code_iri": raw_results.get("iri"),
+            "display": raw_results.get("label"),
+            "description": raw_results.get("description", []),
+            "ontology_prefix": ontology_prefix,
+        }
+
+        return harmonized_data
+
+    def clean_harmonized_data(self, data):
+        """
+        Cleans the harmonized data to the specifications required for this API.
+        """
+        cleaned_data = self.remove_duplicates(data)
+
+        return cleaned_data
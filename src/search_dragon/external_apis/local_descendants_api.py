@@ -0,0 +1,54 @@
+"""
+Local Descendants API
+
+This script defines the `LocalDescendantsAPI` class, a drop-in alternative to
+`OLSDescendantsAPI` that expands descendants and children from the hierarchy
+held in the local ontology store. Records are shaped like OLS terms so the
+harmonization, including the sub-ontology code formatting, is shared with the
+OLS class.
+
+"""
+
+import urllib.parse
+
+from search_dragon import logger as getlogger
+from search_dragon.external_apis import IncompleteResults
+from search_dragon.external_apis.ols_descendants_api import OLSDescendantsAPI
+from search_dragon.local_store import get_local_store
+
+
+class LocalDescendantsAPI(OLSDescendantsAPI):
+    def __init__(self):
+        super().__init__()
+        self.base_url = "local://search_dragon/ontologies"
+        self.api_id = "locald"
+        self.api_name = "Local Ontology Index"
+        self.cacheable = False
+
+    def collect_data(self, search_url, results_per_page, start_index):
+        # results_per_page and start_index are not used in this class, but kept since they are used in other classes
+        """
+        Fetch every descendant (or direct child) from the local store.
+
+        Args:
+            search_url: The url produced by build_url.
+
+        Returns:
+            Tuple:
+                - raw_data (list): All descendants/children of the term.
+        """
+        logger = getlogger()
+
+        try:
+            path = urllib.parse.urlsplit(search_url).path.strip("/").split("/")
+            # ontologies/{ontology}/terms/{iri}/{descendants|children}
+            iri = urllib.parse.unquote(urllib.parse.unquote(path[-2]))
+            raw_data = self.terms_from_store(
+                get_local_store(), iri, children=path[-1] == "children"
+            )
+            logger.debug(f"Total elements: {len(raw_data)}")
+        except Exception as e:
+            logger.error(f"Error fetching data from {search_url}: {e}")
+            return IncompleteResults(), False
+
+        return raw_data, False
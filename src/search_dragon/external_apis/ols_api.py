@@ -8,8 +8,11 @@ This script defines the `OLSSearchAPI` class that interacts with the Ontology Lo
 
 """
 
+import urllib.parse
+
 from search_dragon import logger as getlogger
-from search_dragon.external_apis import OntologyAPI
+from search_dragon.external_apis import IncompleteResults, OntologyAPI
+from search_dragon.mirror import fresh_mirror
 from search_dragon.result_structure import clean_url
 
 
@@ -59,6 +62,7 @@ class OLSSearchAPI(OntologyAPI):
 
             total_results = data.get("response", {}).get(self.total_results_id, 0)
             logger.debug(f"Total results found: {total_results}")
+            self.last_total_results = total_results
             logger.debug(
                 f"Retrieved {len(results)} results (start_index: {start_index})."
             )
@@ -75,10 +79,44 @@ class OLSSearchAPI(OntologyAPI):
 
         except Exception as e:
             logger.error(f"Error fetching data from {clean_url(search_url)}: {e}")
-            return [], more_results_available
+            return IncompleteResults(), more_results_available
 
         return raw_data, more_results_available
 
+    def search_mirror(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
+        """
+        Answer from the local mirror when every requested ontology has been
+        mirrored recently. Records are shaped like the OLS search docs.
+        """
+        store = fresh_mirror(ontology_list)
+        if store is None:
+            return None
+
+        start_index = int(start_index)
+        results_per_page = int(results_per_page)
+        records, total_results = store.search(
+            keywords, ontology_list, start_index, results_per_page
+        )
+        raw_data = [
+            {
+                "obo_id": record["curie"],
+                "iri": record["iri"],
+                "label": record["label"],
+                "description": record["description"],
+                "ontology_prefix": record["ontology_prefix"],
+            }
+            for record in records
+        ]
+        return raw_data, start_index + results_per_page < total_results
+
     def format_keyword(self, keywords):
         """
         Formats the provided keywords for the search query.
@@ -92,7 +130,7 @@ class OLSSearchAPI(OntologyAPI):
         Example return: "q=brain%20cancer"
         """
 
-        keywords = keywords.replace(" ", "%20")
+        keywords = urllib.parse.quote(keywords, safe="")
 
         keyword_param = f"q={keywords}"
 
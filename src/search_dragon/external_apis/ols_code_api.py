@@ -12,8 +12,11 @@ This script defines the `OLSSearchAPI` class that interacts with the Ontology Lo
 
 """
 
+import urllib.parse
+
 from search_dragon import logger as getlogger
-from search_dragon.external_apis import OntologyAPI
+from search_dragon.external_apis import IncompleteResults, OntologyAPI
+from search_dragon.mirror import fresh_mirror
 from search_dragon.result_structure import clean_url
 
 
@@ -65,6 +68,7 @@ class OLSSearchAPICode(OntologyAPI):
 
             total_results = data.get(self.total_results_id, 0)
             logger.debug(f"Total results found: {total_results}")
+            self.last_total_results = total_results
             logger.debug(
                 f"Retrieved {len(results)} results (start_index: {start_index})."
             )
@@ -81,10 +85,49 @@ class OLSSearchAPICode(OntologyAPI):
 
         except Exception as e:
             logger.error(f"Error fetching data from {clean_url(search_url)}: {e}")
-            return [], more_results_available
+            return IncompleteResults(), more_results_available
 
         return raw_data, more_results_available
 
+    def next_start_index(self, start_index, results_per_page):
+        """This api pages by page number."""
+        return int(start_index) + 1
+
+    def search_mirror(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
+        """
+        Answer code searches (HP:0003045) from the local mirror when the
+        code's ontology has been mirrored recently. Records are shaped like
+        the OLS v2 entities.
+        """
+        if ":" not in keywords:
+            return None
+        store = fresh_mirror([keywords.split(":", 1)[0]])
+        if store is None:
+            return None
+
+        # This api pages by page number rather than row
+        results_per_page = int(results_per_page)
+        offset = int(start_index) * results_per_page
+        records, total_results = store.search(keywords, None, offset, results_per_page)
+        raw_data = [
+            {
+                "curie": record["curie"],
+                "iri": record["iri"],
+                "label": [record["label"]],
+                "definedBy": [record["ontology_prefix"].lower()],
+            }
+            for record in records
+        ]
+        return raw_data, offset + results_per_page < total_results
+
     def format_keyword(self, keywords):
         """
         Formats the provided keywords for the search query.
@@ -96,8 +139,7 @@ class OLSSearchAPICode(OntologyAPI):
             The formatted query parameter to be inserted into the search url.
 
         """
-        keywords = keywords.replace(" ", "%20")
-        keywords = keywords.replace(":", "%3A")
+        keywords = urllib.parse.quote(keywords, safe="")
 
         keyword_param = f"search={keywords}"
 
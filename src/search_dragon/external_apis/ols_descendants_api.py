@@ -1,10 +1,25 @@
+import multiprocessing
+import os
 import re
 import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
 
 import rich
 
+from search_dragon import columnar
 from search_dragon import logger as getlogger
+from search_dragon.expansion_cache import get_expansion_cache
+from search_dragon.external_apis import IncompleteResults
 from search_dragon.external_apis.ols_code_api import OLSSearchAPICode
+from search_dragon.metrics import get_metrics
+from search_dragon.mirror import fresh_mirror
+from search_dragon.traversal import (
+    DEFAULT_TRAVERSAL_WORKERS,
+    FetchLimitExceeded,
+    breadth_first,
+)
+
+TRAVERSAL_ENV = "SEARCH_DRAGON_TRAVERSAL"
 
 
 class OLSDescendantsAPI(OLSSearchAPICode):
@@ -14,11 +29,32 @@ class OLSDescendantsAPI(OLSSearchAPICode):
         self.api_id = "olsd"
         self.api_name = "Ontology Lookup Service"
         self.total_results_id = "totalElements"
+        # Harmonization of large expansions is split into chunks, and spread
+        # over a process pool beyond the threshold.
+        self.harmonize_chunk_size = 5000
+        self.process_pool_threshold = 100000
+        self.process_pool_workers = None  # os.cpu_count()
+        # Expansions are harmonized as columns from this many terms. Below
+        # it building the Arrow arrays costs more than it saves: at 1000
+        # terms columns take 2.3 ms against 1.4 ms as records, at 5000 5.9 ms
+        # against 7.3 ms (dragon_search benchmark).
+        self.harmonizes_columnar = True
+        self.columnar_threshold = 5000
+        # Children of the nodes of a traversal fetched at once
+        self.traversal_workers = DEFAULT_TRAVERSAL_WORKERS
+        # Whether every descendant expansion is traversed, rather than
+        # fetched from the paged /descendants unless partly cached
+        self.traverse_uncached = os.getenv(TRAVERSAL_ENV, "0") == "1"
 
     def collect_data(self, search_url, results_per_page, start_index):
         # results_per_page and start_index are not used in this class, but kept since they are used in other classes
         """
-        Fetch all pages of data from the provided search endpoint.
+        Fetch all pages of data from the provided search endpoint. Expansions
+        are stored in the expansion cache, and reused until the ontology's
+        version changes. When the version is known, children are found by
+        traversal (see traverse), and descendants from the paged
+        /descendants, or by traversal when part of the subtree is cached
+        (see expand_descendants).
 
         Args:
             search_url: The base URL for the search API.
@@ -28,33 +64,224 @@ class OLSDescendantsAPI(OLSSearchAPICode):
                 - raw_data (list): Results from the requested page.
         """
         logger = getlogger()
-        raw_data = []
-
+        expansion = self.expansion_of(search_url)
+        version = self.data_version(expansion[0]) if expansion else None
+        cache = get_expansion_cache()
+        if version is not None:
+            raw_data = cache.get(expansion[0], version, *expansion[1:])
+            get_metrics().inc(
+                "search_dragon_expansion_cache_requests_total",
+                ontology=expansion[0],
+                result="miss" if raw_data is None else "hit",
+            )
+            if raw_data is not None:
+                logger.debug(f"Expansion of {expansion[1]} cached for version {version}")
+                return raw_data, False
+
+        if version is None:
+            try:
+                return self.fetch_pages(search_url, self.max_page_size), False
+            except Exception as e:
+                logger.error(f"Error fetching data from {search_url}: {e}")
+                return IncompleteResults(), False
+
+        ontology, iri, children = expansion
         try:
-            current_page = 0
-            while True:
-                paginated_url = f"{search_url}?page={current_page}"
-
-                data = self.fetch_data(paginated_url)
-                results = data.get("_embedded", {}).get("terms", [])
-                raw_data.extend(results)
-
-                page_obj = data.get("page", {})
-                total_pages = page_obj.get("totalPages", 1)
-                total_elements = page_obj.get("totalElements", 0)
-                logger.debug(
-                    f"Page {current_page + 1} of {total_pages}. Total elements: {total_elements}"
+            if children or self.traverse_uncached:
+                raw_data, complete = self.traverse(ontology, iri, children, version)
+            else:
+                raw_data, complete = self.expand_descendants(
+                    search_url, ontology, iri, version
+                )
+        except Exception as e:
+            logger.error(f"Error fetching data from {search_url}: {e}")
+            return IncompleteResults(), False
+        if not complete:
+            return IncompleteResults(raw_data), False
+        cache.put(ontology, version, iri, children, raw_data)
+        return raw_data, False
+
+    def expand_descendants(self, search_url, ontology, iri, version):
+        """
+        Fetch the descendants of iri from the paged /descendants. When the
+        first page shows that part of the subtree is in the expansion cache,
+        as the children or descendants of iri or of terms on the page, the
+        subtree is traversed instead, reusing those, unless that takes more
+        requests than the remaining pages.
+
+        Returns:
+            Tuple:
+                - raw_data (list): The descendants of iri.
+                - complete (bool): Whether the children of every node
+                  traversed were found.
+        """
+        logger = getlogger()
+        raw_data, total_pages = self.fetch_page(search_url, 0, self.max_page_size)
+        if total_pages <= 1:
+            return raw_data, True
+
+        iris = [iri] + [term["iri"] for term in raw_data if term.get("iri")]
+        if get_expansion_cache().known(ontology, version, iris):
+            try:
+                return self.traverse(
+                    ontology, iri, False, version, max_fetches=total_pages - 1
                 )
+            except FetchLimitExceeded as e:
+                logger.debug(f"{e}, fetching its pages instead")
+
+        for page in range(1, total_pages):
+            raw_data.extend(self.fetch_page(search_url, page, self.max_page_size)[0])
+        return raw_data, True
+
+    def traverse(self, ontology, iri, children, version, max_fetches=None):
+        """
+        Expand iri breadth first over /children, reusing the children of
+        nodes already in the expansion cache's graph for this version, and
+        the stored descendants of nodes expanded before, and adding the
+        children fetched.
+
+        Returns:
+            Tuple:
+                - raw_data (list): The descendants, or children, of iri.
+                - complete (bool): Whether the children of every node were found.
+        """
+        cache = get_expansion_cache()
+
+        def fetch_children(node):
+            url = self.build_url(None, ontology, 0, 0, node, children=True)
+            return self.fetch_pages(url, self.max_page_size)
+
+        return breadth_first(
+            iri,
+            fetch_children,
+            lambda iris: cache.children(ontology, version, iris),
+            lambda edges: cache.put_children(ontology, version, edges),
+            depth=1 if children else None,
+            workers=self.traversal_workers,
+            load_subtrees=lambda iris: cache.subtrees(ontology, version, iris),
+            max_fetches=max_fetches,
+        )
+
+    def fetch_page(self, search_url, page, page_size=None):
+        """
+        Fetch a page of terms from the search endpoint.
+
+        Returns:
+            Tuple:
+                - raw_data (list): The terms of the page.
+                - total_pages (int): The number of pages.
+        """
+        paginated_url = f"{search_url}?page={page}"
+        if page_size:
+            paginated_url += f"&size={page_size}"
+
+        data = self.fetch_data(paginated_url)
+        results = data.get("_embedded", {}).get("terms", [])
+
+        page_obj = data.get("page", {})
+        total_pages = page_obj.get("totalPages", 1)
+        total_elements = page_obj.get("totalElements", 0)
+        getlogger().debug(
+            f"Page {page + 1} of {total_pages}. Total elements: {total_elements}"
+        )
+        return list(results), total_pages
+
+    def fetch_pages(self, search_url, page_size=None):
+        """Fetch every page of terms from the search endpoint."""
+        raw_data, total_pages = self.fetch_page(search_url, 0, page_size)
+        for page in range(1, total_pages):
+            raw_data.extend(self.fetch_page(search_url, page, page_size)[0])
+        return raw_data
 
-                current_page += 1
-                if current_page >= total_pages:
-                    break
+    def data_version(self, ontology_list):
+        """
+        The current version of the ontology, from OLS. None when the
+        ontology is answered from a fresh local mirror instead.
+        """
+        if not isinstance(ontology_list, str) or not ontology_list:
+            return None
+        if fresh_mirror(ontology_list) is not None:
+            return None
+        return get_expansion_cache().version(ontology_list, self.fetch_version)
 
+    def fetch_version(self, ontology_id):
+        """
+        Look up the version of an ontology in OLS, falling back to when it
+        was loaded for ontologies without one.
+
+        Returns:
+            str, or None if the lookup failed.
+        """
+        try:
+            metadata = self.fetch_data(f"{self.base_url}/{ontology_id}")
         except Exception as e:
-            logger.error(f"Error fetching data from {search_url}: {e}")
-            return [], False
+            getlogger().warning(f"Couldn't look up the version of {ontology_id}: {e}")
+            return None
+        if not metadata:
+            return None
+        config = metadata.get("config", {})
+        version = (
+            config.get("version")
+            or metadata.get("version")
+            or metadata.get("loaded")
+            or metadata.get("updated")
+        )
+        return str(version) if version else None
 
-        return raw_data, False
+    def expansion_of(self, search_url):
+        """
+        The (ontology, iri, children) expanded by a url from build_url, or
+        None for other urls.
+        """
+        prefix = f"{self.base_url}/"
+        if not search_url.startswith(prefix):
+            return None
+        parts = search_url[len(prefix) :].split("?")[0].split("/")
+        if len(parts) != 4 or parts[1] != "terms":
+            return None
+        if parts[3] not in ("children", "descendants"):
+            return None
+        iri = urllib.parse.unquote(urllib.parse.unquote(parts[2]))
+        return parts[0].lower(), iri, parts[3] == "children"
+
+    def next_start_index(self, start_index, results_per_page):
+        """Every descendant is collected at once, so there is no next page."""
+        return None
+
+    def search_mirror(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
+        """
+        Expand from the hierarchy in the local mirror when the ontology has
+        been mirrored recently.
+        """
+        store = fresh_mirror(ontology_list)
+        if store is None or iri is None:
+            return None
+        return self.terms_from_store(store, iri, children), False
+
+    def terms_from_store(self, store, iri, children=False):
+        """
+        Fetch the descendants (or direct children) of a term from a local
+        ontology store, shaped like the OLS terms.
+        """
+        records = store.children(iri) if children else store.descendants(iri)
+        return [
+            {
+                "obo_id": record["curie"],
+                "iri": record["iri"],
+                "label": record["label"],
+                "description": record["description"],
+                "ontology_prefix": record["ontology_prefix"],
+            }
+            for record in records
+        ]
 
     def format_iri(self, iri):
         """
@@ -121,40 +348,126 @@ class OLSDescendantsAPI(OLSSearchAPICode):
         """
 
         if isinstance(raw_results, list):
-            return [self.harmonize_data(item, ontology_data) for item in raw_results]
-
-        # Get the ontology prefix from the raw result
-        ontology_prefix = raw_results.get(
-            "ontology_prefix", "ERR:CURIE"
-        )  # ERRs are caught by validate_data and not returned
-
-        # Retrieve the corresponding value from ontology_list
-        system = ontology_data.get(
-            ontology_prefix.upper() or "ERR:SYSTEM"
-        )  # ERRs are caught by validate_data and not returned
-
-        display = raw_results.get("label")
-        description = raw_results.get("description")
-        if isinstance(description, list):
-            description = "\n".join(description)
-
-        orig_obo = raw_results.get("obo_id")
-        pattern = rf"{ontology_prefix}_(?P<sub_type>[a-z]+):(?P<code>\w+)"
-        match = re.search(pattern, orig_obo or "")
-        if match:
-            formatted_obo = (
-                f"{ontology_prefix}:{match.group('sub_type')}_{match.group('code')}"
+            return self.harmonize_batch(raw_results, ontology_data)
+
+        return harmonize_term(raw_results, ontology_data, {})
+
+    def harmonize_columnar(self, raw_results, ontology_data):
+        """
+        Harmonize a list of terms as columns, when pyarrow is installed and
+        there are at least columnar_threshold of them.
+
+        Returns:
+            pyarrow.Table, or None when the columnar path isn't available,
+            or not worth it.
+        """
+        if not columnar.available() or not isinstance(raw_results, list):
+            return None
+        if len(raw_results) < self.columnar_threshold:
+            return None
+        return columnar.harmonize_terms(raw_results, ontology_data)
+
+    def harmonize_batch(self, raw_results, ontology_data):
+        """
+        Harmonize a list of terms in chunks. Large expansions are spread over
+        a process pool; output is identical to harmonizing term by term.
+        """
+        chunks = [
+            raw_results[i : i + self.harmonize_chunk_size]
+            for i in range(0, len(raw_results), self.harmonize_chunk_size)
+        ]
+        # Shipping terms to worker processes costs about as much as
+        # harmonizing them, so the pool only pays off for very large
+        # expansions on machines with cores to spare.
+        use_pool = (
+            len(raw_results) >= self.process_pool_threshold
+            and len(chunks) > 1
+            and (os.cpu_count() or 1) > 1
+        )
+        if not use_pool:
+            harmonized_data = []
+            for chunk in chunks:
+                harmonized_data.extend(harmonize_terms(chunk, ontology_data))
+            return harmonized_data
+
+        getlogger().debug(
+            f"Harmonizing {len(raw_results)} terms in {len(chunks)} chunks on a process pool"
+        )
+        try:
+            # spawn rather than fork, since the server runs worker threads
+            with ProcessPoolExecutor(
+                max_workers=self.process_pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                harmonized_chunks = executor.map(
+                    harmonize_terms, chunks, [ontology_data] * len(chunks)
+                )
+                harmonized_data = []
+                for harmonized_chunk in harmonized_chunks:
+                    harmonized_data.extend(harmonized_chunk)
+                return harmonized_data
+        except Exception as e:
+            getlogger().warning(
+                f"Process pool harmonization failed, harmonizing in process: {e}"
             )
-        else:
-            formatted_obo = orig_obo
-
-        harmonized_data = {
-            "code": formatted_obo,
-            "system": system,
-            "code_iri": raw_results.get("iri"),
-            "display": display,
-            "description": description,  # Currently not reusing the display for the description. If the description field is empty but needs to be populated, the display can be used - YC 6/17/2026
-            "ontology_prefix": ontology_prefix.upper(),
-        }
-
-        return harmonized_data
+            return harmonize_terms(raw_results, ontology_data)
+
+
+def harmonize_term(raw_result, ontology_data, patterns):
+    """
+    Harmonize a single OLS term.
+
+    Args:
+        raw_result (dict): A term returned from the OLS API.
+        ontology_data (dict): The ontology data used to get ontology systems
+        patterns (dict): Compiled sub-ontology code patterns by prefix, filled
+            in as new prefixes are seen.
+    """
+    # Get the ontology prefix from the raw result
+    ontology_prefix = raw_result.get(
+        "ontology_prefix", "ERR:CURIE"
+    )  # ERRs are caught by validate_data and not returned
+
+    # Retrieve the corresponding value from ontology_list
+    system = ontology_data.get(
+        ontology_prefix.upper() or "ERR:SYSTEM"
+    )  # ERRs are caught by validate_data and not returned
+
+    display = raw_result.get("label")
+    description = raw_result.get("description")
+    if isinstance(description, list):
+        description = "\n".join(description)
+
+    orig_obo = raw_result.get("obo_id")
+    pattern = patterns.get(ontology_prefix)
+    if pattern is None:
+        pattern = patterns[ontology_prefix] = re.compile(
+            rf"{ontology_prefix}_(?P<sub_type>[a-z]+):(?P<code>\w+)"
+        )
+    match = pattern.search(orig_obo or "")
+    if match:
+        formatted_obo = (
+            f"{ontology_prefix}:{match.group('sub_type')}_{match.group('code')}"
+        )
+    else:
+        formatted_obo = orig_obo
+
+    harmonized_data = {
+        "code": formatted_obo,
+        "system": system,
+        "code_iri": raw_result.get("iri"),
+        "display": display,
+        "description": description,  # Currently not reusing the display for the description. If the description field is empty but needs to be populated, the display can be used - YC 6/17/2026
+        "ontology_prefix": ontology_prefix.upper(),
+    }
+
+    return harmonized_data
+
+
+def harmonize_terms(raw_results, ontology_data):
+    """
+    Harmonize a list of OLS terms, compiling each prefix's pattern once.
+    Module level so it can run in a process pool.
+    """
+    patterns = {}
+    return [harmonize_term(item, ontology_data, patterns) for item in raw_results]
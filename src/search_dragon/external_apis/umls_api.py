@@ -9,9 +9,10 @@ This script defines the `UMLSSearchAPI` class that interacts with the umls API t
 """
 
 import os
+import urllib.parse
 
 from search_dragon import logger as getlogger
-from search_dragon.external_apis import OntologyAPI
+from search_dragon.external_apis import IncompleteResults, OntologyAPI
 from search_dragon.result_structure import clean_url
 
 
@@ -24,6 +25,9 @@ class UMLSSearchAPI(OntologyAPI):
             api_name="Unified Medical Language System",
         )
         self.total_results_id = "recCount"
+        self.curie_style = "umls"
+        self.first_start_index = 1
+        self.max_page_size = 100
 
     def collect_data(self, paginated_url, results_per_page, start_index):
         """
@@ -59,6 +63,7 @@ class UMLSSearchAPI(OntologyAPI):
 
             total_results = data.get("result", {}).get(self.total_results_id, 0)
             logger.debug(f"Total results found: {total_results}")
+            self.last_total_results = total_results
             logger.debug(
                 f"Retrieved {len(results)} results (start_index: {start_index})."
             )
@@ -75,10 +80,14 @@ class UMLSSearchAPI(OntologyAPI):
 
         except Exception as e:
             logger.error(f"Error fetching data from {clean_url(paginated_url)}: {e}")
-            return [], more_results_available
+            return IncompleteResults(), more_results_available
 
         return raw_data, more_results_available
 
+    def next_start_index(self, start_index, results_per_page):
+        """This api pages by page number."""
+        return int(start_index) + 1
+
     def format_keyword(self, keywords):
         """
         Formats the provided keywords for the search query.
@@ -92,7 +101,7 @@ class UMLSSearchAPI(OntologyAPI):
         Example return: "q=brain%20cancer"
         """
 
-        keywords = keywords.replace(" ", "%20")
+        keywords = urllib.parse.quote(keywords, safe="")
 
         keyword_param = f"string={keywords}"
 
@@ -159,7 +168,15 @@ class UMLSSearchAPI(OntologyAPI):
 
         return return_type_param
 
-    def build_url(self, keywords, ontology_list, start_index, results_per_page):
+    def build_url(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
         """
         Constructs the search URL by combining the base URL, formatted keyword, and ontology parameters.
 
@@ -0,0 +1,106 @@
+"""
+Local UMLS API
+
+This script defines the `UMLSLocalSearchAPI` class, an offline alternative to
+`UMLSSearchAPI` that answers searches from the local UMLS store (see
+search_dragon.umls_store). Records are shaped like the UTS search results, so
+harmonization is shared with the UMLS class. No API key is needed.
+
+"""
+
+import urllib.parse
+
+from search_dragon import logger as getlogger
+from search_dragon.external_apis import IncompleteResults
+from search_dragon.external_apis.umls_api import UMLSSearchAPI
+from search_dragon.umls_store import get_umls_store
+
+
+class UMLSLocalSearchAPI(UMLSSearchAPI):
+    def __init__(self):
+        super().__init__()
+        self.base_url = "local://search_dragon/umls"
+        self.api_id = "umls_local"
+        self.api_name = "Local Unified Medical Language System"
+        self.cacheable = False
+
+    def collect_data(self, paginated_url, results_per_page, start_index):
+        """
+        Fetch a single page of data from the local UMLS store.
+
+        Args:
+            paginated_url (str): The url produced by build_url.
+            results_per_page (int): Number of results to fetch in this request.
+            start_index (int): The page number to fetch, starting at 1 as in UTS.
+
+        Returns:
+            Tuple:
+                - raw_data (list): Results from the requested page.
+                - more_results_available (bool): Whether more results are available.
+        """
+        logger = getlogger()
+        results_per_page = int(results_per_page)
+        start_index = max(int(start_index), 1)
+        offset = (start_index - 1) * results_per_page
+
+        try:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(paginated_url).query)
+            keywords = query.get("string", [""])[0]
+            sabs = [s for s in query.get("sabs", [""])[0].split(",") if s]
+
+            raw_data, total_results = get_umls_store().search(
+                keywords, sabs, offset, results_per_page
+            )
+            logger.debug(f"Total results found: {total_results}")
+            self.last_total_results = total_results
+        except Exception as e:
+            logger.error(f"Error fetching data from {paginated_url}: {e}")
+            return IncompleteResults(), False
+
+        more_results_available = offset + results_per_page < total_results
+        return raw_data, more_results_available
+
+    def format_keyword(self, keywords):
+        """
+        Formats the provided keywords for the search query.
+
+        Example return: "string=brain%20cancer"
+        """
+        return f"string={urllib.parse.quote(keywords, safe='')}"
+
+    def format_ontology(self, ontology_list):
+        """
+        Formats the included ontologies into a query parameter for the search URL.
+
+        Example return: "sabs=SNOMEDCT_US,OMIM"
+        """
+        formatted_ontologies = ",".join(o for o in ontology_list or [] if o)
+
+        return f"sabs={formatted_ontologies}"
+
+    def build_url(
+        self,
+        keywords,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri=None,
+        children=False,
+    ):
+        """
+        Constructs the search URL by combining the base URL, formatted keyword, and ontology parameters.
+
+        Args:
+            keywords (str): The search keyword(s).
+            ontology_list (list): The source vocabularies to be included in the search.
+
+        Returns:
+            str: The complete search URL.
+        """
+        params = [
+            self.format_keyword(keywords),
+            self.format_ontology(ontology_list),
+            self.format_start_index(start_index),
+            self.format_results_per_page(results_per_page),
+        ]
+        return f"{self.base_url}?" + "&".join(params)
@@ -0,0 +1,670 @@
+"""
+Local Ontology Store
+
+Ingests ontology term files (OBO flat files or OBO Graphs JSON, which is what
+ROBOT produces when converting OWL) into a SQLite database so that searches
+can be answered without a round trip to OLS. Labels, synonyms, CURIEs and IRIs
+are indexed with FTS5, and the is_a hierarchy is stored along with its
+precomputed transitive closure so descendant, child and subsumption queries are
+single index lookups.
+
+Build an index from the command line:
+
+    dragon_search index hp.obo mondo.json --db ontologies.db
+
+The location of the database defaults to the `SEARCH_DRAGON_LOCAL_DB`
+environment variable, then to `~/.cache/search_dragon/ontologies.db`.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from search_dragon import logger as getlogger
+from search_dragon.support import ftd_ontology_lookup
+
+LOCAL_DB_ENV = "SEARCH_DRAGON_LOCAL_DB"
+DEFAULT_LOCAL_DB = Path.home() / ".cache" / "search_dragon" / "ontologies.db"
+
+OBO_PURL = "http://purl.obolibrary.org/obo/"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    ontology_prefix TEXT NOT NULL,
+    curie TEXT NOT NULL UNIQUE,
+    iri TEXT NOT NULL,
+    label TEXT,
+    description TEXT,
+    synonyms TEXT
+);
+CREATE INDEX IF NOT EXISTS terms_iri ON terms(iri);
+CREATE INDEX IF NOT EXISTS terms_curie_nocase ON terms(curie COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS terms_prefix ON terms(ontology_prefix);
+CREATE VIRTUAL TABLE IF NOT EXISTS term_fts USING fts5(
+    label, synonyms, curie, iri,
+    content='terms', content_rowid='id',
+    tokenize="unicode61 tokenchars ':_'"
+);
+CREATE TABLE IF NOT EXISTS edges (
+    child TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    PRIMARY KEY (parent, child)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_child ON edges(child);
+CREATE TABLE IF NOT EXISTS closure (
+    ancestor INTEGER NOT NULL,
+    descendant INTEGER NOT NULL,
+    PRIMARY KEY (ancestor, descendant)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS closure_descendant ON closure(descendant);
+CREATE TABLE IF NOT EXISTS ontologies (
+    ontology_id TEXT PRIMARY KEY,
+    ontology_prefix TEXT NOT NULL,
+    version TEXT,
+    loaded TEXT,
+    mirrored_at REAL NOT NULL
+);
+"""
+
+# Column weights for bm25, in term_fts column order. Label hits rank first.
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+_obo_tag = re.compile(r"^(?P<tag>[A-Za-z_]+):\s*(?P<value>.*)$")
+_obo_quoted = re.compile(r'^"(?P<text>(?:[^"\\]|\\.)*)"')
+
+
+def curie_to_iri(curie):
+    """Expand an OBO style CURIE (HP:0000118) to its PURL."""
+    return f"{OBO_PURL}{curie.replace(':', '_', 1)}"
+
+
+def iri_to_curie(iri):
+    """Contract an OBO PURL back to a CURIE. Other IRIs are returned as is."""
+    if iri.startswith(OBO_PURL):
+        local = iri[len(OBO_PURL) :]
+        return local.replace("_", ":", 1)
+    return iri
+
+
+def _unquote(value):
+    match = _obo_quoted.match(value)
+    if match:
+        return match.group("text").replace('\\"', '"')
+    return value
+
+
+def _strip_comment(value):
+    # OBO trailing modifiers/comments: "HP:0000001 ! All"
+    return value.split(" !", 1)[0].strip()
+
+
+def parse_obo(path):
+    """
+    Parse the [Term] stanzas of an OBO file.
+
+    Args:
+        path (str): Path to the .obo file.
+
+    Yields:
+        dict: curie, iri, label, description (list), synonyms (list),
+            parents (list of curies) and obsolete (bool) for each term.
+    """
+    term = None
+    with open(path, "rt", encoding="utf-8") as infile:
+        for line in infile:
+            line = line.rstrip("\n")
+            if line.startswith("["):
+                if term is not None:
+                    yield term
+                term = (
+                    {
+                        "curie": None,
+                        "label": None,
+                        "description": [],
+                        "synonyms": [],
+                        "parents": [],
+                        "obsolete": False,
+                    }
+                    if line.strip() == "[Term]"
+                    else None
+                )
+                continue
+            if term is None:
+                continue
+
+            match = _obo_tag.match(line)
+            if not match:
+                continue
+            tag, value = match.group("tag"), match.group("value")
+
+            if tag == "id":
+                term["curie"] = _strip_comment(value)
+            elif tag == "name":
+                term["label"] = value.strip()
+            elif tag == "def":
+                term["description"].append(_unquote(value))
+            elif tag == "synonym":
+                term["synonyms"].append(_unquote(value))
+            elif tag == "is_a":
+                term["parents"].append(_strip_comment(value).split(" {", 1)[0])
+            elif tag == "is_obsolete":
+                term["obsolete"] = value.strip() == "true"
+
+    if term is not None:
+        yield term
+
+
+def parse_obographs(path):
+    """
+    Parse the class nodes of an OBO Graphs JSON file.
+
+    Args:
+        path (str): Path to the .json file.
+
+    Yields:
+        dict: The same term structure produced by parse_obo.
+    """
+    with open(path, "rt", encoding="utf-8") as infile:
+        document = json.load(infile)
+
+    for graph in document.get("graphs", []):
+        parents = {}
+        for edge in graph.get("edges", []):
+            if edge.get("pred") in ("is_a", "rdfs:subClassOf"):
+                parents.setdefault(edge["sub"], []).append(iri_to_curie(edge["obj"]))
+
+        for node in graph.get("nodes", []):
+            if node.get("type", "CLASS") != "CLASS":
+                continue
+            meta = node.get("meta", {})
+            definition = meta.get("definition", {}).get("val")
+            yield {
+                "curie": iri_to_curie(node["id"]),
+                "iri": node["id"],
+                "label": node.get("lbl"),
+                "description": [definition] if definition else [],
+                "synonyms": [s.get("val") for s in meta.get("synonyms", [])],
+                "parents": parents.get(node["id"], []),
+                "obsolete": bool(meta.get("deprecated", False)),
+            }
+
+
+def parse_terms(path):
+    """Choose a parser based on the file extension."""
+    if str(path).endswith(".json"):
+        return parse_obographs(path)
+    return parse_obo(path)
+
+
+def file_prefix(path):
+    """
+    The prefix of the ontology an .obo or OBO Graphs .json file defines, from
+    its ontology header or graph id (http://purl.obolibrary.org/obo/hp.owl
+    => HP), or None when it has neither.
+    """
+    if str(path).endswith(".json"):
+        with open(path, "rt", encoding="utf-8") as infile:
+            graphs = json.load(infile).get("graphs", [])
+        ontology = graphs[0].get("id", "") if graphs else ""
+        ontology = ontology.rstrip("/").rsplit("/", 1)[-1].split(".", 1)[0]
+    else:
+        ontology = ""
+        with open(path, "rt", encoding="utf-8") as infile:
+            for line in infile:
+                if line.startswith("["):
+                    break
+                match = _obo_tag.match(line.rstrip("\n"))
+                if match and match.group("tag") == "ontology":
+                    ontology = match.group("value").strip()
+                    break
+    return ontology.upper() or None
+
+
+class LocalOntologyStore:
+    """
+    SQLite backed store of ontology terms.
+
+    A single connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.getenv(LOCAL_DB_ENV) or DEFAULT_LOCAL_DB
+        self.db_path = Path(db_path)
+        self.lock = threading.RLock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False
+            )
+            self._connection.row_factory = sqlite3.Row
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def ingest(self, path, ontology_data=None, include_obsolete=False):
+        """
+        Load the terms from an ontology file into the store, replacing those
+        of the ontology it defines (see file_prefix), so terms since removed
+        or made obsolete aren't kept.
+
+        Args:
+            path (str): An .obo or OBO Graphs .json file.
+            ontology_data (dict): curie=>system lookup. Terms whose prefix is
+                not in the lookup are skipped, since they can't be harmonized.
+            include_obsolete (bool): Keep terms flagged as obsolete.
+
+        Returns:
+            int: The number of terms written.
+        """
+        prefix = file_prefix(path)
+        written, skipped = self.write_terms(
+            parse_terms(path),
+            ontology_data,
+            include_obsolete,
+            replace=[prefix] if prefix else None,
+        )
+        getlogger().info(f"Indexed {written} terms from {path} ({skipped} skipped)")
+        return written
+
+    def write_terms(self, terms, ontology_data=None, include_obsolete=False, replace=None):
+        """
+        Write term records, in the structure produced by parse_obo, to the
+        store.
+
+        Args:
+            replace (list, optional): Ontology prefixes whose terms, and their
+                edges, are removed first, in the same transaction.
+
+        Returns:
+            Tuple:
+                - written (int): The number of terms written.
+                - skipped (int): The number of terms skipped.
+        """
+        if ontology_data is None:
+            ontology_data = ftd_ontology_lookup()
+
+        written = 0
+        skipped = 0
+        with self.lock, self.connection as conn:
+            if replace:
+                self._delete_prefixes(conn, replace)
+            for term in terms:
+                if not term["curie"] or (term["obsolete"] and not include_obsolete):
+                    skipped += 1
+                    continue
+                ontology_prefix = term["curie"].split(":", 1)[0].upper()
+                if ontology_prefix not in ontology_data:
+                    skipped += 1
+                    continue
+                self._write_term(conn, ontology_prefix, term)
+                written += 1
+
+        return written, skipped
+
+    def _delete_prefixes(self, conn, prefixes):
+        prefixes = [p.upper() for p in prefixes]
+        where = f"ontology_prefix IN ({','.join('?' * len(prefixes))})"
+        # External content FTS tables need the old values to delete a row
+        conn.execute(
+            "INSERT INTO term_fts(term_fts, rowid, label, synonyms, curie, iri) "
+            f"SELECT 'delete', id, label, synonyms, curie, iri FROM terms WHERE {where}",
+            prefixes,
+        )
+        conn.execute(
+            f"DELETE FROM edges WHERE child IN (SELECT curie FROM terms WHERE {where})",
+            prefixes,
+        )
+        removed = conn.execute(f"DELETE FROM terms WHERE {where}", prefixes).rowcount
+        getlogger().debug(f"Removed {removed} terms of {', '.join(prefixes)}")
+
+    def record_ontology(self, ontology_id, ontology_prefix, version, loaded):
+        """Record the version of an ontology mirrored into the store."""
+        with self.lock, self.connection as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ontologies"
+                "(ontology_id, ontology_prefix, version, loaded, mirrored_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (ontology_id.lower(), ontology_prefix.upper(), version, loaded, time.time()),
+            )
+
+    def ontology_info(self, ontology):
+        """
+        Return the mirror metadata for an ontology, by OLS id (hp) or prefix
+        (HP), or None if it hasn't been mirrored.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM ontologies WHERE ontology_id = ? OR ontology_prefix = ?",
+                (ontology.lower(), ontology.upper()),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def mirrored_prefixes(self):
+        """The prefixes of the ontologies recorded as mirrored in full."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT ontology_prefix FROM ontologies"
+            ).fetchall()
+        return [row["ontology_prefix"] for row in rows]
+
+    def curies(self, prefixes=None):
+        """The CURIEs of the terms in the store, optionally of some prefixes only."""
+        sql = "SELECT curie FROM terms"
+        args = []
+        if prefixes:
+            sql += f" WHERE ontology_prefix IN ({','.join('?' * len(prefixes))})"
+            args = [p.upper() for p in prefixes]
+        with self.lock:
+            rows = self.connection.execute(sql, args).fetchall()
+        return [row["curie"] for row in rows]
+
+    def prefixes(self):
+        """The ontology prefixes of the terms in the store."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT ontology_prefix FROM terms"
+            ).fetchall()
+        return [row["ontology_prefix"] for row in rows]
+
+    def terms(self, prefixes=None):
+        """The records of the terms in the store, optionally of some prefixes only."""
+        sql = "SELECT * FROM terms"
+        args = []
+        if prefixes:
+            sql += f" WHERE ontology_prefix IN ({','.join('?' * len(prefixes))})"
+            args = [p.upper() for p in prefixes]
+        with self.lock:
+            rows = self.connection.execute(sql, args).fetchall()
+        return [self.row_to_record(row) for row in rows]
+
+    def build_closure(self):
+        """
+        Recompute the transitive closure of the is_a hierarchy. Must be run
+        after ingesting, since parents may be defined in a later file.
+
+        Returns:
+            int: The number of ancestor/descendant pairs stored.
+        """
+        with self.lock, self.connection as conn:
+            ids = dict(conn.execute("SELECT curie, id FROM terms"))
+            parents = defaultdict(list)
+            for child, parent in conn.execute("SELECT child, parent FROM edges"):
+                if child in ids and parent in ids:
+                    parents[ids[child]].append(ids[parent])
+
+            ancestors = {}
+            visiting = set()
+            for node in ids.values():
+                if node in ancestors:
+                    continue
+                # Iterative post-order walk so deep hierarchies don't hit the
+                # recursion limit. A node's ancestors are found once every
+                # parent's are. Visiting nodes are those on the current path,
+                # and a parent still visiting is a cycle in bad input, which
+                # is broken by treating it as having no ancestors.
+                stack = [(node, False)]
+                while stack:
+                    current, expanded = stack.pop()
+                    if current in ancestors:
+                        continue
+                    if not expanded:
+                        if current in visiting:
+                            continue
+                        visiting.add(current)
+                        stack.append((current, True))
+                        stack.extend(
+                            (p, False)
+                            for p in parents[current]
+                            if p not in ancestors and p not in visiting
+                        )
+                        continue
+                    visiting.discard(current)
+                    found = set()
+                    for parent in parents[current]:
+                        found.add(parent)
+                        found |= ancestors.get(parent, set())
+                    found.discard(current)
+                    ancestors[current] = found
+
+            conn.execute("DELETE FROM closure")
+            conn.executemany(
+                "INSERT INTO closure(ancestor, descendant) VALUES (?, ?)",
+                (
+                    (ancestor, descendant)
+                    for descendant, found in ancestors.items()
+                    for ancestor in found
+                ),
+            )
+            pairs = conn.execute("SELECT COUNT(*) FROM closure").fetchone()[0]
+
+        getlogger().info(f"Hierarchy closure built with {pairs} pairs")
+        return pairs
+
+    def _write_term(self, conn, ontology_prefix, term):
+        iri = term.get("iri") or curie_to_iri(term["curie"])
+        description = "\n".join(d for d in term["description"] if d)
+        synonyms = "\n".join(s for s in term["synonyms"] if s)
+
+        existing = conn.execute(
+            "SELECT id, label, synonyms, curie, iri FROM terms WHERE curie = ?",
+            (term["curie"],),
+        ).fetchone()
+        if existing:
+            # External content FTS tables need the old values to delete a row
+            conn.execute(
+                "INSERT INTO term_fts(term_fts, rowid, label, synonyms, curie, iri) "
+                "VALUES('delete', ?, ?, ?, ?, ?)",
+                tuple(existing),
+            )
+            conn.execute("DELETE FROM terms WHERE id = ?", (existing["id"],))
+            conn.execute("DELETE FROM edges WHERE child = ?", (term["curie"],))
+
+        cursor = conn.execute(
+            "INSERT INTO terms(ontology_prefix, curie, iri, label, description, synonyms) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (ontology_prefix, term["curie"], iri, term["label"], description, synonyms),
+        )
+        conn.execute(
+            "INSERT INTO term_fts(rowid, label, synonyms, curie, iri) VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, term["label"], synonyms, term["curie"], iri),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO edges(child, parent) VALUES (?, ?)",
+            [(term["curie"], parent) for parent in term["parents"]],
+        )
+
+    def _prefix_filter(self, ontology_list):
+        prefixes = [o.upper() for o in ontology_list or [] if o]
+        if not prefixes:
+            return "", []
+        placeholders = ",".join("?" for _ in prefixes)
+        return f" AND t.ontology_prefix IN ({placeholders})", prefixes
+
+    def search(self, keywords, ontology_list=None, start_index=0, results_per_page=10):
+        """
+        Search the store. CURIEs and IRIs are matched exactly, anything else
+        is run as a full-text query over labels, synonyms, CURIEs and IRIs.
+
+        Returns:
+            Tuple:
+                - rows (list): The requested page of term records.
+                - total_results (int): The number of matching terms.
+        """
+        prefix_sql, prefix_args = self._prefix_filter(ontology_list)
+        keywords = keywords.strip()
+
+        if "://" in keywords:
+            where, args = "t.iri = ?", [keywords]
+        elif re.fullmatch(r"[A-Za-z][\w.]*:[^\s:]+", keywords):
+            where, args = "t.curie = ? COLLATE NOCASE", [keywords]
+        else:
+            return self._search_text(
+                keywords, prefix_sql, prefix_args, start_index, results_per_page
+            )
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT t.* FROM terms t WHERE {where}{prefix_sql} "
+                "ORDER BY t.id LIMIT ? OFFSET ?",
+                args + prefix_args + [results_per_page, start_index],
+            ).fetchall()
+            total = self.connection.execute(
+                f"SELECT COUNT(*) FROM terms t WHERE {where}{prefix_sql}",
+                args + prefix_args,
+            ).fetchone()[0]
+        return [self.row_to_record(row) for row in rows], total
+
+    def _search_text(
+        self, keywords, prefix_sql, prefix_args, start_index, results_per_page
+    ):
+        tokens = [t for t in re.split(r"[^\w:]+", keywords) if t]
+        if not tokens:
+            return [], 0
+        # Quote every token so FTS syntax in user input is never interpreted,
+        # and let the last token prefix match for partially typed words.
+        match = " ".join(f'"{t}"' for t in tokens) + "*"
+        weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT t.* FROM term_fts JOIN terms t ON t.id = term_fts.rowid "
+                f"WHERE term_fts MATCH ?{prefix_sql} "
+                f"ORDER BY bm25(term_fts, {weights}) LIMIT ? OFFSET ?",
+                [match] + prefix_args + [results_per_page, start_index],
+            ).fetchall()
+            total = self.connection.execute(
+                "SELECT COUNT(*) FROM term_fts JOIN terms t ON t.id = term_fts.rowid "
+                f"WHERE term_fts MATCH ?{prefix_sql}",
+                [match] + prefix_args,
+            ).fetchone()[0]
+        return [self.row_to_record(row) for row in rows], total
+
+    def _term_id(self, code):
+        """Resolve a CURIE or IRI to its row id, or None."""
+        if "://" in code:
+            sql = "SELECT id FROM terms WHERE iri = ?"
+        else:
+            sql = "SELECT id FROM terms WHERE curie = ? COLLATE NOCASE"
+        row = self.connection.execute(sql, (code,)).fetchone()
+        return row[0] if row else None
+
+    def children(self, iri):
+        """Return the records of the direct is_a children of a term."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT c.* FROM terms p "
+                "JOIN edges e ON e.parent = p.curie "
+                "JOIN terms c ON c.curie = e.child "
+                "WHERE p.iri = ? ORDER BY c.curie",
+                (iri,),
+            ).fetchall()
+        return [self.row_to_record(row) for row in rows]
+
+    def descendants(self, iri):
+        """Return the records of every term below a term in the hierarchy."""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT d.* FROM terms a "
+                "JOIN closure c ON c.ancestor = a.id "
+                "JOIN terms d ON d.id = c.descendant "
+                "WHERE a.iri = ? ORDER BY d.curie",
+                (iri,),
+            ).fetchall()
+        return [self.row_to_record(row) for row in rows]
+
+    def is_descendant(self, code, ancestor):
+        """
+        Whether `code` is below `ancestor` in the hierarchy. Both may be given
+        as a CURIE or an IRI.
+        """
+        with self.lock:
+            code_id = self._term_id(code)
+            ancestor_id = self._term_id(ancestor)
+            if code_id is None or ancestor_id is None:
+                return False
+            row = self.connection.execute(
+                "SELECT 1 FROM closure WHERE ancestor = ? AND descendant = ?",
+                (ancestor_id, code_id),
+            ).fetchone()
+        return row is not None
+
+    def get_term(self, iri):
+        """Return a single term record by IRI, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM terms WHERE iri = ?", (iri,)
+            ).fetchone()
+        return self.row_to_record(row) if row else None
+
+    def row_to_record(self, row):
+        return {
+            "curie": row["curie"],
+            "iri": row["iri"],
+            "label": row["label"],
+            "description": row["description"].split("\n") if row["description"] else [],
+            "synonyms": row["synonyms"].split("\n") if row["synonyms"] else [],
+            "ontology_prefix": row["ontology_prefix"],
+        }
+
+
+_local_store = None
+
+
+def get_local_store(db_path=None):
+    """Establish a singleton store that can be reused by multiple components."""
+    global _local_store
+    if _local_store is None or (
+        db_path is not None and Path(db_path) != _local_store.db_path
+    ):
+        _local_store = LocalOntologyStore(db_path)
+    return _local_store
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search index",
+        description="Build the local ontology search index from OBO or OBO Graphs JSON files.",
+    )
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="One or more .obo or OBO Graphs .json files to index",
+    )
+    parser.add_argument(
+        "--db",
+        required=False,
+        default=None,
+        help=f"Path to the index database. Defaults to ${LOCAL_DB_ENV} or {DEFAULT_LOCAL_DB}",
+    )
+    parser.add_argument(
+        "--include_obsolete",
+        required=False,
+        action="store_true",
+        help="Index terms marked as obsolete",
+    )
+    args = parser.parse_args(args)
+
+    getlogger("search")
+    store = get_local_store(args.db)
+    onto_data = ftd_ontology_lookup()
+    total = 0
+    for path in args.files:
+        total += store.ingest(path, onto_data, include_obsolete=args.include_obsolete)
+    store.build_closure()
+    getlogger().info(f"{total} terms indexed into {store.db_path}")
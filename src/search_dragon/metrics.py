@@ -0,0 +1,219 @@
+"""
+Metrics.
+
+Counts what search-dragon asks of the upstream apis and how they answer, per
+api id, so degradation (e.g. of OLS) can be alerted on and concurrency sized.
+Metrics are exported in the Prometheus text format, by the search server at
+GET /metrics, or written to a file for the node exporter textfile collector
+when `SEARCH_DRAGON_METRICS_FILE` is set (at the end of a dragon_search run,
+and when the server stops).
+
+    search_dragon_upstream_requests_total{api,status}   requests by HTTP status ("error" when none)
+    search_dragon_upstream_request_seconds{api}         request latency histogram
+    search_dragon_upstream_response_bytes_total{api}    response body bytes
+    search_dragon_cache_requests_total{api,result}      hit, stale_hit, miss or negative_hit per api query
+    search_dragon_api_records_total{api}                raw records returned per api
+    search_dragon_prefiltered_total{api}                code searches skipped by a code filter
+    search_dragon_expansion_cache_requests_total{ontology,result}  hit or miss per descendant expansion
+    search_dragon_search_seconds{apis}                  run_search latency histogram
+    search_dragon_search_results_total{apis}            records returned by run_search
+    search_dragon_cache_entries                         entries in the result cache
+    search_dragon_negative_cache_entries                unexpired entries in the negative cache
+    search_dragon_scheduler_queue_depth{host,priority}  requests waiting for a slot
+    search_dragon_scheduler_wait_seconds{host,priority} time waited for a slot histogram
+"""
+
+import os
+import threading
+
+from search_dragon.cache import get_result_cache
+from search_dragon.negative_cache import get_negative_cache
+
+METRICS_FILE_ENV = "SEARCH_DRAGON_METRICS_FILE"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# name => (type, help)
+METRICS = {
+    "search_dragon_upstream_requests_total": (
+        COUNTER,
+        "Requests made to upstream apis, by HTTP status.",
+    ),
+    "search_dragon_upstream_request_seconds": (
+        HISTOGRAM,
+        "Latency of upstream api requests.",
+    ),
+    "search_dragon_upstream_response_bytes_total": (
+        COUNTER,
+        "Bytes received from upstream apis.",
+    ),
+    "search_dragon_cache_requests_total": (
+        COUNTER,
+        "Api queries answered from the result cache (hit), an expired entry being refreshed (stale_hit), the negative cache (negative_hit) or upstream (miss).",
+    ),
+    "search_dragon_api_records_total": (
+        COUNTER,
+        "Raw records returned by each api.",
+    ),
+    "search_dragon_prefiltered_total": (
+        COUNTER,
+        "Searches for codes ruled out by a known code filter.",
+    ),
+    "search_dragon_expansion_cache_requests_total": (
+        COUNTER,
+        "Descendant expansions answered from the expansion cache (hit) or upstream (miss).",
+    ),
+    "search_dragon_search_seconds": (
+        HISTOGRAM,
+        "Latency of run_search.",
+    ),
+    "search_dragon_search_results_total": (
+        COUNTER,
+        "Records returned by run_search.",
+    ),
+    "search_dragon_cache_entries": (
+        GAUGE,
+        "Entries in the result cache.",
+    ),
+    "search_dragon_negative_cache_entries": (
+        GAUGE,
+        "Unexpired entries in the negative cache.",
+    ),
+    "search_dragon_scheduler_queue_depth": (
+        GAUGE,
+        "Upstream requests waiting for a slot.",
+    ),
+    "search_dragon_scheduler_wait_seconds": (
+        HISTOGRAM,
+        "Time upstream requests waited for a slot.",
+    ),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) => number, or [bucket counts, sum, count]
+        self.gauges = {}  # name => callable returning the current value
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        with self.lock:
+            self.values[(name, _label_key(labels))] = value
+
+    def gauge(self, name, read):
+        """Report read() as the value of the gauge when metrics are rendered."""
+        self.gauges[name] = read
+
+    def record_request(self, api_id, status, seconds, size=0):
+        """Record one upstream request. status is the HTTP status or "error"."""
+        self.inc("search_dragon_upstream_requests_total", api=api_id, status=status)
+        self.observe("search_dragon_upstream_request_seconds", seconds, api=api_id)
+        if size:
+            self.inc("search_dragon_upstream_response_bytes_total", size, api=api_id)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self.lock:
+            values = {
+                key: [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+                for key, value in self.values.items()
+            }
+        for name, read in self.gauges.items():
+            try:
+                values[(name, ())] = read()
+            except Exception:
+                pass
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            series = sorted(
+                (labels, value) for (n, labels), value in values.items() if n == name
+            )
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in series:
+                if metric_type != HISTOGRAM:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                bucket_counts, total, count = value
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    bucket_labels = labels + (("le", _format_value(float(bound))),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {bucket_count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        """
+        Write the metrics to path, or to `SEARCH_DRAGON_METRICS_FILE`. The
+        file is replaced atomically so a collector never reads it half
+        written. Does nothing when no path is configured.
+        """
+        path = path or os.getenv(METRICS_FILE_ENV)
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wt", encoding="utf-8") as outfile:
+            outfile.write(self.render())
+        os.replace(tmp_path, path)
+
+
+_metrics = None
+
+
+def get_metrics():
+    """Establish a singleton metrics registry that can be reused by multiple components."""
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+        _metrics.gauge("search_dragon_cache_entries", lambda: len(get_result_cache()))
+        _metrics.gauge(
+            "search_dragon_negative_cache_entries", lambda: len(get_negative_cache())
+        )
+    return _metrics
@@ -0,0 +1,222 @@
+"""
+OLS Ontology Mirror
+
+Pulls the complete term list of an ontology from OLS into the local ontology
+store, recording the ontology version and load date, so ontologies that are
+expanded repeatedly can be answered locally. Pages are fetched concurrently
+after the first page reports the page count.
+
+The class listing of the OLS v2 api is used, since unlike the v1 terms listing
+each entry carries its direct parents.
+
+    dragon_search mirror hp mondo --workers 8
+
+The OLS clients answer from the mirror, when the local store exists, for
+ontologies mirrored within the last `SEARCH_DRAGON_MIRROR_MAX_AGE` days
+(default 7).
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from search_dragon import logger as getlogger
+from search_dragon.external_apis import OntologyAPI
+from search_dragon.local_store import get_local_store
+from search_dragon.negative_cache import get_negative_cache
+from search_dragon.support import ftd_ontology_lookup
+
+OLS_BASE_URL = "https://www.ebi.ac.uk/ols4/api"
+MIRROR_MAX_AGE_ENV = "SEARCH_DRAGON_MIRROR_MAX_AGE"
+DEFAULT_MIRROR_MAX_AGE = 7  # days
+MAX_PAGE_SIZE = 500
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _texts(value):
+    """OLS v2 fields may be a string, a list of strings or a list of {value}."""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [v.get("value") if isinstance(v, dict) else v for v in value if v]
+
+
+def _parent_iris(value):
+    return [v.get("value") if isinstance(v, dict) else v for v in value or []]
+
+
+def to_term(element):
+    """Convert an OLS v2 class element to the local store term structure."""
+    iri = element.get("iri")
+    curie = element.get("curie") or (element.get("shortForm") or "").replace("_", ":", 1)
+    return {
+        "curie": curie,
+        "iri": iri,
+        "label": _first(element.get("label")),
+        "description": _texts(element.get("definition")),
+        "synonyms": _texts(element.get("synonym")),
+        "parents": _parent_iris(element.get("directParent")),
+        "obsolete": bool(element.get("isObsolete", False)),
+    }
+
+
+class OntologyMirror:
+    def __init__(self, store=None, base_url=OLS_BASE_URL, page_size=MAX_PAGE_SIZE, workers=8):
+        self.store = store or get_local_store()
+        self.base_url = base_url.rstrip("/")
+        self.page_size = min(int(page_size), MAX_PAGE_SIZE)
+        self.workers = workers
+        self.api = OntologyAPI(
+            base_url=self.base_url, api_id="ols_mirror", api_name="OLS Mirror"
+        )
+
+    def fetch_page(self, ontology_id, page):
+        url = (
+            f"{self.base_url}/v2/ontologies/{ontology_id}/classes"
+            f"?page={page}&size={self.page_size}"
+        )
+        data = self.api.fetch_data(url)
+        if data is None:
+            raise ValueError(f"Failed to fetch page {page} of {ontology_id}")
+        return data
+
+    def mirror(self, ontology_id, ontology_data=None):
+        """
+        Mirror a single ontology into the store.
+
+        Args:
+            ontology_id (str): The OLS ontology id, e.g. hp.
+            ontology_data (dict): curie=>system lookup.
+
+        Returns:
+            int: The number of terms written.
+        """
+        logger = getlogger()
+        ontology_id = ontology_id.lower()
+        start = time.time()
+
+        metadata = self.api.fetch_data(f"{self.base_url}/ontologies/{ontology_id}")
+        if metadata is None:
+            raise ValueError(f"Ontology '{ontology_id}' was not found in OLS")
+        config = metadata.get("config", {})
+        ontology_prefix = config.get("preferredPrefix") or ontology_id.upper()
+        version = config.get("version") or metadata.get("version")
+        loaded = metadata.get("loaded") or metadata.get("updated")
+
+        first = self.fetch_page(ontology_id, 0)
+        total_pages = first.get("totalPages", 1)
+        logger.info(
+            f"Mirroring {ontology_id} ({first.get('totalElements', 0)} classes, {total_pages} pages)"
+        )
+
+        # Parent links are IRIs in OLS, while the store links by CURIE.
+        iri_to_curie = {}
+        terms = []
+
+        def collect(page_data):
+            for element in page_data.get("elements", []):
+                term = to_term(element)
+                iri_to_curie[term["iri"]] = term["curie"]
+                terms.append(term)
+
+        collect(first)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for page_data in executor.map(
+                lambda page: self.fetch_page(ontology_id, page), range(1, total_pages)
+            ):
+                collect(page_data)
+
+        for term in terms:
+            term["parents"] = [iri_to_curie[p] for p in term["parents"] if p in iri_to_curie]
+
+        # Terms removed upstream, or made obsolete, go with the old version
+        written, skipped = self.store.write_terms(
+            terms, ontology_data, replace=[ontology_prefix]
+        )
+        self.store.build_closure()
+        self.store.record_ontology(ontology_id, ontology_prefix, version, loaded)
+        # Searches that found nothing in the old version may not now
+        get_negative_cache().purge([ontology_id, ontology_prefix])
+
+        logger.info(
+            f"Mirrored {written} terms of {ontology_id} version {version} "
+            f"({skipped} skipped) in {time.time() - start:.1f}s"
+        )
+        return written
+
+
+def mirror_max_age():
+    """The age, in seconds, after which a mirrored ontology is no longer used."""
+    days = float(os.getenv(MIRROR_MAX_AGE_ENV) or DEFAULT_MIRROR_MAX_AGE)
+    return days * 24 * 60 * 60
+
+
+def fresh_mirror(ontology_list):
+    """
+    Return the local store if every ontology in the list has been mirrored
+    recently enough to answer from it, otherwise None.
+
+    Args:
+        ontology_list (list or str): OLS ontology ids or prefixes.
+    """
+    if isinstance(ontology_list, str):
+        ontology_list = [ontology_list]
+    ontology_list = [o for o in ontology_list or [] if o]
+    if not ontology_list:
+        return None
+
+    store = get_local_store()
+    if not store.db_path.exists():
+        return None
+
+    now = time.time()
+    for ontology in ontology_list:
+        info = store.ontology_info(ontology)
+        if info is None or now - info["mirrored_at"] > mirror_max_age():
+            return None
+    return store
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search mirror",
+        description="Mirror complete ontologies from OLS into the local ontology store.",
+    )
+    parser.add_argument(
+        "ontologies", nargs="+", help="OLS ontology ids to mirror, e.g. hp mondo"
+    )
+    parser.add_argument(
+        "--db",
+        required=False,
+        default=None,
+        help="Path to the local ontology store",
+    )
+    parser.add_argument(
+        "--base_url",
+        required=False,
+        default=OLS_BASE_URL,
+        help="The OLS api root",
+    )
+    parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=8,
+        help="How many pages to fetch concurrently",
+    )
+    args = parser.parse_args(args)
+
+    getlogger("search")
+    mirror = OntologyMirror(
+        store=get_local_store(args.db), base_url=args.base_url, workers=args.workers
+    )
+    onto_data = ftd_ontology_lookup()
+    for ontology_id in args.ontologies:
+        mirror.mirror(ontology_id, onto_data)
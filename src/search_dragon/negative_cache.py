@@ -0,0 +1,208 @@
+"""
+Negative result cache.
+
+Unknown and retired codes come back empty from every api, and callers such as
+do_search ask for the same codes on every run. The result cache only keeps
+results, so the queries that found nothing are remembered here instead, per
+normalized query (api, keyword, ontology filter, page), for a shorter time
+than results: `SEARCH_DRAGON_NEGATIVE_CACHE_TTL` seconds (default 900, 0
+disables). Failed requests also come back empty (see IncompleteResults) and
+are never recorded.
+
+The entries are kept in an in-memory SQLite database, for the life of the
+process. Setting `SEARCH_DRAGON_NEGATIVE_DB` to a path keeps them there
+instead, so they are shared by the search server and separate dragon_search
+runs.
+
+Negatives for an ontology should be purged when it is updated. Mirroring an
+ontology does so; otherwise
+
+    dragon_search purge -o HP,MONDO
+
+or POST /purge on the search server.
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from search_dragon import logger as getlogger
+
+NEGATIVE_DB_ENV = "SEARCH_DRAGON_NEGATIVE_DB"
+IN_MEMORY = ":memory:"
+NEGATIVE_TTL_ENV = "SEARCH_DRAGON_NEGATIVE_CACHE_TTL"
+DEFAULT_NEGATIVE_TTL = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS negatives (
+    query TEXT PRIMARY KEY,
+    api_id TEXT NOT NULL,
+    ontologies TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS negatives_expires_at ON negatives(expires_at);
+"""
+
+
+def _ontologies(ontology_list):
+    """The ontology filter as stored, e.g. ",HP,MONDO," so it can be matched with LIKE."""
+    if isinstance(ontology_list, str):
+        ontology_list = [ontology_list]
+    ontologies = sorted({o.upper() for o in ontology_list or [] if o})
+    return f",{','.join(ontologies)},"
+
+
+class NegativeCache:
+    """
+    SQLite backed record of queries that returned nothing, in memory unless
+    db_path is given.
+
+    A single connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path=None, ttl=None):
+        if db_path is None:
+            db_path = os.getenv(NEGATIVE_DB_ENV) or IN_MEMORY
+        if ttl is None:
+            ttl = float(os.getenv(NEGATIVE_TTL_ENV) or DEFAULT_NEGATIVE_TTL)
+        self.db_path = str(db_path)
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self._connection = None
+        self.hits = 0
+        self.stored = 0
+        self.purged = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            if self.db_path != IN_MEMORY:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def contains(self, key):
+        """Whether the query identified by key recently returned nothing."""
+        if not self.enabled:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM negatives WHERE query = ? AND expires_at > ?",
+                (repr(key), time.time()),
+            ).fetchone()
+            if row is not None:
+                self.hits += 1
+        return row is not None
+
+    def add(self, key, api_id, ontology_list):
+        """Record that the query identified by key returned nothing."""
+        if not self.enabled:
+            return
+        with self.lock, self.connection as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO negatives(query, api_id, ontologies, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (repr(key), api_id, _ontologies(ontology_list), time.time() + self.ttl),
+            )
+            self.stored += 1
+
+    def purge(self, ontologies=None, api_id=None):
+        """
+        Forget negatives, along with any expired ones.
+
+        Args:
+            ontologies (list, optional): Only those whose ontology filter
+                includes one of these ontologies (or had no filter).
+            api_id (str, optional): Only those of this api.
+
+        Returns:
+            int: The number of negatives removed.
+        """
+        where = ["1"]
+        args = []
+        if ontologies:
+            matches = ["ontologies = ','"]
+            for ontology in ontologies:
+                matches.append("ontologies LIKE ?")
+                args.append(f"%,{ontology.upper()},%")
+            where.append(f"({' OR '.join(matches)})")
+        if api_id:
+            where.append("api_id = ?")
+            args.append(api_id)
+
+        with self.lock, self.connection as conn:
+            removed = conn.execute(
+                f"DELETE FROM negatives WHERE {' AND '.join(where)}", args
+            ).rowcount
+            conn.execute("DELETE FROM negatives WHERE expires_at <= ?", (time.time(),))
+            self.purged += removed
+        getlogger().debug(f"Purged {removed} negative cache entries")
+        return removed
+
+    def __len__(self):
+        if not self.enabled:
+            return 0
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM negatives WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+
+_negative_cache = None
+
+
+def get_negative_cache(db_path=None):
+    """Establish a singleton negative cache that can be reused by multiple components."""
+    global _negative_cache
+    if _negative_cache is None or (
+        db_path is not None and str(db_path) != _negative_cache.db_path
+    ):
+        _negative_cache = NegativeCache(db_path)
+    return _negative_cache
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search purge",
+        description="Forget cached empty results, e.g. after ontologies are updated.",
+    )
+    parser.add_argument(
+        "-o",
+        "--ontologies",
+        required=False,
+        default=None,
+        help="Only purge searches of these ontology prefixes. Delimeter ,",
+    )
+    parser.add_argument(
+        "--search_api",
+        required=False,
+        default=None,
+        help="Only purge searches of this api",
+    )
+    parser.add_argument(
+        "--db",
+        required=False,
+        default=None,
+        help=f"Path to the negative cache. Defaults to ${NEGATIVE_DB_ENV}",
+    )
+    args = parser.parse_args(args)
+    if not (args.db or os.getenv(NEGATIVE_DB_ENV)):
+        parser.error(
+            f"--db or ${NEGATIVE_DB_ENV} is required, the negative cache of other runs is in memory"
+        )
+
+    ontologies = [o.strip() for o in args.ontologies.split(",")] if args.ontologies else None
+    removed = get_negative_cache(args.db).purge(ontologies, args.search_api)
+    print(f"Purged {removed} negative cache entries")
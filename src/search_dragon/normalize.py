@@ -0,0 +1,108 @@
+"""
+Query normalization.
+
+Equivalent lookups reach the APIs under several spellings (HP:0001, HPO:0001,
+hp:0001, "brain cancer" and "brain%20cancer"). Every query is reduced to a
+canonical form per API before urls are built, and the canonical form is used
+as the result cache key, so equivalent lookups share one upstream call.
+"""
+
+import re
+import urllib.parse
+
+from search_dragon.support import ftd_ontology_lookup, prefix_aliases
+
+_curie = re.compile(r"^(?P<prefix>[A-Za-z][A-Za-z0-9_]*):(?P<local>(?!//).+)$")
+
+_aliases = None
+_known_prefixes = None
+
+
+def _lookups():
+    global _aliases, _known_prefixes
+    if _aliases is None:
+        _aliases = prefix_aliases()
+        _known_prefixes = set(ftd_ontology_lookup())
+    return _aliases, _known_prefixes
+
+
+def normalize_keyword(keyword, curie_style="ols"):
+    """
+    Return the canonical spelling of a search keyword for an API.
+
+    Percent-encoding is decoded and whitespace collapsed. For CURIEs the
+    prefix is rewritten using the prefix alias table, or upper cased when it
+    is a known ontology prefix.
+
+    Args:
+        keyword (str): The keyword as given by the caller.
+        curie_style (str): The column of the alias table the API uses
+            ("ols" or "umls").
+
+    Returns:
+        str: The canonical keyword.
+    """
+    if keyword is None:
+        return keyword
+    keyword = " ".join(urllib.parse.unquote(keyword).split())
+
+    match = _curie.match(keyword)
+    if not match:
+        return keyword
+
+    aliases, known_prefixes = _lookups()
+    prefix = match.group("prefix").upper()
+    local = match.group("local")
+
+    if prefix in aliases:
+        canonical = aliases[prefix].get(curie_style, prefix)
+        return f"{canonical}:{local}" if canonical else local
+    if prefix in known_prefixes:
+        return f"{prefix}:{local}"
+    return keyword
+
+
+def descendant_ontology(code):
+    """The OLS ontology id a code belongs to, e.g. SNOMEDCT:123 => snomed."""
+    return normalize_keyword(code, "ols").split(":", 1)[0].lower()
+
+
+def normalize_ontologies(ontology_list):
+    """
+    Return the ontology filter in canonical form: a sorted list without
+    blanks or duplicates. Single ontology strings (descendants) are kept as
+    a string.
+    """
+    if ontology_list is None or isinstance(ontology_list, str):
+        return ontology_list
+    return sorted({o.strip() for o in ontology_list if o and o.strip()})
+
+
+def query_key(
+    api_id,
+    keyword,
+    ontology_list,
+    start_index,
+    results_per_page,
+    iri=None,
+    children=False,
+    fetch_all=False,
+    max_results=None,
+):
+    """
+    The key identifying one upstream request. Arguments are expected to be
+    normalized already. Fetch-all requests don't depend on the page.
+    """
+    if isinstance(ontology_list, list):
+        ontology_list = tuple(ontology_list)
+    if fetch_all:
+        return (api_id, keyword, ontology_list, "all", max_results, iri, bool(children))
+    return (
+        api_id,
+        keyword,
+        ontology_list,
+        int(start_index),
+        int(results_per_page),
+        iri,
+        bool(children),
+    )
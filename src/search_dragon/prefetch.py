@@ -0,0 +1,75 @@
+"""
+Background prefetch.
+
+After a page of results is served, the following pages can be fetched in the
+background so they are already in the result cache when the caller asks for
+them. Prefetching is opt-in per search (run_search(..., prefetch=depth)) and
+the number of prefetches running at once is capped for the whole process by
+`SEARCH_DRAGON_PREFETCH_IN_FLIGHT` (default 4). Prefetches beyond the cap are
+dropped rather than queued, since a late prefetch is of no use.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from search_dragon import logger as getlogger
+
+PREFETCH_IN_FLIGHT_ENV = "SEARCH_DRAGON_PREFETCH_IN_FLIGHT"
+DEFAULT_PREFETCH_IN_FLIGHT = 4
+
+
+class Prefetcher:
+    def __init__(self, max_in_flight=None):
+        if max_in_flight is None:
+            max_in_flight = int(
+                os.getenv(PREFETCH_IN_FLIGHT_ENV) or DEFAULT_PREFETCH_IN_FLIGHT
+            )
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="dragon-prefetch"
+        )
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.scheduled = 0
+        self.dropped = 0
+
+    def schedule(self, key, fetch):
+        """
+        Run fetch in the background unless the same key is already pending or
+        the in-flight limit has been reached.
+
+        Returns:
+            bool: Whether the prefetch was scheduled.
+        """
+        with self.lock:
+            if key in self.pending:
+                return False
+            if len(self.pending) >= self.max_in_flight:
+                self.dropped += 1
+                return False
+            self.pending.add(key)
+            self.scheduled += 1
+
+        def run():
+            try:
+                fetch()
+            except Exception as e:
+                getlogger().debug(f"Prefetch of {key} failed: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+        self.executor.submit(run)
+        return True
+
+
+_prefetcher = None
+
+
+def get_prefetcher():
+    """Establish a singleton prefetcher that can be reused by multiple components."""
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = Prefetcher()
+    return _prefetcher
@@ -4,18 +4,34 @@ Generate the final result response, and any final validation.
 
 import re
 from collections import Counter
+from itertools import zip_longest
 
 from search_dragon import logger as getlogger
+from search_dragon.normalize import normalize_keyword
 
 
 def generate_response(
-    data, search_url, more_results_available, api_instances, descendants=False
+    data,
+    search_url,
+    more_results_available,
+    api_instances,
+    descendants=False,
+    limit=None,
 ):
-    getlogger().info(f"Count fetched_data {len(data)}")
+    """
+    Args:
+        data (list): Each api's harmonized results, in api order.
+        limit (int, optional): Return at most this many records.
+    """
+    # Invalid records are dropped per api before merging, so they neither
+    # take places within the limit nor absorb valid duplicates from other apis
+    curated = [curate_data(api_data, descendants) for api_data in data]
+    cleaned_data, truncated = merge_results(curated, limit)
+    more_results_available = more_results_available or truncated
 
-    ontology_counts, results_count = get_code_counts(data)
+    getlogger().info(f"Count fetched_data {len(cleaned_data)}")
 
-    cleaned_data = curate_data(data, descendants)
+    ontology_counts, results_count = get_code_counts(cleaned_data)
 
     clean_search_url = clean_url(search_url)
 
@@ -29,6 +45,86 @@ def generate_response(
     return structured_data
 
 
+def record_keys(record):
+    """
+    The keys a record is recognised by across apis: its IRI, ignoring the
+    scheme (MONDO is served as http and https), and its normalized CURIE.
+    Bare codes (e.g. UMLS CUIs) are only matched by IRI.
+    """
+    keys = []
+    iri = (record.get("code_iri") or "").strip()
+    if iri:
+        keys.append(("iri", re.sub(r"^https?://", "", iri)))
+    code = (record.get("code") or "").strip()
+    if ":" in code:
+        keys.append(("curie", normalize_keyword(code, "ols").upper()))
+    return keys
+
+
+def merge_record(kept, duplicate):
+    """Fill the fields the kept record lacks from a duplicate of it."""
+    missing = [field for field, value in kept.items() if value in (None, "", [])]
+    missing += [field for field in duplicate if field not in kept]
+    if not missing:
+        return kept
+    merged = dict(kept)
+    for field in missing:
+        if duplicate.get(field) not in (None, "", []):
+            merged[field] = duplicate[field]
+    return merged
+
+
+def merge_results(results_by_api, limit=None):
+    """
+    Merge the harmonized results of several apis into one ranked list.
+
+    Each api's results are already ranked and deduplicated, so they are
+    merged k-way by rank (every api's first result, then every api's second,
+    ...) and the selection stops after limit records. A record whose IRI or
+    CURIE was already selected is merged into that record instead.
+
+    Args:
+        results_by_api (list): Each api's harmonized results.
+        limit (int, optional): Maximum number of records to select.
+
+    Returns:
+        Tuple:
+            - merged (list): The selected records.
+            - truncated (bool): Whether unselected records remain.
+    """
+    if len(results_by_api) == 1:
+        data = results_by_api[0]
+        if limit and len(data) > limit:
+            return data[:limit], True
+        return data, False
+
+    merged = []
+    positions = {}  # record key => position in merged
+    duplicates = 0
+    for rank in zip_longest(*results_by_api):
+        for record in rank:
+            if record is None:
+                continue
+            keys = record_keys(record)
+            position = next((positions[k] for k in keys if k in positions), None)
+            if position is not None:
+                merged[position] = merge_record(merged[position], record)
+                duplicates += 1
+            elif limit and len(merged) >= limit:
+                getlogger().debug(
+                    f"Records({duplicates}) were merged as duplicates across apis."
+                )
+                return merged, True
+            else:
+                position = len(merged)
+                merged.append(record)
+            for key in keys:
+                positions.setdefault(key, position)
+
+    getlogger().debug(f"Records({duplicates}) were merged as duplicates across apis.")
+    return merged, False
+
+
 def get_code_counts(data):
     """
     Count occurrences of each ontology in the code field of the data.
@@ -0,0 +1,172 @@
+"""
+Request scheduler.
+
+Every upstream request made by fetch_data takes a slot from the scheduler for
+its host first. Each host has at most `SEARCH_DRAGON_HOST_CONCURRENCY`
+(default 8) requests in flight, and `SEARCH_DRAGON_INTERACTIVE_RESERVE`
+(default 2) of those slots are kept for interactive requests, so a bulk job
+can't take all of them.
+
+Requests are interactive unless made inside
+
+    with scheduling(BULK, job="nightly"):
+        do_search(...)
+
+Waiting interactive requests always go first. Waiting requests of the same
+class are served round robin between jobs, so one large job doesn't hold up
+the others. The priority is captured when api instances are created
+(OntologyAPI.__init__), so the page and prefetch threads of a search keep it.
+"""
+
+import contextvars
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from search_dragon.metrics import get_metrics
+
+HOST_CONCURRENCY_ENV = "SEARCH_DRAGON_HOST_CONCURRENCY"
+INTERACTIVE_RESERVE_ENV = "SEARCH_DRAGON_INTERACTIVE_RESERVE"
+DEFAULT_HOST_CONCURRENCY = 8
+DEFAULT_INTERACTIVE_RESERVE = 2
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)  # highest first
+
+_scheduling = contextvars.ContextVar(
+    "search_dragon_scheduling", default=(INTERACTIVE, INTERACTIVE)
+)
+
+
+@contextmanager
+def scheduling(priority, job=None):
+    """Make the requests of searches started in this block priority class requests of job."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'")
+    token = _scheduling.set((priority, job or priority))
+    try:
+        yield
+    finally:
+        _scheduling.reset(token)
+
+
+def current_scheduling():
+    """The (priority, job) requests made here are scheduled with."""
+    return _scheduling.get()
+
+
+class _Waiter:
+    def __init__(self):
+        self.admitted = threading.Event()
+        self.queued_at = time.monotonic()
+
+
+class HostScheduler:
+    """Slots for the requests to one host."""
+
+    def __init__(self, host, limit, reserve):
+        self.host = host
+        self.limit = max(1, limit)
+        self.bulk_limit = max(1, self.limit - reserve)
+        self.lock = threading.Lock()
+        self.active = {priority: 0 for priority in PRIORITIES}
+        # priority => job => waiters, jobs in round robin order
+        self.queues = {priority: OrderedDict() for priority in PRIORITIES}
+
+    def depth(self, priority):
+        return sum(len(waiters) for waiters in self.queues[priority].values())
+
+    def _can_admit(self, priority):
+        if sum(self.active.values()) >= self.limit:
+            return False
+        return priority == INTERACTIVE or self.active[BULK] < self.bulk_limit
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue and self._can_admit(priority):
+                job, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                queue.move_to_end(job)
+                if not waiters:
+                    del queue[job]
+                self.active[priority] += 1
+                waiter.admitted.set()
+            if queue:
+                # Lower classes wait for this one
+                break
+
+    def _report(self, priority):
+        get_metrics().set(
+            "search_dragon_scheduler_queue_depth",
+            self.depth(priority),
+            host=self.host,
+            priority=priority,
+        )
+
+    def acquire(self, priority, job):
+        waiter = _Waiter()
+        with self.lock:
+            self.queues[priority].setdefault(job, deque()).append(waiter)
+            self._dispatch()
+            self._report(priority)
+        waiter.admitted.wait()
+        get_metrics().observe(
+            "search_dragon_scheduler_wait_seconds",
+            time.monotonic() - waiter.queued_at,
+            host=self.host,
+            priority=priority,
+        )
+
+    def release(self, priority):
+        with self.lock:
+            self.active[priority] -= 1
+            self._dispatch()
+            for queued_priority in PRIORITIES:
+                self._report(queued_priority)
+
+
+class RequestScheduler:
+    def __init__(self, limit=None, reserve=None):
+        if limit is None:
+            limit = int(os.getenv(HOST_CONCURRENCY_ENV) or DEFAULT_HOST_CONCURRENCY)
+        if reserve is None:
+            reserve = int(
+                os.getenv(INTERACTIVE_RESERVE_ENV) or DEFAULT_INTERACTIVE_RESERVE
+            )
+        self.limit = limit
+        self.reserve = reserve
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostScheduler(host, self.limit, self.reserve)
+            return self.hosts[host]
+
+    @contextmanager
+    def slot(self, url, priority=INTERACTIVE, job=INTERACTIVE):
+        """Hold one of the url's host's request slots for the block."""
+        host = self.host(url)
+        host.acquire(priority, job)
+        try:
+            yield
+        finally:
+            host.release(priority)
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """Establish a singleton scheduler that can be reused by multiple components."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler()
+    return _scheduler
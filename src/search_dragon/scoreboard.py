@@ -0,0 +1,208 @@
+"""
+API scoreboard.
+
+run_search keeps a score for every api and requested ontology: exponentially
+weighted moving averages of upstream latency, error rate and hit rate (whether
+the api returned anything from that ontology). In adaptive mode
+(run_search(..., adaptive=True)) get_api_instance uses the scores to
+
+- skip an api that is failing, or that has never returned results for any of
+  the requested ontologies in NO_HIT_SAMPLES searches, and
+- move an api that is much slower than the others to the end of the list,
+
+and reports why in the response's "api_selection". A skipped api is still
+tried once every `SEARCH_DRAGON_SCORE_COOLDOWN` seconds (default 60), so it is
+noticed when it recovers.
+"""
+
+import os
+import threading
+import time
+
+from search_dragon import logger as getlogger
+
+SCORE_COOLDOWN_ENV = "SEARCH_DRAGON_SCORE_COOLDOWN"
+DEFAULT_SCORE_COOLDOWN = 60
+
+ALPHA = 0.2  # weight of the latest observation
+MIN_SAMPLES = 5  # observations needed before an api is judged
+MAX_ERROR_RATE = 0.5
+NO_HIT_SAMPLES = 20  # searches without any result before an api is skipped
+SLOW_FACTOR = 3  # times the fastest api's latency
+SLOW_SECONDS = 1.0  # below this no api is considered slow
+
+ALL_ONTOLOGIES = "*"
+
+SELECTED = "selected"
+DEPRIORITIZED = "deprioritized"
+SKIPPED = "skipped"
+PROBE = "probe"
+
+
+def _ewma(average, value):
+    return value if average is None else average + ALPHA * (value - average)
+
+
+class Score:
+    def __init__(self):
+        self.latency = None
+        self.error_rate = None
+        self.hit_rate = None
+        self.hits = 0
+        self.samples = 0
+        self.last_attempt = 0.0
+
+    def as_dict(self):
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "hit_rate": self.hit_rate,
+            "hits": self.hits,
+            "samples": self.samples,
+        }
+
+
+class Scoreboard:
+    def __init__(self, cooldown=None):
+        if cooldown is None:
+            cooldown = float(os.getenv(SCORE_COOLDOWN_ENV) or DEFAULT_SCORE_COOLDOWN)
+        self.cooldown = cooldown
+        self.scores = {}  # (api_id, ontology) => Score
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def ontologies(ontology_list):
+        if isinstance(ontology_list, str):
+            ontology_list = [ontology_list]
+        return sorted({o.upper() for o in ontology_list or [] if o}) or [ALL_ONTOLOGIES]
+
+    def record(self, api_id, ontology_list, prefixes, latency=None, failed=False):
+        """
+        Record the outcome of one api's part of a search.
+
+        Args:
+            api_id (str): The api.
+            ontology_list (list): The ontologies searched.
+            prefixes (set): The ontology prefixes of the results returned.
+            latency (float, optional): Seconds spent upstream, None when the
+                results came from a cache or local store.
+            failed (bool): Whether an upstream request failed.
+        """
+        prefixes = {p.upper() for p in prefixes if p}
+        now = time.monotonic()
+        with self.lock:
+            for ontology in self.ontologies(ontology_list):
+                score = self.scores.setdefault((api_id, ontology), Score())
+                hit = bool(prefixes) if ontology == ALL_ONTOLOGIES else ontology in prefixes
+                score.hit_rate = _ewma(score.hit_rate, 1.0 if hit else 0.0)
+                score.hits += hit
+                if latency is not None or failed:
+                    score.error_rate = _ewma(score.error_rate, 1.0 if failed else 0.0)
+                if latency is not None:
+                    score.latency = _ewma(score.latency, latency)
+                score.samples += 1
+                score.last_attempt = now
+
+    def assess(self, api_id, ontology_list):
+        """
+        Returns:
+            Tuple: (status, reason) for the api, status one of SELECTED,
+            SKIPPED or PROBE. Latency is judged by select.
+        """
+        scores = [
+            self.scores.get((api_id, ontology))
+            for ontology in self.ontologies(ontology_list)
+        ]
+        judged = [s for s in scores if s is not None and s.samples >= MIN_SAMPLES]
+        if not judged or len(judged) < len(scores):
+            return SELECTED, "not enough history"
+
+        reason = None
+        error_rates = [s.error_rate for s in judged if s.error_rate is not None]
+        if error_rates and min(error_rates) > MAX_ERROR_RATE:
+            reason = f"error rate {min(error_rates):.2f}"
+        elif all(s.hits == 0 and s.samples >= NO_HIT_SAMPLES for s in judged):
+            reason = f"no results for {','.join(self.ontologies(ontology_list))} in {min(s.samples for s in judged)} searches"
+        if reason is None:
+            return SELECTED, "healthy"
+
+        if time.monotonic() - max(s.last_attempt for s in judged) >= self.cooldown:
+            return PROBE, reason
+        return SKIPPED, reason
+
+    def latency(self, api_id, ontology_list):
+        latencies = [
+            self.scores[(api_id, ontology)].latency
+            for ontology in self.ontologies(ontology_list)
+            if (api_id, ontology) in self.scores
+        ]
+        latencies = [l for l in latencies if l is not None]
+        return max(latencies) if latencies else None
+
+    def select(self, search_api_list, ontology_list):
+        """
+        Choose and order the apis for a search.
+
+        Returns:
+            Tuple:
+                - selected (list): The api ids to use, slow ones last.
+                - decisions (dict): api id => {"status", "reason"}.
+        """
+        with self.lock:
+            decisions = {}
+            for api_id in search_api_list:
+                status, reason = self.assess(api_id, ontology_list)
+                decisions[api_id] = {"status": status, "reason": reason}
+            latencies = {
+                api_id: self.latency(api_id, ontology_list) for api_id in search_api_list
+            }
+
+        usable = [a for a in search_api_list if decisions[a]["status"] != SKIPPED]
+        if not usable:
+            # Never skip every api, keep the first as a probe
+            usable = search_api_list[:1]
+            decisions[usable[0]] = {
+                "status": PROBE,
+                "reason": "every api is unhealthy",
+            }
+
+        known = [latencies[a] for a in usable if latencies[a] is not None]
+        fastest = min(known) if known else None
+        slow = []
+        if fastest:
+            for api_id in usable:
+                latency = latencies[api_id]
+                if (
+                    latency is not None
+                    and latency > SLOW_SECONDS
+                    and latency > SLOW_FACTOR * fastest
+                ):
+                    decisions[api_id] = {
+                        "status": DEPRIORITIZED,
+                        "reason": f"latency {latency:.2f}s vs {fastest:.2f}s",
+                    }
+                    slow.append(api_id)
+
+        selected = [a for a in usable if a not in slow] + slow
+        skipped = [a for a in search_api_list if a not in selected]
+        if skipped:
+            getlogger().debug(f"Skipping apis {skipped}: {decisions}")
+        return selected, decisions
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                f"{api_id}/{ontology}": score.as_dict()
+                for (api_id, ontology), score in sorted(self.scores.items())
+            }
+
+
+_scoreboard = None
+
+
+def get_scoreboard():
+    """Establish a singleton scoreboard that can be reused by multiple components."""
+    global _scoreboard
+    if _scoreboard is None:
+        _scoreboard = Scoreboard()
+    return _scoreboard
@@ -3,7 +3,11 @@ Provides the modular framework for searching across multiple ontology APIs.
 """
 
 import argparse
+import atexit
 import csv
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from rich import print
@@ -12,27 +16,83 @@ from rich.logging import RichHandler
 from rich.table import Table
 
 from search_dragon import logger as getlogger
-from search_dragon.external_apis import OntologyAPI
+from search_dragon import (
+    autocomplete,
+    benchmark,
+    code_filter,
+    local_store,
+    mirror,
+    negative_cache,
+    server,
+    umls_store,
+    warm,
+)
+from search_dragon.external_apis import IncompleteResults, OntologyAPI
+from search_dragon.external_apis.local_api import LocalSearchAPI
+from search_dragon.external_apis.local_descendants_api import LocalDescendantsAPI
 from search_dragon.external_apis.ols_api import OLSSearchAPI
 from search_dragon.external_apis.ols_code_api import OLSSearchAPICode
 from search_dragon.external_apis.ols_descendants_api import OLSDescendantsAPI
 from search_dragon.external_apis.umls_api import UMLSSearchAPI
+from search_dragon.external_apis.umls_local_api import UMLSLocalSearchAPI
+from search_dragon.cache import get_result_cache
+from search_dragon.code_filter import get_code_filters
+from search_dragon.columnar import available as columnar_available
+from search_dragon.columnar import merge_expansions, records_table
+from search_dragon.columnar import write_csv as write_columnar_csv
+from search_dragon.metrics import get_metrics
+from search_dragon.negative_cache import get_negative_cache
+from search_dragon.normalize import (
+    descendant_ontology,
+    normalize_keyword,
+    normalize_ontologies,
+    query_key,
+)
+from search_dragon.prefetch import get_prefetcher
 from search_dragon.result_structure import clean_url, generate_response
+from search_dragon.scoreboard import get_scoreboard
+from search_dragon.scheduler import BULK, scheduling
 from search_dragon.support import ftd_ontology_lookup
+from search_dragon.value_set import write_value_set
 
 SEARCH_APIS = [
     {"ols": OLSSearchAPI},
     {"ols2": OLSSearchAPICode},
     {"olsd": OLSDescendantsAPI},
     {"umls": UMLSSearchAPI},
+    {"local": LocalSearchAPI},
+    {"locald": LocalDescendantsAPI},
+    {"umls_local": UMLSLocalSearchAPI},
 ]
 
+# The api used to find the IRIs of the parents expanded by each descendants api
+RESOLVE_APIS = {"olsd": "ols2", "locald": "local"}
+DEFAULT_EXPAND_WORKERS = 8
 
-def get_api_instance(search_api_list):
+# Subcommands of dragon_search, e.g. `dragon_search index hp.obo`. Each
+# module's exec takes the remaining command line arguments. exec is looked up
+# when the subcommand runs, since server and warm import this module.
+SUBCOMMANDS = {
+    "index": local_store,
+    "umls_index": umls_store,
+    "mirror": mirror,
+    "serve": server,
+    "warm": warm,
+    "purge": negative_cache,
+    "code_filter": code_filter,
+    "benchmark": benchmark,
+    "autocomplete": autocomplete,
+}
+
+
+def get_api_instance(search_api_list, ontology_list=None, adaptive=False, decisions=None):
     """Creates instances of ontology API classes based on the provided list of APIs. If no list is provided, instances of all available APIs are created.
 
     Args:
     search_api_list: List of API names to initialize. Defaults to None (initialize all available APIs).
+    ontology_list: The ontologies being searched, used by adaptive selection.
+    adaptive: Skip apis that are failing or never return results for the ontologies, and put slow apis last (see search_dragon.scoreboard).
+    decisions: A dict to fill with the adaptive selection made for each api.
 
     Returns:
     api_instances: A list of instantiated API classes.
@@ -44,6 +104,14 @@ def get_api_instance(search_api_list):
         key: value for api_dict in SEARCH_APIS for key, value in api_dict.items()
     }
 
+    unknown_apis = [a for a in search_api_list if a not in available_apis]
+    if adaptive and not unknown_apis:
+        search_api_list, selection = get_scoreboard().select(
+            search_api_list, ontology_list
+        )
+        if decisions is not None:
+            decisions.update(selection)
+
     for search_api in search_api_list:
         if search_api in available_apis:
             api_instances.append(available_apis[search_api]())
@@ -56,6 +124,194 @@ def get_api_instance(search_api_list):
     return api_instances
 
 
+def fetch_results(
+    api_instance,
+    keyword,
+    ontology_list,
+    start_index,
+    results_per_page,
+    iri=None,
+    children=False,
+    fetch_all=False,
+    max_results=None,
+):
+    """
+    Fetch the raw results of one api for a query. The query is normalized
+    for the api first, and the results are served from the result cache when
+    an equivalent query was made recently. Codes ruled out by a known code
+    filter (see search_dragon.code_filter) aren't searched for.
+
+    With fetch_all (or max_results) every page is fetched, up to max_results,
+    rather than the single page at start_index.
+
+    A cached result that has expired, but is within the result cache's
+    staleness window, is returned at once (setting api_instance.served_stale)
+    and refreshed in the background.
+
+    Returns:
+        Tuple:
+            - search_url (str): The url for the query.
+            - api_results (list): The raw results from the api.
+            - more_results_available (bool): Whether more results are available.
+    """
+    logger = getlogger()
+    filter_keyword = normalize_keyword(keyword, "ols")
+    keyword = normalize_keyword(keyword, api_instance.curie_style)
+    ontology_list = normalize_ontologies(ontology_list)
+
+    # Generate the search url
+    search_url = api_instance.build_url(
+        keyword,
+        ontology_list,
+        start_index,
+        results_per_page,
+        iri,
+        children=children,
+    )
+    logger.debug(f"URL:{clean_url(search_url)}")
+
+    metrics = get_metrics()
+    if iri is None and get_code_filters().excludes(filter_keyword):
+        logger.debug(f"{filter_keyword} is not a known code, not searching")
+        metrics.inc("search_dragon_prefiltered_total", api=api_instance.api_id)
+        return search_url, [], False
+
+    fetch_all = fetch_all or bool(max_results)
+
+    def collect(api_instance=api_instance):
+        # Fetch the data, from a fresh local mirror when there is one
+        mirrored = api_instance.search_mirror(
+            keyword,
+            ontology_list,
+            api_instance.first_start_index if fetch_all else start_index,
+            (max_results or sys.maxsize) if fetch_all else results_per_page,
+            iri,
+            children=children,
+        )
+        if mirrored is not None:
+            logger.debug("Answered from the local mirror")
+            return mirrored
+        if fetch_all:
+            return api_instance.collect_all(
+                keyword, ontology_list, max_results, iri, children=children
+            )
+        return api_instance.collect_data(search_url, results_per_page, start_index)
+
+    if not api_instance.cacheable:
+        api_results, more_results_available = collect()
+    else:
+        # Apis that don't page return the same results for any page
+        paged = api_instance.next_start_index(start_index, results_per_page) is not None
+        key = query_key(
+            api_instance.api_id,
+            keyword,
+            ontology_list,
+            start_index if paged else 0,
+            results_per_page if paged else 0,
+            iri,
+            children,
+            fetch_all,
+            max_results,
+        )
+        version = api_instance.data_version(ontology_list)
+        if version is not None:
+            key += (version,)
+        # Failed requests come back empty, so empty results aren't cached
+        negatives = get_negative_cache()
+        outcome = []
+
+        def collect_miss(api_instance=api_instance, outcome=outcome):
+            if negatives.contains(key):
+                outcome.append("negative_hit")
+                return [], False
+            outcome.append("miss")
+            results = collect(api_instance)
+            # Failed requests come back empty too, only real misses are kept
+            if not results[0] and not isinstance(results[0], IncompleteResults):
+                negatives.add(key, api_instance.api_id, ontology_list)
+            return results
+
+        # Refreshes run in the background on their own instance, so their
+        # requests aren't counted as this search's, at this search's priority
+        priority, job = api_instance.priority, api_instance.job
+
+        def refresh():
+            with scheduling(priority, job=job):
+                return collect_miss(type(api_instance)(), [])
+
+        # Empty results are kept by the negative cache rather than here, and
+        # results missing failed requests' aren't kept at all
+        results, stale = get_result_cache().get_or_revalidate(
+            key,
+            collect_miss,
+            cache_if=lambda value: bool(value[0])
+            and not isinstance(value[0], IncompleteResults),
+            refresh=refresh,
+        )
+        api_results, more_results_available = results
+        api_instance.served_stale = stale
+        if stale:
+            outcome.append("stale_hit")
+        # Waiting on another thread's request for the same key counts as a hit
+        metrics.inc(
+            "search_dragon_cache_requests_total",
+            api=api_instance.api_id,
+            result=outcome[0] if outcome else "hit",
+        )
+
+    metrics.inc(
+        "search_dragon_api_records_total", len(api_results), api=api_instance.api_id
+    )
+
+    return search_url, api_results, more_results_available
+
+
+def prefetch_pages(
+    api_instance,
+    keyword,
+    ontology_list,
+    start_index,
+    results_per_page,
+    iri=None,
+    children=False,
+    depth=1,
+):
+    """
+    Schedule the pages following start_index to be fetched into the result
+    cache in the background.
+    """
+    if not api_instance.cacheable:
+        return
+    next_start = api_instance.next_start_index(start_index, results_per_page)
+    if next_start is None:
+        return
+
+    def fetch():
+        # On an instance of its own, so the caller's request counts aren't
+        # changed under it, as bulk requests that leave the interactive
+        # slots to searches
+        with scheduling(BULK, job="prefetch"):
+            prefetch_instance = type(api_instance)()
+        page_start = next_start
+        for _ in range(depth):
+            _, _, more_results_available = fetch_results(
+                prefetch_instance,
+                keyword,
+                ontology_list,
+                page_start,
+                results_per_page,
+                iri,
+                children=children,
+            )
+            page_start = prefetch_instance.next_start_index(page_start, results_per_page)
+            if not more_results_available or page_start is None:
+                break
+
+    key = (api_instance.api_id, keyword, str(ontology_list), next_start, results_per_page, iri, children)
+    if get_prefetcher().schedule(key, fetch):
+        getlogger().debug(f"Prefetching {depth} page(s) after {start_index} from {api_instance.api_id}")
+
+
 def run_search(
     ontology_data,
     keyword,
@@ -66,6 +322,10 @@ def run_search(
     iri=None,
     descendants=False,
     children=False,
+    prefetch=0,
+    fetch_all=False,
+    max_results=None,
+    adaptive=False,
 ):
     """
     The master function to execute the search process. It queries the APIs, harmonizes the results, and generates a cleaned, structured response.
@@ -75,33 +335,55 @@ def run_search(
     keyword (str): The search term.
     ontology_list (List[str], optional): List of ontology names preferred by the user. Defaults to None.
     search_api_list (List[str], optional): List of API names preferred by the user or FE. Defaults to None (uses all available APIs).
+    prefetch (int, optional): How many of the following pages to fetch into the result cache in the background. Defaults to 0 (off).
+    fetch_all (bool, optional): Fetch every page of results rather than the page at start_index. Defaults to False.
+    max_results (int, optional): Fetch pages until this many results have been collected. Implies fetch_all.
+    adaptive (bool, optional): Choose among search_api_list by their health and history, see get_api_instance. The choice is returned in "api_selection". Defaults to False.
 
     Returns:
-    dict: The final structured response containing harmonized and curated search results.
+    dict: The final structured response containing harmonized and curated search results. "stale" is True when expired cached results were served while being refreshed.
     """
 
     logger = getlogger()
-    api_instances = get_api_instance(search_api_list)
+    started = time.perf_counter()
+    scoreboard = get_scoreboard()
+    decisions = {}
+    api_instances = get_api_instance(
+        search_api_list, ontology_list, adaptive=adaptive, decisions=decisions
+    )
 
-    combined_data = []
+    results_by_api = []
+    more_results = []
+    served_stale = []
     for api_instance in api_instances:
-        # Generate the search url
-        search_url = api_instance.build_url(
+        api_started = time.perf_counter()
+        search_url, api_results, more_results_available = fetch_results(
+            api_instance,
             keyword,
             ontology_list,
             start_index,
             results_per_page,
             iri,
             children=children,
+            fetch_all=fetch_all,
+            max_results=max_results,
         )
-        logger.debug(f"URL:{clean_url(search_url)}")
-
-        # Fetch the data
-        api_results, more_results_available = api_instance.collect_data(
-            search_url, results_per_page, start_index
-        )
+        fetch_seconds = time.perf_counter() - api_started
+        served_stale.append(api_instance.served_stale)
         logger.debug(f"Count results: {len(api_results)}")
 
+        if prefetch and more_results_available and not (fetch_all or max_results):
+            prefetch_pages(
+                api_instance,
+                keyword,
+                ontology_list,
+                start_index,
+                results_per_page,
+                iri,
+                children=children,
+                depth=prefetch,
+            )
+
         # harmonize the api specific data into standard structure
         harmonized_data = api_instance.harmonize_data(api_results, ontology_data)
 
@@ -110,14 +392,48 @@ def run_search(
         # Apply speciallized cleaning prior to combining data.
         cleaned_harmonized_data = api_instance.clean_harmonized_data(harmonized_data)
 
-        # Combine the ontology api data
-        combined_data.extend(cleaned_harmonized_data)
+        results_by_api.append(cleaned_harmonized_data)
+        more_results.append(more_results_available)
+
+        # Only time spent upstream counts towards the api's latency
+        scoreboard.record(
+            api_instance.api_id,
+            ontology_list,
+            {record.get("ontology_prefix") for record in cleaned_harmonized_data},
+            latency=fetch_seconds if api_instance.requests_made else None,
+            failed=api_instance.failed_requests > 0,
+        )
 
-    logger.debug(f"Count combined_data {len(combined_data)}")
+    # Every record fetched is returned, since each api's next page starts
+    # after all of this one: a record cut from the merge couldn't be reached
+    # again. Only max_results caps the merge.
+    limit = int(max_results) if max_results else None
 
     # Final cleaning and structuring of the combined data
     response = generate_response(
-        combined_data, search_url, more_results_available, api_instances, descendants
+        results_by_api,
+        search_url,
+        any(more_results),
+        api_instances,
+        descendants,
+        limit=limit,
+    )
+    if adaptive:
+        response["api_selection"] = decisions
+    # Served from expired cache entries while they are refreshed
+    if any(served_stale):
+        response["stale"] = True
+
+    # Terms found by searches can be completed without searching again
+    if not (descendants or fetch_all or max_results):
+        autocomplete.get_autocomplete_index().learn(response["results"])
+
+    apis = ",".join(search_api_list)
+    get_metrics().observe(
+        "search_dragon_search_seconds", time.perf_counter() - started, apis=apis
+    )
+    get_metrics().inc(
+        "search_dragon_search_results_total", response["results_count"], apis=apis
     )
 
     logger.debug(f"keyword: {keyword}")
@@ -125,6 +441,211 @@ def run_search(
     return response
 
 
+def resolve_iri(ontology_data, keyword, ontology, search_api="ols2"):
+    """
+    Look up the record for a code, to find the IRI a descendants search
+    starts from.
+
+    Returns:
+        dict: The first matching record, or None.
+    """
+    results = run_search(ontology_data, keyword, [ontology], [search_api], 1, 0)
+    results = results.get("results", [])
+    return results[0] if results else None
+
+
+def expand_columnar(ontology_data, code, ontology, search_api, iri, children=False):
+    """
+    Expand a term from the raw results of search_api, harmonized as columns.
+
+    Returns:
+        pyarrow.Table, the records harmonized as by run_search when the
+        results couldn't be harmonized as columns or are too few to be worth
+        it, or None when the api can't harmonize as columns.
+    """
+    api_instance = get_api_instance([search_api])[0]
+    # Checked before fetching, as the results of apis that aren't cached
+    # would be fetched again by run_search
+    if not api_instance.harmonizes_columnar:
+        return None
+    search_url, raw_results, _ = fetch_results(
+        api_instance, code, ontology, 0, 0, iri, children=children
+    )
+    try:
+        batch = api_instance.harmonize_columnar(raw_results, ontology_data)
+    except Exception as e:
+        getlogger().warning(f"Couldn't harmonize {code} as columns: {e}")
+        batch = None
+    if batch is not None:
+        return batch
+    # Harmonized as records from the results already fetched
+    harmonized_data = api_instance.harmonize_data(raw_results, ontology_data)
+    cleaned_harmonized_data = api_instance.clean_harmonized_data(harmonized_data)
+    response = generate_response(
+        [cleaned_harmonized_data], search_url, False, [api_instance], descendants=True
+    )
+    return response["results"]
+
+
+def parent_code(parent):
+    """The code of a parent given as a code or an IRI, e.g. .../HP_0000707 => HP:0000707."""
+    if parent.startswith(("http://", "https://")):
+        return parent.rstrip("/").split("/")[-1].replace("_", ":")
+    return parent
+
+
+def expand_parents(
+    ontology_data,
+    parents,
+    ontologies=None,
+    children=False,
+    search_api="olsd",
+    iris=None,
+    parent_records=False,
+    workers=DEFAULT_EXPAND_WORKERS,
+    columnar=False,
+):
+    """
+    Expand the descendants (or direct children) of many parents at once, as
+    in a value set definition. Parents are resolved to IRIs and expanded
+    concurrently, and a term found under several parents is returned once.
+
+    With columnar, and pyarrow installed, the terms are harmonized and merged
+    as columns (see search_dragon.columnar) and returned as "batch" instead
+    of "results", for writing out without building a record per term.
+
+    Args:
+        ontology_data (dict): curie=>system lookup.
+        parents (list): Parent codes or IRIs.
+        ontologies (list, optional): OLS ontology ids. Each parent is
+            expanded in the ontology of its prefix, or in the only ontology
+            given when that isn't one of them. Defaults to the ontology of
+            each parent's prefix.
+        children (bool): Only expand the direct children.
+        search_api (str): "olsd", or "locald" for the local ontology index.
+        iris (dict, optional): parent => IRI, for parents whose IRI is known.
+        parent_records (bool): Look up the record of every parent, even when
+            its IRI is known.
+        workers (int): Maximum parents expanded at once.
+        columnar (bool): Return the terms as a pyarrow.Table when possible.
+
+    Returns:
+        dict:
+            - results (list): Every term once, in the order found, with
+              "parent_codes", the parents it was found under.
+            - batch (pyarrow.Table): The same terms, with a "parent_codes"
+              column, in place of results when columnar.
+            - results_count (int): The number of terms.
+            - parents (dict): parent => {"code", "ontology", "iri", "record",
+              "count", "error"}.
+    """
+    logger = getlogger()
+    parents = list(dict.fromkeys(p.strip() for p in parents if p and p.strip()))
+    iris = iris or {}
+    columnar = columnar and columnar_available()
+    if ontologies is not None:
+        if isinstance(ontologies, str):
+            ontologies = ontologies.split(",")
+        ontologies = [o.strip().lower() for o in ontologies if o.strip()]
+
+    def ontology_for(code):
+        ontology = descendant_ontology(code)
+        if not ontologies or ontology in ontologies:
+            return ontology
+        if len(ontologies) == 1:
+            return ontologies[0]
+        raise ValueError(f"{code} is not in any of the ontologies {ontologies}")
+
+    def expand(parent):
+        code = parent_code(parent)
+        info = {"code": code, "ontology": None, "iri": None, "record": None}
+        info["ontology"] = ontology = ontology_for(code)
+        iri = parent if parent != code else iris.get(parent)
+        if iri is None or parent_records:
+            record = resolve_iri(
+                ontology_data, code, ontology, RESOLVE_APIS.get(search_api, "ols2")
+            )
+            if record is None and iri is None:
+                raise ValueError(f"Could not find IRI for {code}")
+            info["record"] = record
+            iri = iri or record["code_iri"]
+        info["iri"] = iri
+        if columnar:
+            batch = expand_columnar(
+                ontology_data, code, ontology, search_api, iri, children
+            )
+            if batch is not None:
+                return info, batch
+        response = run_search(
+            ontology_data,
+            code,
+            ontology,
+            [search_api],
+            0,
+            0,
+            iri,
+            descendants=True,
+            children=children,
+        )
+        return info, response.get("results", [])
+
+    expansions = {}
+    if parents:
+        with ThreadPoolExecutor(max_workers=min(workers, len(parents))) as executor:
+            futures = {parent: executor.submit(expand, parent) for parent in parents}
+        for parent, future in futures.items():
+            try:
+                expansions[parent] = future.result()
+            except Exception as e:
+                logger.warning(f"Expanding {parent} failed: {e}")
+                info = {"code": parent_code(parent), "ontology": None, "iri": None}
+                expansions[parent] = (dict(info, record=None, error=str(e)), [])
+
+    parent_info = {}
+    for parent in parents:
+        info, results = expansions[parent]
+        info.setdefault("error", None)
+        info["count"] = len(results)
+        parent_info[parent] = info
+
+    if columnar:
+        batch = merge_expansions(
+            [
+                (
+                    parent_info[parent]["code"],
+                    results
+                    if not isinstance(results, list)
+                    else records_table(results),
+                )
+                for parent, (_, results) in expansions.items()
+            ]
+        )
+        logger.debug(f"{len(batch)} distinct terms under {len(parents)} parents")
+        return {"batch": batch, "results_count": len(batch), "parents": parent_info}
+
+    # Subtrees overlap, keep each term once with every parent it came from
+    terms = {}
+    for parent in parents:
+        info, results = expansions[parent]
+        for record in results:
+            key = record.get("code_iri") or record.get("code")
+            term = terms.get(key)
+            if term is None:
+                terms[key] = dict(record, parent_codes=[info["code"]])
+            elif info["code"] not in term["parent_codes"]:
+                term["parent_codes"].append(info["code"])
+
+    logger.debug(
+        f"{len(terms)} distinct terms under {len(parents)} parents, "
+        f"{sum(i['count'] for i in parent_info.values())} before deduplication"
+    )
+    return {
+        "results": list(terms.values()),
+        "results_count": len(terms),
+        "parents": parent_info,
+    }
+
+
 def do_search(codes, ontologies, filepath, results_per_page, start_index):
     logger = getlogger()
     annotations = {}
@@ -133,59 +654,24 @@ def do_search(codes, ontologies, filepath, results_per_page, start_index):
     codes = [c.strip() for c in codes.split("|")]
     ontology_param = [c.strip() for c in ontologies.split(",")]
 
-    for keyword in codes:
-        annotations[keyword] = {}
-
-        # TODO: Automate conversions.
-        # Apply Ontology prefix conversions when necessary.
-        ols_keyword = keyword
-        umls_keyword = keyword.replace("HP:", "HPO:")
-        if keyword.startswith("HP:"):
-            ols_keyword = keyword
-            umls_keyword = keyword.replace("HP:", "HPO:")
-        if keyword.startswith("HPO:"):
-            ols_keyword = keyword.replace("HPO:", "HP:")
-            umls_keyword = keyword
-        if keyword.startswith("OMIM:"):
-            ols_keyword = keyword
-            umls_keyword = keyword.replace("OMIM:", "")
-        if keyword.startswith("SNOMEDCT:"):
-            ols_keyword = keyword.replace("SNOMEDCT:", "SNOMED:")
-            umls_keyword = keyword
-
-        try:
-            annotations[keyword]["ols"] = run_search(
-                onto_data,
-                ols_keyword,
-                ontology_param,
-                ["ols"],
-                results_per_page,
-                start_index,
-            )
-        except:
-            pass
-        try:
-            annotations[keyword]["ols2"] = run_search(
-                onto_data,
-                ols_keyword,
-                ontology_param,
-                ["ols2"],
-                results_per_page,
-                start_index,
-            )
-        except:
-            pass
-        try:
-            annotations[keyword]["umls"] = run_search(
-                onto_data,
-                umls_keyword,
-                ontology_param,
-                ["umls"],
-                results_per_page,
-                start_index,
-            )
-        except:
-            pass
+    # Batches give way to interactive searches made in the same process
+    with scheduling(BULK, job="do_search"):
+        for keyword in codes:
+            annotations[keyword] = {}
+
+            # Prefix conversions (HP/HPO etc.) are applied per api by run_search
+            for search_api in ["ols", "ols2", "umls"]:
+                try:
+                    annotations[keyword][search_api] = run_search(
+                        onto_data,
+                        keyword,
+                        ontology_param,
+                        [search_api],
+                        results_per_page,
+                        start_index,
+                    )
+                except:
+                    pass
 
     # Format result and output to a CSV file
 
@@ -275,83 +761,96 @@ def desc_search(
     iri,
     parent_data,
     children,
+    search_api="olsd",
 ):
-    codes = [codes] if codes else [iri.split("/")[-1].replace("_", ":")]
+    """
+    Expand the descendants (or children) of the parent codes, delimeter |,
+    and write them out once each, with the parents they were found under.
+    iri is the IRI of a single parent; parent_data adds a row for each
+    parent. A filepath ending in .vset is written as a value set file (see
+    search_dragon.value_set).
+    """
+    parents = [c.strip() for c in codes.split("|") if c.strip()] if codes else [iri]
     logger = getlogger()
-    annotations = {}
     onto_data = ftd_ontology_lookup()
-    for parent_code in codes:
-        annotations[parent_code] = {}
-
-        # TODO: Automate conversions.
-        # Apply Ontology prefix conversions when necessary.
-        ols_keyword = parent_code
-        umls_keyword = parent_code.replace("HP:", "HPO:")
-        if parent_code.startswith("HP:"):
-            ols_keyword = parent_code
-            umls_keyword = parent_code.replace("HP:", "HPO:")
-        if parent_code.startswith("HPO:"):
-            ols_keyword = parent_code.replace("HPO:", "HP:")
-            umls_keyword = parent_code
-        if parent_code.startswith("OMIM:"):
-            ols_keyword = parent_code
-            umls_keyword = parent_code.replace("OMIM:", "")
-        if parent_code.startswith("SNOMEDCT:"):
-            ols_keyword = parent_code.replace("SNOMEDCT:", "SNOMED:")
-            umls_keyword = parent_code
-
-        try:
-            annotations[parent_code]["olsd"] = run_search(
-                onto_data,
-                ols_keyword,
-                ontologies,
-                ["olsd"],
-                results_per_page,
-                start_index,
-                iri,
-                descendants=True,
-                children=children,
+    # Files are written from columns when pyarrow is installed
+    expansion = expand_parents(
+        onto_data,
+        parents,
+        ontologies,
+        children=children,
+        search_api=search_api,
+        iris={parents[0]: iri} if iri else None,
+        parent_records=bool(parent_data),
+        columnar=filepath != "rich",
+    )
+    for info in expansion["parents"].values():
+        if info["error"]:
+            print(
+                f"Could not expand {info['code']}: {info['error']}. Please try again in a few minutes to ensure this is not an issue with the API."
             )
-        except:
-            pass
+
+    if filepath.endswith(".vset"):
+        count = write_value_set(filepath, expansion)
+        logger.info(f"Wrote {count} terms to the value set '{filepath}'")
+        return
 
     # Format result and output to a CSV file
 
     if filepath != "rich":
-        fileobj = open(filepath, mode="w", newline="", encoding="utf-8")
-        writer = csv.writer(fileobj)
+        header = [
+            "api",
+            "parent_code",
+            "descendant_code",
+            "display",
+            "description",
+            "system",
+            "code_iri",
+            "ontology_prefix",
+        ]
+        parent_rows = []
+        if parent_data:
+            for info in expansion["parents"].values():
+                record = info["record"]
+                if not record:
+                    continue
+                description = record.get("description", "")
+                if isinstance(description, list):
+                    description = "\n".join(description)
+                parent_rows.append(
+                    [
+                        RESOLVE_APIS.get(search_api, "ols2"),
+                        "",
+                        record.get("code"),
+                        record.get("display", ""),
+                        description,
+                        record.get("system", ""),
+                        record.get("code_iri", ""),
+                        record.get("ontology_prefix", ""),
+                    ]
+                )
+        empty_rows = [
+            [search_api, info["code"]] + ["No results"] * 6
+            for info in expansion["parents"].values()
+            if not info["count"]
+        ]
         logger.info(f"Writing output to '{filepath}'")
 
-        # Write header row (optional, depends on your data structure)
-        writer.writerow(
-            [
-                "api",
-                "parent_code",
-                "descendant_code",
-                "display",
-                "description",
-                "system",
-                "code_iri",
-                "ontology_prefix",
-            ]
-        )
+        if "batch" in expansion:
+            with open(filepath, mode="wb") as fileobj:
+                write_columnar_csv(
+                    fileobj,
+                    expansion["batch"],
+                    search_api,
+                    [header] + parent_rows,
+                    empty_rows,
+                )
+            return
 
-        if parent_data:
-            description = parent_data.get("description", "")
-            if isinstance(description, list):
-                description = "\n".join(description)
-            writer.writerow(
-                [
-                    "ols2",
-                    "",
-                    parent_data.get("code"),
-                    parent_data.get("display", ""),
-                    description,
-                    parent_data.get("system", ""),
-                    parent_data.get("code_iri", ""),
-                    parent_data.get("ontology_prefix", ""),
-                ]
-            )
+        fileobj = open(filepath, mode="w", newline="", encoding="utf-8")
+        writer = csv.writer(fileobj)
+        writer.writerow(header)
+        writer.writerows(parent_rows)
     else:
         table = Table(
             title="Search Results", expand=True, row_styles=["yellow", "green"]
@@ -361,57 +860,45 @@ def desc_search(
         table.add_column("Display", justify="left")
         table.add_column("system", justify="left")
 
-    for parent_code, results in annotations.items():
-        for source, result in results.items():
-            if result and result.get("results"):
-                for entry in result["results"]:
-                    source = source
-                    code = entry.get("code", "No results")
-                    display = entry.get("display", "No results")
-                    description = entry.get("description", "No results")
-                    system = entry.get("system", "No results")
-                    code_iri = entry.get("code_iri", "No results")
-                    ontology_prefix = entry.get("ontology_prefix", "No results")
-                    if filepath != "rich":
-                        writer.writerow(
-                            [
-                                source,
-                                parent_code,
-                                code,
-                                display,
-                                description,
-                                system,
-                                code_iri,
-                                ontology_prefix,
-                            ]
-                        )
-                    else:
-                        table.add_row(parent_code, code, display, system)
-            else:
-                if filepath != "rich":
-                    writer.writerow(
-                        [
-                            source,
-                            parent_code,
-                            "No results",
-                            "No results",
-                            "No results",
-                            "No results",
-                            "No results",
-                            "No results",
-                        ]
-                    )
-                else:
-                    table.add_row(parent_code, "No results", "No Results", "")
+    # Terms under several parents are written once, with the parents joined by |
+    for entry in expansion["results"]:
+        parent_codes = "|".join(entry["parent_codes"])
+        code = entry.get("code", "No results")
+        display = entry.get("display", "No results")
+        system = entry.get("system", "No results")
+        if filepath != "rich":
+            writer.writerow(
+                [
+                    search_api,
+                    parent_codes,
+                    code,
+                    display,
+                    entry.get("description", "No results"),
+                    system,
+                    entry.get("code_iri", "No results"),
+                    entry.get("ontology_prefix", "No results"),
+                ]
+            )
+        else:
+            table.add_row(parent_codes, code, display, system)
 
     if filepath != "rich":
+        writer.writerows(empty_rows)
         fileobj.close()
     else:
+        for info in expansion["parents"].values():
+            if not info["count"]:
+                table.add_row(info["code"], "No results", "No Results", "")
         console = Console()
         console.print(table)
 
 
 def exec(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[args[0]].exec(args[1:])
+
     parser = argparse.ArgumentParser(
         description="Get metadata for a code using the available locutus OntologyAPI connection."
     )
@@ -427,14 +914,14 @@ def exec(args=None):
         "--ontologies",
         required=False,
         default=None,
-        help="A string value containing the ontology_prefixes to use in the searh",
+        help="A string value containing the ontology_prefixes to use in the searh. With -d/--descendants, defaults to the ontology of each code",
     )
     parser.add_argument(
         "-f",
         "--filepath",
         required=False,
         default="rich",
-        help="The output filename. Path from root. (Defaults to rich tables in std out",
+        help="The output filename. Path from root. (Defaults to rich tables in std out). Descendants are written as a value set file when it ends in .vset",
     )
     parser.add_argument(
         "-r",
@@ -480,8 +967,15 @@ def exec(args=None):
         action="store_true",
         help="Pull only the direct children for a code",
     )
+    parser.add_argument(
+        "-l",
+        "--local",
+        required=False,
+        action="store_true",
+        help="Use the local ontology index (see `dragon_search index`) instead of OLS for descendants/children",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(args)
 
     if args.filepath == "rich":
         # For this, if we are writing to a rich table, we will write the log to a file using the default stream handler
@@ -495,55 +989,32 @@ def exec(args=None):
             console_handler=RichHandler(rich_tracebacks=True),
         )
 
-    onto_data = ftd_ontology_lookup()
-    if args.all_keywords and (args.descendants or args.children):
-        args.all_keywords = args.all_keywords.lower().replace("snomedct", "snomed")
+    # Leave this run's metrics for the textfile collector, if configured
+    atexit.register(get_metrics().write_textfile)
+
     if args.ontologies and (args.descendants or args.children):
         args.ontologies = args.ontologies.lower().replace("snomedct", "snomed")
-    if args.descendants and not args.ontologies:
-        parser.error("-o/--ontologies is required when -d/--descendants is provided")
     if args.descendants and args.children:
         parser.error(
             "Cannot use -d/--descendants and -c/--children together. Can only use one at a time."
         )
     if args.descendants or args.children:
-        args.start_index = 0
-        iri_results = []
-
-        if not args.iri or args.parent_data:
-            search_results = run_search(
-                onto_data,
-                args.all_keywords,
-                [args.ontologies],
-                ["ols2"],
-                args.results_per_page,
-                args.start_index,
-            )
-            iri_results = search_results.get("results", [])
-        if args.iri:
-            iri = args.iri
-        else:
-            if not iri_results or len(iri_results) == 0:
-                print(
-                    f"Could not find IRI for {args.all_keywords}. Please try again in a few minutes to ensure this is not an issue with the API."
-                )
-                return
-            iri = iri_results[0].get("code_iri")
-
-        if args.parent_data and iri_results:
-            parent_data = iri_results[0]
-        else:
-            parent_data = None
+        if not args.all_keywords and not args.iri:
+            parser.error("-ak/--all_keywords or -i/--iri is required with -d/--descendants")
+        if args.iri and args.all_keywords and "|" in args.all_keywords:
+            parser.error("-i/--iri can only be given for a single code")
 
+        # Parents are resolved and expanded concurrently by desc_search
         desc_search(
             codes=args.all_keywords,
             ontologies=args.ontologies,
             filepath=args.filepath,
             results_per_page=args.results_per_page,
-            start_index=args.start_index,
-            iri=iri,
-            parent_data=parent_data,
+            start_index=0,
+            iri=args.iri,
+            parent_data=args.parent_data,
             children=args.children,
+            search_api="locald" if args.local else "olsd",
         )
     else:
         do_search(
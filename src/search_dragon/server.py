@@ -0,0 +1,393 @@
+"""
+Search server.
+
+Runs search-dragon as a resident process answering searches over a local
+HTTP/JSON interface, so callers such as Locutus don't pay for a new process,
+imports, the ontology lookup and cold connections and caches on every search.
+
+    dragon_search serve --port 8765 --workers 8
+
+Endpoints (all POST bodies are JSON):
+
+    GET  /health        {"status": "ok"}
+    GET  /metrics       Prometheus metrics (see search_dragon.metrics)
+    GET  /scoreboard    api health and history (see search_dragon.scoreboard)
+    POST /search        run_search for one keyword
+    POST /batch         run_search for many keywords, per api (like do_search)
+    POST /descendants   descendants or children of a term (like -d/-c)
+    POST /warm          populate the result cache (see search_dragon.warm)
+    POST /purge         forget cached empty results (see search_dragon.negative_cache)
+    POST /autocomplete  type-ahead completions (see search_dragon.autocomplete)
+
+Requests are handled by a bounded pool of worker threads. SIGINT/SIGTERM stop
+accepting connections and let in-flight requests finish before exiting.
+"""
+
+import argparse
+import json
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from rich.logging import RichHandler
+
+from search_dragon import logger as getlogger
+from search_dragon import search as dragon_search
+from search_dragon import autocomplete, warm
+from search_dragon.metrics import get_metrics
+from search_dragon.negative_cache import get_negative_cache
+from search_dragon.scoreboard import get_scoreboard
+from search_dragon.scheduler import BULK, INTERACTIVE, PRIORITIES, scheduling
+from search_dragon.support import ftd_ontology_lookup
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 8
+
+
+class RequestError(ValueError):
+    """A problem with the request made by the client (HTTP 400)."""
+
+
+def _require(body, field):
+    if body.get(field) in (None, "", []):
+        raise RequestError(f"'{field}' is required")
+    return body[field]
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    server_version = "search-dragon"
+
+    def log_message(self, format, *args):
+        getlogger().debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status, payload):
+        self.send_body(status, json.dumps(payload), "application/json")
+
+    def send_body(self, status, text, content_type):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except json.JSONDecodeError as e:
+            raise RequestError(f"Request body is not valid JSON: {e}")
+        if not isinstance(body, dict):
+            raise RequestError("Request body must be a JSON object")
+        return body
+
+    def do_GET(self):
+        self.dispatch(self.server.get_routes, read_body=False)
+
+    def do_POST(self):
+        self.dispatch(self.server.post_routes, read_body=True)
+
+    def dispatch(self, routes, read_body):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        route = routes.get(path)
+        if route is None:
+            self.send_json(404, {"error": f"No such endpoint: {path}"})
+            return
+        try:
+            body = self.read_json() if read_body else {}
+            payload = route(body)
+            if isinstance(payload, str):
+                self.send_body(200, payload, "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self.send_json(200, payload)
+        except RequestError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            getlogger().exception(f"Error handling {path}")
+            self.send_json(500, {"error": str(e)})
+
+
+class SearchServer(HTTPServer):
+    """
+    HTTP server handing each connection to a bounded worker pool. The
+    ontology lookup is loaded once; the result cache, api sessions and local
+    stores are module singletons and stay warm between requests.
+    """
+
+    def __init__(self, address, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="dragon-request"
+        )
+        # Batch items fan out here rather than on the request pool, so a
+        # batch can't starve itself of workers.
+        self.search_pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="dragon-search"
+        )
+        self.onto_data = ftd_ontology_lookup()
+        super().__init__(address, SearchRequestHandler)
+        self.get_routes = {
+            "/health": self.health,
+            "/metrics": self.metrics,
+            "/scoreboard": self.scoreboard,
+        }
+        self.post_routes = {
+            "/search": self.search,
+            "/batch": self.batch,
+            "/descendants": self.descendants,
+            "/warm": self.warm,
+            "/purge": self.purge,
+            "/autocomplete": self.autocomplete,
+        }
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.search_pool.shutdown(wait=True)
+
+    def health(self, body):
+        return {"status": "ok"}
+
+    def metrics(self, body):
+        return get_metrics().render()
+
+    def scoreboard(self, body):
+        return get_scoreboard().as_dict()
+
+    def run_search(self, body, keyword, search_api_list, priority=INTERACTIVE, job=None):
+        priority = body.get("priority") or priority
+        if priority not in PRIORITIES:
+            raise RequestError(f"'priority' must be one of {', '.join(PRIORITIES)}")
+        try:
+            with scheduling(priority, body.get("job") or job):
+                return dragon_search.run_search(
+                    self.onto_data,
+                    keyword,
+                    body.get("ontology_list") or [],
+                    search_api_list,
+                    body.get("results_per_page", 10),
+                    body.get("start_index", 0),
+                    prefetch=int(body.get("prefetch", 0)),
+                    fetch_all=bool(body.get("fetch_all")),
+                    max_results=body.get("max_results"),
+                    adaptive=bool(body.get("adaptive")),
+                )
+        except ValueError as e:
+            raise RequestError(str(e))
+
+    def search(self, body):
+        """
+        {"keyword": "lung", "ontology_list": ["mondo"], "search_api_list":
+        ["ols"], "results_per_page": 10, "start_index": 0, "prefetch": 1}
+
+        Searches are interactive unless the body has "priority": "bulk" (and
+        optionally a "job" name), see search_dragon.scheduler.
+        """
+        keyword = _require(body, "keyword")
+        search_api_list = body.get("search_api_list") or ["ols"]
+        return self.run_search(body, keyword, search_api_list)
+
+    def batch(self, body):
+        """
+        {"keywords": ["HP:0000873", "OMIM:616421"], "ontology_list": [...],
+        "search_api_list": ["ols", "ols2", "umls"], ...}
+
+        Returns {keyword: {api: response}}. A failed api is reported as
+        {"error": message} for that keyword.
+        """
+        keywords = _require(body, "keywords")
+        search_api_list = body.get("search_api_list") or ["ols", "ols2", "umls"]
+
+        # Batches are bulk work unless the body says otherwise, one job per
+        # batch so concurrent batches share the apis fairly
+        job = f"batch-{id(body)}"
+
+        def run(keyword, search_api):
+            try:
+                return self.run_search(body, keyword, [search_api], BULK, job)
+            except Exception as e:
+                return {"error": str(e)}
+
+        futures = {
+            (keyword, search_api): self.search_pool.submit(run, keyword, search_api)
+            for keyword in keywords
+            for search_api in search_api_list
+        }
+        annotations = {keyword: {} for keyword in keywords}
+        for (keyword, search_api), future in futures.items():
+            annotations[keyword][search_api] = future.result()
+        return annotations
+
+    def descendants(self, body):
+        """
+        {"ontology": "hp", "keyword": "HP:0000707"} or {"ontology": "hp",
+        "iri": "http://purl.obolibrary.org/obo/HP_0000707"}, with optional
+        "children": true to return only direct children and "local": true to
+        use the local ontology index.
+
+        {"keywords": ["HP:0000707", "MONDO:0005015"]} expands many parents,
+        each in the ontology of its prefix unless "ontologies" are given, and
+        returns each term once with the "parent_codes" it was found under.
+        """
+        local = bool(body.get("local"))
+        if "keywords" in body:
+            keywords = body["keywords"]
+            if not isinstance(keywords, list) or not keywords:
+                raise RequestError("'keywords' must be a non-empty list")
+            ontologies = body.get("ontologies")
+            if ontologies is not None:
+                ontologies = [o.lower().replace("snomedct", "snomed") for o in ontologies]
+            return dragon_search.expand_parents(
+                self.onto_data,
+                keywords,
+                ontologies,
+                children=bool(body.get("children")),
+                search_api="locald" if local else "olsd",
+            )
+
+        ontology = _require(body, "ontology").lower().replace("snomedct", "snomed")
+        iri = body.get("iri")
+        if not iri:
+            keyword = _require(body, "keyword")
+            parent = dragon_search.resolve_iri(
+                self.onto_data, keyword, ontology, "local" if local else "ols2"
+            )
+            if not parent:
+                raise RequestError(f"Could not find IRI for {keyword}")
+            iri = parent["code_iri"]
+
+        return dragon_search.run_search(
+            self.onto_data,
+            body.get("keyword") or iri,
+            ontology,
+            ["locald" if local else "olsd"],
+            0,
+            0,
+            iri,
+            descendants=True,
+            children=bool(body.get("children")),
+        )
+
+    def warm(self, body):
+        """
+        {"codes": ["HP:0000873"], "descendants": ["MONDO:0005015"],
+        "ontology_list": [...], "search_api_list": [...], "rate": 5}
+
+        Returns the warming report once every search has finished.
+        """
+        if not body.get("codes") and not body.get("descendants"):
+            raise RequestError("'codes' or 'descendants' is required")
+        return warm.warm_cache(
+            self.onto_data,
+            codes=body.get("codes") or [],
+            descendants=body.get("descendants") or [],
+            ontology_list=body.get("ontology_list"),
+            search_api_list=body.get("search_api_list"),
+            results_per_page=body.get("results_per_page", 10),
+            rate=float(body.get("rate", warm.DEFAULT_RATE)),
+        )
+
+    def purge(self, body):
+        """
+        {"ontologies": ["HP", "MONDO"], "search_api": "ols"}, both optional.
+        """
+        removed = get_negative_cache().purge(
+            body.get("ontologies"), body.get("search_api")
+        )
+        return {"purged": removed}
+
+    def autocomplete(self, body):
+        """
+        {"query": "seizu", "ontology_list": ["HP", "MONDO"], "limit": 10,
+        "search_api_list": ["ols"]}
+
+        ontology_list is in order of preference. search_api_list is only
+        searched when the autocomplete index has no match.
+        """
+        query = _require(body, "query")
+        return autocomplete.autocomplete(
+            self.onto_data,
+            query,
+            body.get("ontology_list"),
+            body.get("search_api_list"),
+            int(body.get("limit", autocomplete.DEFAULT_LIMIT)),
+        )
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=DEFAULT_WORKERS, warm_codes=None):
+    """
+    Run the server until SIGINT or SIGTERM. warm_codes are searched in the
+    background once the server is listening.
+    """
+    logger = getlogger()
+    server = SearchServer((host, port), workers=workers)
+
+    if warm_codes:
+        threading.Thread(
+            target=warm.warm_cache,
+            args=(server.onto_data, warm_codes),
+            name="dragon-warm",
+            daemon=True,
+        ).start()
+
+    def stop(signum, frame):
+        logger.info("Shutting down, waiting for in-flight requests")
+        # shutdown() blocks until serve_forever returns, so it can't be called
+        # from the thread running serve_forever.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    logger.info(f"Serving on http://{host}:{server.server_port} with {workers} workers")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        get_metrics().write_textfile()
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search serve",
+        description="Serve searches over a local HTTP/JSON interface.",
+    )
+    parser.add_argument("--host", required=False, default=DEFAULT_HOST)
+    parser.add_argument("--port", required=False, type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--workers",
+        required=False,
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="How many requests are handled concurrently",
+    )
+    parser.add_argument(
+        "--warm",
+        required=False,
+        default=None,
+        help="File of codes, one per line, to warm the result cache with at startup",
+    )
+    args = parser.parse_args(args)
+
+    getlogger(
+        "search",
+        loglevel="INFO",
+        console_handler=RichHandler(rich_tracebacks=True),
+    )
+    warm_codes = warm.read_codes(args.warm) if args.warm else None
+    serve(args.host, args.port, args.workers, warm_codes)
@@ -20,4 +20,27 @@ def ftd_ontology_lookup(csv_path=None):
         logger().error(f"An error was encountered when loading FTD Ontological Lookup data: {e}")
 
     return onto_data
-    
\ No newline at end of file
+    
+
+def prefix_aliases(csv_path=None):
+    """
+    Return the CURIE prefix aliases as a dictionary: alias=>{curie_style: prefix}
+
+    Each API expects a particular spelling of some prefixes (HP for OLS, HPO
+    for UMLS). An empty prefix means the prefix is dropped for that API.
+    """
+    if csv_path is None:
+        csv_path = _support_details / "prefix_aliases.csv"
+
+    aliases = {}
+    try:
+        with importlib_resources.as_file(csv_path) as path:
+            with open(path, 'rt') as infile:
+                lkup = DictReader(infile, delimiter=',', quotechar='"')
+                for row in lkup:
+                    alias = row.pop('alias').upper()
+                    aliases[alias] = row
+    except Exception as e:
+        logger().error(f"An error was encountered when loading the prefix aliases: {e}")
+
+    return aliases
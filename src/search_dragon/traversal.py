@@ -0,0 +1,116 @@
+"""
+Descendant traversal.
+
+Builds the descendants of a term breadth first: every level's nodes have
+their children looked up in a graph of known edges, the rest are fetched
+concurrently, and the fetched edges are added to the graph. Terms whose
+descendants are already known aren't expanded, their descendants are taken
+as they are. Terms flagged as having no children are not fetched. A term
+reached through several parents is returned once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from search_dragon import logger as getlogger
+
+DEFAULT_TRAVERSAL_WORKERS = 8
+
+
+class FetchLimitExceeded(Exception):
+    """A traversal would fetch the children of more nodes than allowed."""
+
+
+def breadth_first(
+    root,
+    fetch_children,
+    load_edges,
+    store_edges,
+    depth=None,
+    workers=DEFAULT_TRAVERSAL_WORKERS,
+    load_subtrees=None,
+    max_fetches=None,
+):
+    """
+    Collect the terms below root.
+
+    Args:
+        root (str): The IRI of the term to expand.
+        fetch_children (callable): iri => list of child terms from upstream.
+            Raises when the children couldn't be fetched.
+        load_edges (callable): list of iris => {iri: child terms} for those
+            whose children are known.
+        store_edges (callable): Takes {iri: child terms} fetched upstream.
+        depth (int, optional): How many levels to expand, 1 for the direct
+            children. Defaults to every level.
+        workers (int): Maximum children fetched at once.
+        load_subtrees (callable, optional): list of iris => {iri: terms below
+            it} for those whose descendants are known. Only used when every
+            level is expanded.
+        max_fetches (int, optional): Raise FetchLimitExceeded rather than
+            fetch the children of more nodes than this. The edges fetched
+            until then are stored.
+
+    Returns:
+        Tuple:
+            - terms (list): The terms below root, level by level.
+            - complete (bool): False when the children of a node couldn't
+              be fetched, so terms may be missing.
+    """
+    logger = getlogger()
+    terms = []
+    seen = {root}
+    level = [root]
+    complete = True
+    fetched = reused = 0
+    current_depth = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while level and (depth is None or current_depth < depth):
+            subtrees = load_subtrees(level) if load_subtrees and depth is None else {}
+            for iri in subtrees:
+                for term in subtrees[iri]:
+                    if term.get("iri") is not None and term["iri"] not in seen:
+                        seen.add(term["iri"])
+                        terms.append(term)
+            level = [iri for iri in level if iri not in subtrees]
+            reused += len(subtrees)
+
+            edges = load_edges(level)
+            reused += len(edges)
+            missing = [iri for iri in level if iri not in edges]
+            if max_fetches is not None and fetched + len(missing) > max_fetches:
+                raise FetchLimitExceeded(
+                    f"Traversing {root} takes more than {max_fetches} fetches"
+                )
+
+            new_edges = {}
+            futures = {iri: executor.submit(fetch_children, iri) for iri in missing}
+            for iri, future in futures.items():
+                try:
+                    new_edges[iri] = future.result()
+                except Exception as e:
+                    logger.warning(f"Couldn't fetch the children of {iri}: {e}")
+                    complete = False
+            fetched += len(missing)
+            store_edges(new_edges)
+            edges.update(new_edges)
+
+            next_level = []
+            for iri in level:
+                for term in edges.get(iri, []):
+                    child = term.get("iri")
+                    if child is None or child in seen:
+                        continue
+                    seen.add(child)
+                    terms.append(term)
+                    # Leaves are flagged, so their (empty) children aren't fetched
+                    if term.get("has_children", True):
+                        next_level.append(child)
+            level = next_level
+            current_depth += 1
+
+    logger.debug(
+        f"Traversed {len(terms)} terms below {root}: children of {fetched} nodes "
+        f"fetched, {reused} reused"
+    )
+    return terms, complete
@@ -0,0 +1,375 @@
+"""
+Local UMLS Metathesaurus Store
+
+Streams MRCONSO.RRF into a SQLite database indexed by source code (within a
+source vocabulary), CUI and normalized string, so UMLS lookups and bulk
+crosswalks can be done without a UTS key or network access.
+
+Build the store from the command line:
+
+    dragon_search umls_index 2024AA/META/MRCONSO.RRF --sabs SNOMEDCT_US,OMIM,HPO
+
+The location of the database defaults to the `SEARCH_DRAGON_UMLS_DB`
+environment variable, then to `~/.cache/search_dragon/umls.db`.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from search_dragon import logger as getlogger
+
+UMLS_DB_ENV = "SEARCH_DRAGON_UMLS_DB"
+DEFAULT_UMLS_DB = Path.home() / ".cache" / "search_dragon" / "umls.db"
+
+UTS_CONTENT_URL = "https://uts-ws.nlm.nih.gov/rest/content"
+
+# MRCONSO.RRF column positions
+MRCONSO_CUI = 0
+MRCONSO_LAT = 1
+MRCONSO_TS = 2
+MRCONSO_STT = 4
+MRCONSO_ISPREF = 6
+MRCONSO_SAB = 11
+MRCONSO_CODE = 13
+MRCONSO_STR = 14
+MRCONSO_SUPPRESS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conso (
+    id INTEGER PRIMARY KEY,
+    cui TEXT NOT NULL,
+    sab TEXT NOT NULL,
+    code TEXT NOT NULL,
+    str TEXT NOT NULL,
+    norm_str TEXT NOT NULL,
+    rank INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conso_code ON conso(code, sab);
+CREATE INDEX IF NOT EXISTS conso_cui ON conso(cui);
+CREATE INDEX IF NOT EXISTS conso_norm ON conso(norm_str);
+CREATE VIRTUAL TABLE IF NOT EXISTS conso_fts USING fts5(
+    norm_str, content='conso', content_rowid='id'
+);
+CREATE TABLE IF NOT EXISTS release (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+BATCH_SIZE = 10000
+
+# CURIE prefixes, as given or as rewritten with the umls column of the prefix
+# alias table, => the source vocabulary (SAB) of the code, and how MRCONSO
+# writes it
+CURIE_SOURCES = {
+    "HP": ("HPO", "HP:{}"),
+    "HPO": ("HPO", "HP:{}"),
+    "GO": ("GO", "GO:{}"),
+    "SNOMED": ("SNOMEDCT_US", "{}"),
+    "SNOMEDCT": ("SNOMEDCT_US", "{}"),
+    "SNOMEDCT_US": ("SNOMEDCT_US", "{}"),
+    "OMIM": ("OMIM", "{}"),
+    "MESH": ("MSH", "{}"),
+    "MSH": ("MSH", "{}"),
+    "NCIT": ("NCI", "{}"),
+    "NCI": ("NCI", "{}"),
+    "ICD10CM": ("ICD10CM", "{}"),
+    "LOINC": ("LNC", "{}"),
+    "LNC": ("LNC", "{}"),
+}
+
+_non_word = re.compile(r"[^\w]+")
+_cui = re.compile(r"C\d{7}")
+
+
+def normalize_string(value):
+    """Lowercase and collapse punctuation/whitespace for string matching."""
+    return " ".join(_non_word.sub(" ", value.lower()).split())
+
+
+def source_code(keywords):
+    """
+    The (SAB, code as in MRCONSO) of a CURIE, e.g. HPO:0001250 =>
+    ("HPO", "HP:0001250") and SNOMEDCT:91175000 => ("SNOMEDCT_US", "91175000"),
+    or None when keywords isn't a CURIE of a known source.
+    """
+    prefix, _, local = keywords.partition(":")
+    source = CURIE_SOURCES.get(prefix.upper()) if local else None
+    if source is None:
+        return None
+    sab, code = source
+    return sab, code.format(local)
+
+
+def atom_rank(fields):
+    """
+    Lower is more preferred. Used to choose the name reported for a code,
+    mirroring the preferred atom UTS reports.
+    """
+    rank = 0
+    if fields[MRCONSO_ISPREF] != "Y":
+        rank += 1
+    if fields[MRCONSO_STT] != "PF":
+        rank += 2
+    if fields[MRCONSO_TS] != "P":
+        rank += 4
+    return rank
+
+
+class UMLSLocalStore:
+    """
+    SQLite backed store of MRCONSO atoms.
+
+    A single connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.getenv(UMLS_DB_ENV) or DEFAULT_UMLS_DB
+        self.db_path = Path(db_path)
+        self.lock = threading.RLock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.db_path, check_same_thread=False
+            )
+            self._connection.row_factory = sqlite3.Row
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @property
+    def release(self):
+        row = self.connection.execute(
+            "SELECT value FROM release WHERE key = 'release'"
+        ).fetchone()
+        return row[0] if row else "current"
+
+    def ingest(self, path, sabs=None, languages=("ENG",), release=None, include_suppressed=False):
+        """
+        Stream the atoms of an MRCONSO.RRF file into the store, replacing
+        the atoms of the sabs loaded. Loading another release, or every
+        source vocabulary, replaces every atom in the store.
+
+        Args:
+            path (str): Path to MRCONSO.RRF.
+            sabs (list): Source vocabularies to keep. Defaults to all.
+            languages (list): Languages (LAT) to keep. Defaults to English.
+            release (str): The UMLS release (e.g. 2024AA), used in the uri of
+                each record. Taken from the path when it contains one.
+            include_suppressed (bool): Keep suppressible atoms.
+
+        Returns:
+            int: The number of atoms written.
+        """
+        logger = getlogger()
+        sabs = set(sabs) if sabs else None
+        languages = set(languages) if languages else None
+        if release is None:
+            match = re.search(r"\d{4}A[AB]", str(path))
+            release = match.group(0) if match else "current"
+
+        written = 0
+        with self.lock, self.connection as conn:
+            # The release is recorded for the whole store, so atoms of
+            # another release can't be kept alongside these
+            stored = conn.execute(
+                "SELECT value FROM release WHERE key = 'release'"
+            ).fetchone()
+            if sabs is None or (stored is not None and stored[0] != release):
+                conn.execute("DELETE FROM conso")
+            else:
+                placeholders = ",".join("?" for _ in sabs)
+                conn.execute(f"DELETE FROM conso WHERE sab IN ({placeholders})", list(sabs))
+            conn.execute(
+                "INSERT OR REPLACE INTO release(key, value) VALUES ('release', ?)",
+                (release,),
+            )
+            batch = []
+            with open(path, "rt", encoding="utf-8") as infile:
+                for line in infile:
+                    fields = line.rstrip("\n").split("|")
+                    if len(fields) <= MRCONSO_SUPPRESS:
+                        continue
+                    if sabs and fields[MRCONSO_SAB] not in sabs:
+                        continue
+                    if languages and fields[MRCONSO_LAT] not in languages:
+                        continue
+                    if fields[MRCONSO_SUPPRESS] != "N" and not include_suppressed:
+                        continue
+
+                    batch.append(
+                        (
+                            fields[MRCONSO_CUI],
+                            fields[MRCONSO_SAB],
+                            fields[MRCONSO_CODE],
+                            fields[MRCONSO_STR],
+                            normalize_string(fields[MRCONSO_STR]),
+                            atom_rank(fields),
+                        )
+                    )
+                    if len(batch) >= BATCH_SIZE:
+                        written += self._write_batch(conn, batch)
+                        batch = []
+            written += self._write_batch(conn, batch)
+            conn.execute("INSERT INTO conso_fts(conso_fts) VALUES ('rebuild')")
+
+        logger.info(f"Loaded {written} atoms from {path} (release {release})")
+        return written
+
+    def _write_batch(self, conn, batch):
+        conn.executemany(
+            "INSERT INTO conso(cui, sab, code, str, norm_str, rank) VALUES (?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        return len(batch)
+
+    def _sab_filter(self, sabs):
+        sabs = [s for s in sabs or [] if s]
+        if not sabs:
+            return "", []
+        placeholders = ",".join("?" for _ in sabs)
+        return f" AND c.sab IN ({placeholders})", sabs
+
+    def _query(self, where, args, sab_sql, sab_args, start_index, results_per_page, join=""):
+        # One record per source code, named by its most preferred atom.
+        # SQLite returns the bare columns from the row holding MIN(rank).
+        base = f"FROM conso c{join} WHERE {where}{sab_sql}"
+        rows = self.connection.execute(
+            f"SELECT c.sab, c.code, c.str, c.cui, MIN(c.rank) {base} "
+            "GROUP BY c.sab, c.code ORDER BY MIN(c.rank), c.sab, c.code LIMIT ? OFFSET ?",
+            args + sab_args + [results_per_page, start_index],
+        ).fetchall()
+        total = self.connection.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 {base} GROUP BY c.sab, c.code)",
+            args + sab_args,
+        ).fetchone()[0]
+        return rows, total
+
+    def search(self, keywords, sabs=None, start_index=0, results_per_page=25):
+        """
+        Search the store by source code, CUI, exact normalized string and
+        finally by words, returning the first of these to match. Codes may be
+        given as CURIEs (HP:0001250, SNOMEDCT:91175000), which are looked up
+        in their source vocabulary as MRCONSO writes them.
+
+        Returns:
+            Tuple:
+                - records (list): The requested page, shaped like the results
+                  of the UTS search endpoint with returnIdType=code.
+                - total_results (int): The number of matching codes.
+        """
+        keywords = keywords.strip()
+        sab_sql, sab_args = self._sab_filter(sabs)
+        normalized = normalize_string(keywords)
+
+        lookups = [("c.code = ?", [keywords], "")]
+        source = source_code(keywords)
+        if source is not None:
+            lookups.insert(0, ("c.sab = ? AND c.code = ?", list(source), ""))
+        if _cui.fullmatch(keywords):
+            lookups.append(("c.cui = ?", [keywords], ""))
+        if normalized:
+            lookups.append(("c.norm_str = ?", [normalized], ""))
+            match = " ".join(f'"{t}"' for t in normalized.split())
+            lookups.append(
+                (
+                    "conso_fts MATCH ?",
+                    [match],
+                    " JOIN conso_fts ON conso_fts.rowid = c.id",
+                )
+            )
+
+        release = self.release
+        with self.lock:
+            for where, args, join in lookups:
+                rows, total = self._query(
+                    where, args, sab_sql, sab_args, start_index, results_per_page, join
+                )
+                if total:
+                    return [self.row_to_record(row, release) for row in rows], total
+        return [], 0
+
+    def concepts(self, cui, sabs=None):
+        """Return every source code for a CUI, e.g. for crosswalks."""
+        sab_sql, sab_args = self._sab_filter(sabs)
+        release = self.release
+        with self.lock:
+            rows, _ = self._query("c.cui = ?", [cui], sab_sql, sab_args, 0, -1)
+        return [self.row_to_record(row, release) for row in rows]
+
+    def row_to_record(self, row, release):
+        return {
+            "ui": row["code"],
+            "rootSource": row["sab"],
+            "uri": f"{UTS_CONTENT_URL}/{release}/source/{row['sab']}/{row['code']}",
+            "name": row["str"],
+            "cui": row["cui"],
+        }
+
+
+_umls_store = None
+
+
+def get_umls_store(db_path=None):
+    """Establish a singleton store that can be reused by multiple components."""
+    global _umls_store
+    if _umls_store is None or (
+        db_path is not None and Path(db_path) != _umls_store.db_path
+    ):
+        _umls_store = UMLSLocalStore(db_path)
+    return _umls_store
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search umls_index",
+        description="Build the local UMLS store from an MRCONSO.RRF file.",
+    )
+    parser.add_argument("mrconso", help="Path to MRCONSO.RRF")
+    parser.add_argument(
+        "--db",
+        required=False,
+        default=None,
+        help=f"Path to the store database. Defaults to ${UMLS_DB_ENV} or {DEFAULT_UMLS_DB}",
+    )
+    parser.add_argument(
+        "--sabs",
+        required=False,
+        default=None,
+        help="Comma separated source vocabularies to load, e.g. SNOMEDCT_US,OMIM,HPO. Defaults to all",
+    )
+    parser.add_argument(
+        "--languages",
+        required=False,
+        default="ENG",
+        help="Comma separated languages (LAT) to load. Defaults to ENG",
+    )
+    parser.add_argument(
+        "--release",
+        required=False,
+        default=None,
+        help="The UMLS release, e.g. 2024AA. Taken from the path when omitted",
+    )
+    args = parser.parse_args(args)
+
+    getlogger("search")
+    store = get_umls_store(args.db)
+    store.ingest(
+        args.mrconso,
+        sabs=args.sabs.split(",") if args.sabs else None,
+        languages=args.languages.split(",") if args.languages else None,
+        release=args.release,
+    )
@@ -0,0 +1,236 @@
+"""
+Value set files.
+
+Services that use the same expanded value sets at every start can keep them
+in a compact binary file instead of searching again or parsing CSV. Loading
+one memory maps it: records are read from the mapped pages as they are used,
+with O(1) access by position and by code.
+
+Write the results of run_search, expand_parents or desc_search:
+
+    write_value_set("nervous_system.vset", expand_parents(onto_data, codes))
+    dragon_search -ak "HP:0000707|HP:0001250" -d -f nervous_system.vset
+
+and read them:
+
+    with ValueSet.load("nervous_system.vset") as value_set:
+        "HP:0001250" in value_set
+        value_set.get("HP:0001250")["display"]
+        value_set[10]["code_iri"]
+
+File format, little endian: the header "SDVSET\\x01\\x00", record count,
+field count and hash slot count (uint32 each); the end offsets of every
+field of every record in the string table (uint32, record by record, in
+FIELDS order); the code hash table (uint32 record number + 1 per slot, 0
+for empty, linear probing); then the string table of UTF-8 field values.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+
+MAGIC = b"SDVSET\x01\x00"
+HEADER = struct.Struct("<8sIII")
+FIELDS = ("code", "code_iri", "display", "system", "ontology_prefix")
+_field_numbers = {field: i for i, field in enumerate(FIELDS)}
+
+MAX_STRINGS = 2**32 - 1
+
+
+def _slot_hash(code):
+    # blake2b is stable between processes, unlike hash()
+    return int.from_bytes(
+        hashlib.blake2b(code.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "\n".join(str(v) for v in value)
+    return str(value)
+
+
+def _uint32s(buffer):
+    """A uint32 view of little endian data, copied only on big endian machines."""
+    if sys.byteorder == "little":
+        return buffer.cast("I")
+    values = array("I", buffer.tobytes())
+    values.byteswap()
+    return values
+
+
+def write_value_set(path, records):
+    """
+    Write records to a value set file, replacing it atomically.
+
+    Args:
+        path (str): The file to write.
+        records (list, dict or pyarrow.Table): Harmonized records, a
+            response from run_search or expand_parents, or a columnar batch
+            (see search_dragon.columnar).
+
+    Returns:
+        int: The number of records written.
+    """
+    if isinstance(records, dict):
+        records = records["batch"] if "batch" in records else records.get("results", [])
+    if hasattr(records, "column_names"):
+        records = list(zip(*(records.column(field).to_pylist() for field in FIELDS)))
+    else:
+        records = [tuple(record.get(field) for field in FIELDS) for record in records]
+
+    n_slots = 1
+    while n_slots < 2 * len(records):
+        n_slots <<= 1
+    slots = array("I", bytes(4 * n_slots))
+    mask = n_slots - 1
+
+    ends = array("I")
+    strings = bytearray()
+    for number, record in enumerate(records):
+        for value in record:
+            strings += _text(value).encode("utf-8")
+            if len(strings) > MAX_STRINGS:
+                raise ValueError("Value sets are limited to 4GB of text")
+            ends.append(len(strings))
+
+        # The first record of a code is the one found by code
+        code = _text(record[0])
+        slot = _slot_hash(code) & mask
+        while slots[slot]:
+            existing = slots[slot] - 1
+            start = ends[existing * len(FIELDS) - 1] if existing else 0
+            end = ends[existing * len(FIELDS)]
+            if strings[start:end] == code.encode("utf-8"):
+                break
+            slot = (slot + 1) & mask
+        else:
+            slots[slot] = number + 1
+
+    if sys.byteorder != "little":
+        ends.byteswap()
+        slots.byteswap()
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(HEADER.pack(MAGIC, len(records), len(FIELDS), n_slots))
+        outfile.write(ends.tobytes())
+        outfile.write(slots.tobytes())
+        outfile.write(strings)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class ValueSetRecord(Mapping):
+    """A record of a value set, decoding fields from the file when read."""
+
+    __slots__ = ("value_set", "number")
+
+    def __init__(self, value_set, number):
+        self.value_set = value_set
+        self.number = number
+
+    def __getitem__(self, field):
+        return self.value_set.field(self.number, _field_numbers[field])
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"ValueSetRecord({dict(self)!r})"
+
+
+class ValueSet:
+    """A memory mapped value set file written by write_value_set."""
+
+    def __init__(self, path, mapped):
+        self.path = Path(path)
+        self.mapped = mapped
+        if len(mapped) < HEADER.size:
+            mapped.close()
+            raise ValueError(f"{path} is not a value set")
+        magic, self.count, self.n_fields, self.n_slots = HEADER.unpack_from(mapped, 0)
+        ends_size = 4 * self.count * self.n_fields
+        strings_at = HEADER.size + ends_size + 4 * self.n_slots
+        if magic != MAGIC or self.n_fields != len(FIELDS) or len(mapped) < strings_at:
+            mapped.close()
+            raise ValueError(f"{path} is not a value set")
+        self.view = view = memoryview(mapped)
+        self.ends = _uint32s(view[HEADER.size : HEADER.size + ends_size])
+        self.slots = _uint32s(view[HEADER.size + ends_size : strings_at])
+        self.strings = view[strings_at:]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as infile:
+            mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(path, mapped)
+
+    def close(self):
+        # Views of the map have to be released before it can be closed
+        for view in (self.ends, self.slots, self.strings, self.view):
+            if isinstance(view, memoryview):
+                view.release()
+        self.mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _bytes(self, number, field_number):
+        position = number * self.n_fields + field_number
+        start = self.ends[position - 1] if position else 0
+        return self.strings[start : self.ends[position]]
+
+    def field(self, number, field_number):
+        return str(self._bytes(number, field_number), "utf-8")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, number):
+        if number < 0:
+            number += self.count
+        if not 0 <= number < self.count:
+            raise IndexError("value set record out of range")
+        return ValueSetRecord(self, number)
+
+    def __iter__(self):
+        for number in range(self.count):
+            yield ValueSetRecord(self, number)
+
+    def find(self, code):
+        """The number of the record of code, or None."""
+        if not self.count:
+            return None
+        encoded = code.encode("utf-8")
+        mask = self.n_slots - 1
+        slot = _slot_hash(code) & mask
+        while self.slots[slot]:
+            number = self.slots[slot] - 1
+            if self._bytes(number, 0) == encoded:
+                return number
+            slot = (slot + 1) & mask
+        return None
+
+    def __contains__(self, code):
+        return self.find(code) is not None
+
+    def get(self, code, default=None):
+        """The record of code, or default."""
+        number = self.find(code)
+        return default if number is None else ValueSetRecord(self, number)
@@ -0,0 +1,228 @@
+"""
+Cache warming.
+
+Runs the searches and descendant expansions for a list of known codes through
+the normal pipeline, at a controlled rate, so their results are in the result
+cache before users ask for them (e.g. after a deploy or cache flush).
+
+The result cache lives in the search server's memory, so the command sends
+the code lists to a running server (see `dragon_search serve`), which can
+also warm itself at startup with `dragon_search serve --warm codes.txt`.
+
+    dragon_search warm --codes codes.txt --descendants value_sets.txt --rate 5
+"""
+
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from search_dragon import logger as getlogger
+from search_dragon import search as dragon_search
+from search_dragon.cache import get_result_cache
+from search_dragon.normalize import descendant_ontology
+from search_dragon.scheduler import BULK, scheduling
+from search_dragon.support import ftd_ontology_lookup
+
+DEFAULT_SERVER = "http://127.0.0.1:8765"
+DEFAULT_SEARCH_APIS = ["ols", "ols2", "umls"]
+DEFAULT_ONTOLOGIES = ["HP", "HPO", "MONDO"]
+DEFAULT_RATE = 5.0  # requests per second
+DEFAULT_WORKERS = 4
+
+
+def read_codes(path):
+    """One code per line. Blank lines and lines starting with # are ignored."""
+    with open(path, "rt", encoding="utf-8") as infile:
+        return [
+            line.strip()
+            for line in infile
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+
+def warm_cache(
+    ontology_data,
+    codes=(),
+    descendants=(),
+    ontology_list=None,
+    search_api_list=None,
+    results_per_page=10,
+    rate=DEFAULT_RATE,
+    workers=DEFAULT_WORKERS,
+):
+    """
+    Populate the result cache.
+
+    Args:
+        ontology_data (dict): curie=>system lookup.
+        codes (list): Codes searched with each api in search_api_list.
+        descendants (list): Parent codes whose descendants are expanded.
+        ontology_list (list): Ontologies used for the code searches.
+        search_api_list (list): The apis used for the code searches.
+        results_per_page (int): The page size to warm, matching the callers.
+        rate (float): Maximum searches started per second.
+        workers (int): Maximum searches running at once.
+
+    Returns:
+        dict: searches, failed, entries_warmed and seconds.
+    """
+    logger = getlogger()
+    cache = get_result_cache()
+    ontology_list = ontology_list or DEFAULT_ONTOLOGIES
+    search_api_list = search_api_list or DEFAULT_SEARCH_APIS
+    entries_before = len(cache)
+    start = time.monotonic()
+
+    # Warming gives way to interactive searches
+    def search(code, search_api):
+        with scheduling(BULK, job="warm"):
+            dragon_search.run_search(
+                ontology_data, code, ontology_list, [search_api], results_per_page, 0
+            )
+
+    def expand(code):
+        with scheduling(BULK, job="warm"):
+            expand_descendants(code)
+
+    def expand_descendants(code):
+        ontology = descendant_ontology(code)
+        parent = dragon_search.resolve_iri(ontology_data, code, ontology)
+        if not parent:
+            raise ValueError(f"Could not find IRI for {code}")
+        dragon_search.run_search(
+            ontology_data,
+            code,
+            ontology,
+            ["olsd"],
+            0,
+            0,
+            parent["code_iri"],
+            descendants=True,
+        )
+
+    tasks = [(search, (code, api)) for code in codes for api in search_api_list]
+    tasks += [(expand, (code,)) for code in descendants]
+
+    interval = 1.0 / rate if rate else 0
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        next_start = time.monotonic()
+        for task, args in tasks:
+            delay = next_start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_start = max(next_start, time.monotonic()) + interval
+            futures.append((args, executor.submit(task, *args)))
+
+    failed = 0
+    for args, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Warming {args} failed: {e}")
+
+    report = {
+        "searches": len(tasks),
+        "failed": failed,
+        "entries_warmed": len(cache) - entries_before,
+        "seconds": round(time.monotonic() - start, 3),
+    }
+    logger.info(
+        f"Warmed {report['entries_warmed']} cache entries from {report['searches']} "
+        f"searches ({failed} failed) in {report['seconds']}s"
+    )
+    return report
+
+
+def exec(args=None):
+    parser = argparse.ArgumentParser(
+        prog="dragon_search warm",
+        description="Warm the result cache of a running search server with known codes.",
+    )
+    parser.add_argument(
+        "--codes",
+        required=False,
+        default=None,
+        help="File of codes to search, one per line",
+    )
+    parser.add_argument(
+        "--seed",
+        required=False,
+        default=None,
+        help="Additional codes to search. Delimeter |",
+    )
+    parser.add_argument(
+        "--descendants",
+        required=False,
+        default=None,
+        help="File of parent codes to expand descendants for, one per line",
+    )
+    parser.add_argument(
+        "-o",
+        "--ontologies",
+        required=False,
+        default=",".join(DEFAULT_ONTOLOGIES),
+        help="The ontology_prefixes to use in the code searches",
+    )
+    parser.add_argument(
+        "--all_ontologies",
+        required=False,
+        action="store_true",
+        help="Search every ontology in the FTD ontology lookup",
+    )
+    parser.add_argument(
+        "--search_apis",
+        required=False,
+        default=",".join(DEFAULT_SEARCH_APIS),
+        help="The apis to warm the code searches for",
+    )
+    parser.add_argument(
+        "--rate",
+        required=False,
+        type=float,
+        default=DEFAULT_RATE,
+        help="Maximum searches started per second",
+    )
+    parser.add_argument(
+        "--server",
+        required=False,
+        default=DEFAULT_SERVER,
+        help="The search server to warm",
+    )
+    args = parser.parse_args(args)
+
+    codes = read_codes(args.codes) if args.codes else []
+    if args.seed:
+        codes += [c.strip() for c in args.seed.split("|") if c.strip()]
+    descendants = read_codes(args.descendants) if args.descendants else []
+    if not codes and not descendants:
+        parser.error("Provide codes with --codes, --seed or --descendants")
+
+    if args.all_ontologies:
+        ontology_list = list(ftd_ontology_lookup())
+    else:
+        ontology_list = [o.strip() for o in args.ontologies.split(",")]
+
+    body = json.dumps(
+        {
+            "codes": codes,
+            "descendants": descendants,
+            "ontology_list": ontology_list,
+            "search_api_list": [a.strip() for a in args.search_apis.split(",")],
+            "rate": args.rate,
+        }
+    ).encode("utf-8")
+    request = urllib.request.Request(
+        f"{args.server.rstrip('/')}/warm",
+        data=body,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        report = json.load(response)
+    print(
+        f"Warmed {report['entries_warmed']} cache entries from {report['searches']} "
+        f"searches ({report['failed']} failed) in {report['seconds']}s"
+    )
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import pytest
+
+from search_dragon.local_store import get_local_store
+from search_dragon.support import ftd_ontology_lookup
+from search_dragon.umls_store import get_umls_store
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def fixtures():
+    return FIXTURES
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    """The shared local store, holding the terms of fixtures/dag.obo."""
+    store = get_local_store(tmp_path / "ontologies.db")
+    store.ingest(FIXTURES / "dag.obo")
+    store.build_closure()
+    yield store
+    store.close()
+
+
+@pytest.fixture(scope="session")
+def ontology_data():
+    return ftd_ontology_lookup()
+
+
+@pytest.fixture
+def umls_store(tmp_path):
+    """The shared UMLS store, holding the atoms of fixtures/MRCONSO.RRF."""
+    store = get_umls_store(tmp_path / "umls.db")
+    store.ingest(FIXTURES / "MRCONSO.RRF", release="2024AA")
+    yield store
+    store.close()
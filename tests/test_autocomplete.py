@@ -0,0 +1,73 @@
+import pytest
+
+from search_dragon.autocomplete import AutocompleteIndex
+
+
+def record(code, display, prefix):
+    return {
+        "code": code,
+        "code_iri": f"http://example.org/{code}",
+        "display": display,
+        "ontology_prefix": prefix,
+    }
+
+
+@pytest.fixture
+def index():
+    index = AutocompleteIndex()
+    index.add(record("HP:0001250", "Seizure", "HP"), synonyms=["Epileptic fit"])
+    index.add(record("HP:0002133", "Status epilepticus", "HP"))
+    index.add(record("MONDO:0005071", "Nervous system disorder", "MONDO"))
+    index.learn(
+        [
+            record("HP:0001298", "Encephalopathy", "HP"),
+            record("MONDO:0005275", "Lung disease", "MONDO"),
+            record("HP:0002088", "Abnormal lung morphology", "HP"),
+        ]
+    )
+    return index
+
+
+def displays(records):
+    return [r["display"] for r in records]
+
+
+def test_prefix_matching(index):
+    assert displays(index.complete("seiz")) == ["Seizure"]
+    assert displays(index.complete("nerv sys")) == ["Nervous system disorder"]
+    assert displays(index.complete("fit")) == ["Seizure"]
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("seizrue", "Seizure"),  # swapped letters
+        ("seizue", "Seizure"),  # a missing letter
+        ("encephalopathyy", "Encephalopathy"),  # an extra letter
+        ("lugn disease", "Lung disease"),
+        ("nervoas", "Nervous system disorder"),  # a wrong letter
+    ],
+)
+def test_typo_matching(index, query, expected):
+    assert displays(index.complete(query))[:1] == [expected]
+
+
+def test_short_words_are_not_corrected(index):
+    assert index.complete("lnu") == []
+
+
+def test_ranking(index):
+    # Labels starting with the query first, then the ontology_list order
+    assert displays(index.complete("lung")) == [
+        "Lung disease",
+        "Abnormal lung morphology",
+    ]
+    assert displays(index.complete("lung", ["HP", "MONDO"])) == [
+        "Abnormal lung morphology",
+        "Lung disease",
+    ]
+
+
+def test_terms_are_added_once(index):
+    assert not index.add(record("HP:0001250", "Seizure", "HP"))
+    assert len(index) == 6
@@ -0,0 +1,36 @@
+from search_dragon.code_filter import BloomFilter, CodeFilters, build_filters, group_codes
+
+CODES = [f"HP:{n:07d}" for n in range(1, 201)]
+
+
+def test_bloom_filter_round_trip(tmp_path):
+    bloom = BloomFilter.for_capacity(len(CODES), 0.01)
+    for code in CODES:
+        bloom.add(code)
+    bloom.write(tmp_path / "HP.bloom")
+
+    loaded = BloomFilter.load(tmp_path / "HP.bloom")
+    assert (loaded.n_bits, loaded.n_hashes, loaded.count) == (
+        bloom.n_bits,
+        bloom.n_hashes,
+        len(CODES),
+    )
+    assert all(code in loaded for code in CODES)
+    false_positives = sum(f"HP:{n:07d}" in loaded for n in range(1000, 3000))
+    assert false_positives < 100
+
+
+def test_code_filters_exclude_unknown_codes(tmp_path):
+    build_filters(group_codes(CODES + ["mondo:0000001"]), tmp_path)
+    filters = CodeFilters(tmp_path)
+    assert not filters.excludes("HP:0000001")
+    assert not filters.excludes("MONDO:0000001")
+    assert filters.excludes("HP:9999999") or filters.excludes("HP:9999998")
+    # No filter for the prefix, or not a code
+    assert not filters.excludes("NCIT:C1234")
+    assert not filters.excludes("lung disease")
+
+
+def test_corrupt_filters_are_ignored(tmp_path):
+    (tmp_path / "HP.bloom").write_bytes(b"not a filter at all")
+    assert CodeFilters(tmp_path).get("hp") is None
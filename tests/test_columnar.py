@@ -0,0 +1,29 @@
+import pytest
+
+from search_dragon.benchmark import ols_terms
+from search_dragon.external_apis.ols_descendants_api import OLSDescendantsAPI
+from search_dragon.result_structure import validate_data
+
+pytest.importorskip("pyarrow")
+
+
+def records(api, terms, ontology_data):
+    harmonized = api.clean_harmonized_data(api.harmonize_data(terms, ontology_data))
+    return validate_data(harmonized, descendants=True)
+
+
+def test_small_expansions_are_harmonized_as_records(ontology_data):
+    api = OLSDescendantsAPI()
+    terms = ols_terms(api.columnar_threshold - 1, seed=2)
+    assert api.harmonize_columnar(terms, ontology_data) is None
+
+
+def test_columns_match_records(ontology_data):
+    api = OLSDescendantsAPI()
+    api.columnar_threshold = 0
+    terms = ols_terms(500, seed=2)
+    table = api.harmonize_columnar(terms, ontology_data)
+    assert table.to_pylist() == [
+        {column: record[column] for column in table.column_names}
+        for record in records(api, terms, ontology_data)
+    ]
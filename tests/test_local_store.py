@@ -0,0 +1,60 @@
+from search_dragon import search
+from search_dragon.local_store import curie_to_iri
+
+
+def curies(records):
+    return [record["curie"] for record in records]
+
+
+def test_closure_keeps_ancestors_shared_through_siblings(local_store):
+    # HP:1 is_a HP:2 and HP:3, HP:3 is_a HP:2, HP:2 is_a HP:4
+    assert curies(local_store.descendants(curie_to_iri("HP:0000004"))) == [
+        "HP:0000001",
+        "HP:0000002",
+        "HP:0000003",
+    ]
+    assert local_store.is_descendant("HP:0000003", "HP:0000004")
+    assert local_store.is_descendant("HP:0000001", "HP:0000002")
+    assert not local_store.is_descendant("HP:0000002", "HP:0000003")
+
+
+def test_closure_survives_cycles(local_store):
+    local_store.write_terms(
+        [
+            {
+                "curie": "HP:0000004",
+                "label": "Disease",
+                "description": [],
+                "synonyms": [],
+                "parents": ["HP:0000001"],
+                "obsolete": False,
+            }
+        ]
+    )
+    local_store.build_closure()
+    assert local_store.is_descendant("HP:0000001", "HP:0000004")
+    assert local_store.is_descendant("HP:0000004", "HP:0000001")
+
+
+def test_children(local_store):
+    assert curies(local_store.children(curie_to_iri("HP:0000002"))) == [
+        "HP:0000001",
+        "HP:0000003",
+    ]
+
+
+def test_obsolete_terms_are_skipped(local_store):
+    assert "HP:0000005" not in local_store.curies()
+
+
+def test_search_by_code_and_text(local_store):
+    records, total = local_store.search("hp:0000003")
+    assert total == 1 and curies(records) == ["HP:0000003"]
+    records, _ = local_store.search("pulmonary")
+    assert curies(records) == ["HP:0000001"]
+
+
+def test_local_api_code_lookup(local_store, ontology_data):
+    response = search.run_search(ontology_data, "hp:0000003", [], ["local"], 10, 0)
+    assert [record["code"] for record in response["results"]] == ["HP:0000003"]
+    assert response["results"][0]["display"] == "Thoracic disease"
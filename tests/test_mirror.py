@@ -0,0 +1,73 @@
+from search_dragon.local_store import curie_to_iri
+from search_dragon.mirror import OntologyMirror
+
+
+def element(curie, label, parents=(), obsolete=False):
+    return {
+        "iri": curie_to_iri(curie),
+        "curie": curie,
+        "label": [label],
+        "definition": [],
+        "synonym": [],
+        "directParent": [curie_to_iri(p) for p in parents],
+        "isObsolete": obsolete,
+    }
+
+
+class StubOLS:
+    """Answers the ontology and class listing requests of a mirror."""
+
+    def __init__(self, elements, version):
+        self.elements = elements
+        self.version = version
+
+    def fetch_data(self, url):
+        if "/classes" not in url:
+            return {"config": {"preferredPrefix": "HP", "version": self.version}}
+        return {"elements": self.elements, "totalPages": 1, "totalElements": len(self.elements)}
+
+
+def mirror(store, elements, version):
+    ontology_mirror = OntologyMirror(store=store)
+    ontology_mirror.api = StubOLS(elements, version)
+    return ontology_mirror.mirror("hp")
+
+
+def test_mirror_replaces_the_previous_version(local_store):
+    root = curie_to_iri("HP:0000004")
+    assert len(local_store.descendants(root)) == 3
+
+    written = mirror(
+        local_store,
+        [
+            element("HP:0000004", "Disease"),
+            element("HP:0000002", "Respiratory disease", ["HP:0000004"]),
+            element("HP:0000003", "Thoracic disease", ["HP:0000002"], obsolete=True),
+            element("HP:0000006", "Airway disease", ["HP:0000002"]),
+        ],
+        "2024-06-01",
+    )
+
+    assert written == 3
+    assert sorted(local_store.curies()) == ["HP:0000002", "HP:0000004", "HP:0000006"]
+    assert [r["curie"] for r in local_store.descendants(root)] == [
+        "HP:0000002",
+        "HP:0000006",
+    ]
+    assert local_store.search("lung") == ([], 0)
+    assert local_store.ontology_info("hp")["version"] == "2024-06-01"
+
+
+def test_reindex_replaces_the_file_ontology(local_store, fixtures, tmp_path):
+    obo = tmp_path / "hp.obo"
+    obo.write_text(
+        (fixtures / "dag.obo")
+        .read_text()
+        .split("[Term]\nid: HP:0000003")[0]
+        .replace("is_a: HP:0000003 ! Thoracic disease\n", "")
+    )
+    local_store.ingest(obo)
+    local_store.build_closure()
+
+    assert sorted(local_store.curies()) == ["HP:0000001", "HP:0000002"]
+    assert local_store.search("thoracic") == ([], 0)
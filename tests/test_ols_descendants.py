@@ -0,0 +1,106 @@
+import urllib.parse
+
+import pytest
+
+from search_dragon import expansion_cache
+from search_dragon.external_apis.ols_descendants_api import OLSDescendantsAPI
+
+# A => B, C; B => B1..B6; C => C1; B1 => B1a
+TREE = {
+    "A": ["B", "C"],
+    "B": ["B1", "B2", "B3", "B4", "B5", "B6"],
+    "C": ["C1"],
+    "B1": ["B1a"],
+}
+
+
+def term(iri):
+    return {"iri": iri, "obo_id": f"HP:{iri}", "has_children": iri in TREE}
+
+
+def descendants(iri):
+    found = []
+    for child in TREE.get(iri, []):
+        found += [child] + descendants(child)
+    return found
+
+
+class StubOLS(OLSDescendantsAPI):
+    """OLS descendants with /children and /descendants served from TREE."""
+
+    def __init__(self):
+        super().__init__()
+        self.max_page_size = 2
+        self.urls = []
+
+    def data_version(self, ontology_list):
+        return "v1"
+
+    def fetch_data(self, url):
+        self.urls.append(url)
+        path, query = url.split("?")
+        _, _, iri, endpoint = path.rsplit("/", 3)
+        iri = urllib.parse.unquote(urllib.parse.unquote(iri))
+        query = urllib.parse.parse_qs(query)
+        page, size = int(query["page"][0]), int(query["size"][0])
+        iris = TREE.get(iri, []) if endpoint == "children" else descendants(iri)
+        return {
+            "_embedded": {"terms": [term(i) for i in iris[page * size : (page + 1) * size]]},
+            "page": {"totalPages": max(1, -(-len(iris) // size)), "totalElements": len(iris)},
+        }
+
+    def expand(self, iri, children=False):
+        self.urls = []
+        url = self.build_url(None, "hp", 0, 0, iri, children=children)
+        raw_data, _ = self.collect_data(url, 0, 0)
+        return sorted(t["iri"] for t in raw_data)
+
+    def endpoints(self):
+        return [url.split("?")[0].rsplit("/", 1)[1] for url in self.urls]
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = expansion_cache.ExpansionCache(tmp_path / "expansions.db")
+    monkeypatch.setattr(expansion_cache, "_expansion_cache", cache)
+    yield cache
+    cache.close()
+
+
+def test_cold_descendants_are_paged():
+    api = StubOLS()
+    assert api.expand("A") == sorted(descendants("A"))
+    assert set(api.endpoints()) == {"descendants"}
+    assert len(api.urls) == 5
+
+    # Then served from the expansion cache
+    assert api.expand("A") == sorted(descendants("A"))
+    assert api.urls == []
+
+
+def test_ancestor_of_an_expanded_subtree_reuses_it():
+    api = StubOLS()
+    api.expand("B")
+    assert api.expand("A", children=True) == ["B", "C"]
+
+    assert api.expand("A") == sorted(descendants("A"))
+    # The first page, then only the children of C, rather than 5 pages
+    assert api.endpoints() == ["descendants", "children"]
+
+
+def test_traversal_falls_back_to_pages_beyond_their_number():
+    api = StubOLS()
+    api.expand("A", children=True)
+    api.max_page_size = 4
+
+    assert api.expand("A") == sorted(descendants("A"))
+    # Traversing takes the children of B, C and B1, one more than the
+    # remaining 2 pages, which is found once B's (2 pages) and C's are fetched
+    assert api.endpoints() == [
+        "descendants",
+        "children",
+        "children",
+        "children",
+        "descendants",
+        "descendants",
+    ]
@@ -0,0 +1,33 @@
+import threading
+
+from search_dragon import search
+from search_dragon.cache import get_result_cache
+from search_dragon.external_apis.ols_api import OLSSearchAPI
+from search_dragon.scheduler import BULK
+
+
+class StubOLS(OLSSearchAPI):
+    """OLS with a canned page of results for every request."""
+
+    pages = []
+    done = threading.Event()
+
+    def collect_data(self, search_url, results_per_page, start_index):
+        self.requests_made += 1
+        StubOLS.pages.append((self, self.priority, int(start_index)))
+        if int(start_index) > 0:
+            StubOLS.done.set()
+        return [{"iri": f"http://purl.obolibrary.org/obo/HP_{start_index}"}], True
+
+
+def test_prefetch_runs_on_its_own_bulk_instance():
+    get_result_cache().clear()
+    api_instance = StubOLS()
+    search.fetch_results(api_instance, "prefetched", ["HP"], 0, 10)
+    search.prefetch_pages(api_instance, "prefetched", ["HP"], 0, 10)
+    assert StubOLS.done.wait(5)
+
+    (caller, _, _), (prefetcher, priority, start_index) = StubOLS.pages
+    assert caller is api_instance and prefetcher is not api_instance
+    assert priority == BULK and start_index == 10
+    assert api_instance.requests_made == 1
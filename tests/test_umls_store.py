@@ -0,0 +1,61 @@
+import pytest
+
+from search_dragon import search
+from search_dragon.umls_store import source_code
+
+
+def codes(response):
+    return [(record["ontology_prefix"], record["code"]) for record in response["results"]]
+
+
+@pytest.mark.parametrize(
+    "curie, expected",
+    [
+        ("HP:0001250", ("HPO", "HP:0001250")),
+        ("HPO:0001250", ("HPO", "HP:0001250")),
+        ("SNOMEDCT:91175000", ("SNOMEDCT_US", "91175000")),
+        ("MESH:D012640", ("MSH", "D012640")),
+        ("91175000", None),
+        ("seizure", None),
+    ],
+)
+def test_source_code(curie, expected):
+    assert source_code(curie) == expected
+
+
+def test_ingest_filters_languages_and_suppressed_atoms(umls_store):
+    sabs = {
+        row["sab"] for row in umls_store.connection.execute("SELECT sab FROM conso")
+    }
+    assert sabs == {"HPO", "SNOMEDCT_US", "MSH", "OMIM"}
+    assert umls_store.search("73211009") == ([], 0)
+
+
+def test_ingest_replaces_loaded_sources(umls_store, fixtures):
+    umls_store.ingest(fixtures / "MRCONSO.RRF", sabs=["HPO"], release="2024AA")
+    count = umls_store.connection.execute("SELECT COUNT(*) FROM conso").fetchone()[0]
+    assert count == 6
+
+
+@pytest.mark.parametrize(
+    "keyword, expected",
+    [
+        ("HP:0001250", ("HPO", "HP:0001250")),
+        ("SNOMEDCT:91175000", ("SNOMEDCT_US", "91175000")),
+        ("SNOMED:91175000", ("SNOMEDCT_US", "91175000")),
+        ("OMIM:606963", ("OMIM", "606963")),
+        ("91175000", ("SNOMEDCT_US", "91175000")),
+    ],
+)
+def test_code_lookup(umls_store, ontology_data, keyword, expected):
+    response = search.run_search(ontology_data, keyword, [], ["umls_local"], 10, 1)
+    assert codes(response) == [expected]
+
+
+def test_cui_and_text_lookup(umls_store, ontology_data):
+    response = search.run_search(ontology_data, "C0024117", [], ["umls_local"], 10, 1)
+    assert response["results_count"] == 2
+    response = search.run_search(
+        ontology_data, "obstructive lung", [], ["umls_local"], 10, 1
+    )
+    assert codes(response) == [("SNOMEDCT_US", "13645005")]
@@ -0,0 +1,56 @@
+import pytest
+
+from search_dragon.value_set import ValueSet, write_value_set
+
+RECORDS = [
+    {
+        "code": f"HP:{n:07d}",
+        "code_iri": f"http://purl.obolibrary.org/obo/HP_{n:07d}",
+        "display": f"Phenotype {n}",
+        "system": "https://hpo.jax.org/",
+        "ontology_prefix": "HP",
+    }
+    for n in range(1, 51)
+]
+
+
+def test_value_set_round_trip(tmp_path):
+    path = tmp_path / "phenotypes.vset"
+    assert write_value_set(path, {"results": RECORDS}) == len(RECORDS)
+
+    with ValueSet.load(path) as value_set:
+        assert len(value_set) == len(RECORDS)
+        assert [dict(record) for record in value_set] == RECORDS
+        assert dict(value_set[-1]) == RECORDS[-1]
+        assert value_set.get("HP:0000025")["display"] == "Phenotype 25"
+        assert "HP:0000050" in value_set
+        assert value_set.find("HP:0000051") is None
+        assert value_set.get("MONDO:0000001", "missing") == "missing"
+
+
+def test_value_set_keeps_the_first_record_of_a_code(tmp_path):
+    path = tmp_path / "duplicates.vset"
+    duplicate = dict(RECORDS[0], display="Another label", system=None)
+    write_value_set(path, [RECORDS[0], duplicate])
+    with ValueSet.load(path) as value_set:
+        assert len(value_set) == 2
+        assert value_set.get("HP:0000001")["display"] == "Phenotype 1"
+        assert value_set[1]["system"] == ""
+
+
+def test_columnar_value_set(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    path = tmp_path / "columnar.vset"
+    write_value_set(path, pa.Table.from_pylist(RECORDS))
+    with ValueSet.load(path) as value_set:
+        assert dict(value_set.get("HP:0000010")) == RECORDS[9]
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "other.vset"
+    path.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        ValueSet.load(path)
+    path.write_bytes(b"SDVSET")
+    with pytest.raises(ValueError):
+        ValueSet.load(path)